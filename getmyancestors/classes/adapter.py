@@ -0,0 +1,85 @@
+# global imports
+import time
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# number of threads downloading at the same time
+DEFAULT_WORKERS = 32
+# time in seconds after which an idle connection is closed instead of reused
+DEFAULT_KEEP_ALIVE = 30
+
+
+def socket_options():
+    """TCP keep-alive probes, so that idle connections are not silently
+    dropped by firewalls and NAT between two batches of requests
+    """
+    options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+    for name, value in (("TCP_KEEPIDLE", 15), ("TCP_KEEPINTVL", 5)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def pool_class(base, count, keep_alive):
+    """return a connection pool class counting new and reused connections,
+    and closing the connections idle for more than keep_alive seconds
+    """
+
+    class Pool(base):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            idle_since = getattr(conn, "idle_since", None)
+            if idle_since is not None and time.monotonic() - idle_since > keep_alive:
+                conn.close()
+            return conn
+
+        def _put_conn(self, conn):
+            if conn is not None:
+                conn.idle_since = time.monotonic()
+            super()._put_conn(conn)
+
+        def _make_request(self, conn, *args, **kwargs):
+            if count:
+                count("connections_new" if conn.sock is None else "connections_reused")
+            return super()._make_request(conn, *args, **kwargs)
+
+    return Pool
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTP adapter keeping one connection per worker thread alive,
+    instead of the 10 connections of the default adapter
+    :param workers: number of threads sending requests at the same time
+    :param max_connections: maximum number of connections kept per host
+    :param keep_alive: idle time in seconds before a connection is closed
+    :param count: a function called with the name of a connection counter
+    """
+
+    def __init__(
+        self,
+        workers=DEFAULT_WORKERS,
+        max_connections=None,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        count=None,
+    ):
+        self.keep_alive = keep_alive
+        self.count = count
+        super().__init__(pool_maxsize=max_connections or workers)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(
+            connections,
+            maxsize,
+            block,
+            socket_options=socket_options(),
+            **pool_kwargs
+        )
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": pool_class(HTTPConnectionPool, self.count, self.keep_alive),
+            "https": pool_class(HTTPSConnectionPool, self.count, self.keep_alive),
+        }
@@ -0,0 +1,313 @@
+# global imports
+import asyncio
+import base64
+import socket
+import ssl
+import time
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass_environment
+
+from requests.structures import CaseInsensitiveDict
+
+# local imports
+from getmyancestors.classes.decoding import (
+    ACCEPT_ENCODING,
+    DECODING_ERRORS,
+    decompress,
+    loads,
+)
+
+# the redirects followed by a request, as requests does
+MAX_REDIRECTS = 30
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class ProtocolError(ConnectionError):
+    """malformed or truncated response: an OSError, handled as the other
+    connection failures
+    """
+
+
+class Response:
+    """HTTP response, with the subset of the requests.Response API
+    used by Session.get_url
+    :param url: the requested URL
+    :param status_code: the HTTP status code
+    :param headers: a CaseInsensitiveDict of response headers
+    :param content: the decoded body as bytes
+    :param wire_bytes: the size of the body before decompression
+    """
+
+    def __init__(self, url, status_code, reason, headers, content, wire_bytes=0):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.wire_bytes = wire_bytes
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return loads(self.content)
+
+
+def proxy_authorization(proxy):
+    """return the Proxy-Authorization header of the credentials of a proxy
+    URL, or None
+    """
+    if proxy.username is None:
+        return None
+    credentials = "%s:%s" % (unquote(proxy.username), unquote(proxy.password or ""))
+    return "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+
+def close(writer):
+    """close a connection, even if its event loop is closed"""
+    try:
+        writer.close()
+    except RuntimeError:
+        # the transport cannot close without its loop: end the connection
+        try:
+            writer.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections on top of asyncio streams
+    :param limit: maximum number of idle connections kept per host
+    :param timeout: time before a request is abandoned
+    :param keep_alive: idle time in seconds before a connection is closed
+    :param count: a function called with the name of a connection counter
+    :param proxies: the proxy URLs by scheme, the HTTP_PROXY, HTTPS_PROXY
+                    and NO_PROXY environment variables by default
+    """
+
+    def __init__(self, limit=10, timeout=60, keep_alive=30, count=None, proxies=None):
+        self.limit = limit
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.count = count
+        self.proxies = getproxies() if proxies is None else proxies
+        self.idle = dict()
+        self.loop = None
+        self.ssl_context = ssl.create_default_context()
+
+    def _check_loop(self):
+        """connections are bound to the event loop that opened them"""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.close()
+
+    def close(self):
+        """close the idle connections"""
+        idle, self.idle = self.idle, dict()
+        for connections in idle.values():
+            for conn, _ in connections:
+                close(conn[1])
+
+    def proxy(self, scheme, host):
+        """return the split URL of the proxy of a host, or None"""
+        url = self.proxies.get(scheme)
+        if not url or proxy_bypass_environment(host, self.proxies):
+            return None
+        return urlsplit(url if "://" in url else "http://" + url)
+
+    async def _tunnel(self, proxy, host, port):
+        """return a socket connected to a host through an HTTP proxy
+        (CONNECT method), for a TLS connection
+        """
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(
+            proxy.hostname, proxy.port or 80, type=socket.SOCK_STREAM
+        )
+        family, kind, protocol, _, address = infos[0]
+        sock = socket.socket(family, kind, protocol)
+        sock.setblocking(False)
+        lines = ["CONNECT %s:%s HTTP/1.1" % (host, port), "Host: %s:%s" % (host, port)]
+        authorization = proxy_authorization(proxy)
+        if authorization:
+            lines.append("Proxy-Authorization: " + authorization)
+        try:
+            await loop.sock_connect(sock, address)
+            await loop.sock_sendall(sock, ("\r\n".join(lines) + "\r\n\r\n").encode())
+            response = b""
+            while b"\r\n\r\n" not in response:
+                data = await loop.sock_recv(sock, 4096)
+                if not data:
+                    raise ConnectionResetError("connection closed by the proxy")
+                response += data
+            status_line = response.split(b"\r\n", 1)[0].decode("latin-1")
+            if status_line.split(" ")[1:2] != ["200"]:
+                raise ConnectionRefusedError("proxy tunnel refused: " + status_line)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        idle = self.idle.get(key)
+        while idle:
+            conn, idle_since = idle.pop()
+            if time.monotonic() - idle_since <= self.keep_alive:
+                if self.count:
+                    self.count("connections_reused")
+                return conn, True
+            conn[1].close()
+        proxy = self.proxy(scheme, host)
+        if proxy is None:
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self.ssl_context if scheme == "https" else None
+            )
+        elif scheme == "https":
+            reader, writer = await asyncio.open_connection(
+                sock=await self._tunnel(proxy, host, port),
+                ssl=self.ssl_context,
+                server_hostname=host,
+            )
+        else:
+            reader, writer = await asyncio.open_connection(
+                proxy.hostname, proxy.port or 80
+            )
+        if self.count:
+            self.count("connections_new")
+        return (reader, writer), False
+
+    def _release(self, key, conn):
+        idle = self.idle.setdefault(key, [])
+        if len(idle) < self.limit:
+            idle.append((conn, time.monotonic()))
+        else:
+            conn[1].close()
+
+    async def request(self, method, url, headers=None, data=None, timeout=None):
+        """send a request and return a Response, following the redirects
+        (the response of the last one after MAX_REDIRECTS)
+        raise asyncio.TimeoutError or OSError on network failure, ProtocolError
+        on a malformed or truncated response
+        """
+        self._check_loop()
+        return await asyncio.wait_for(
+            self._follow(method, url, dict(headers or {}), data),
+            timeout or self.timeout,
+        )
+
+    async def _follow(self, method, url, headers, data):
+        for _ in range(MAX_REDIRECTS):
+            r = await self._request(method, url, headers, data)
+            if r.status_code not in REDIRECTS or "Location" not in r.headers:
+                break
+            location = urljoin(url, r.headers["Location"])
+            if r.status_code == 303 or r.status_code in (301, 302) and method == "POST":
+                method, data = "GET", None
+            if urlsplit(location).hostname != urlsplit(url).hostname:
+                # the credentials are not sent to another host
+                headers = {
+                    k: v for k, v in headers.items() if k.lower() != "authorization"
+                }
+            url = location
+        return r
+
+    async def _request(self, method, url, headers, data):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        body = data.encode("utf-8") if isinstance(data, str) else data or b""
+
+        proxy = self.proxy(scheme, parts.hostname)
+        if proxy and scheme == "http":
+            # the absolute URL is sent to the proxy
+            path = "http://%s%s" % (parts.netloc, path)
+        lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % parts.netloc]
+        sent = {"host"}
+        if proxy and scheme == "http" and proxy_authorization(proxy):
+            lines.append("Proxy-Authorization: " + proxy_authorization(proxy))
+        for name, value in headers.items():
+            lines.append("%s: %s" % (name, value))
+            sent.add(name.lower())
+        if "accept-encoding" not in sent:
+            lines.append("Accept-Encoding: " + ACCEPT_ENCODING)
+        if body or method == "POST":
+            lines.append("Content-Length: %s" % len(body))
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        while True:
+            (reader, writer), reused = await self._connect(key)
+            try:
+                writer.write(payload)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("connection closed by peer")
+            except OSError:
+                writer.close()
+                if reused:
+                    # the server closed an idle keep-alive connection
+                    continue
+                raise
+            break
+
+        try:
+            version, status, reason = (
+                status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""]
+            )[:3]
+            status = int(status)
+            res_headers = CaseInsensitiveDict()
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                name, value = name.strip(), value.strip()
+                if name in res_headers:
+                    value = res_headers[name] + ", " + value
+                res_headers[name] = value
+
+            keep_alive = (
+                version == "HTTP/1.1"
+                and res_headers.get("Connection", "").lower() != "close"
+            )
+            if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+                content = b""
+            elif "chunked" in res_headers.get("Transfer-Encoding", "").lower():
+                chunks = []
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    if not size:
+                        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                            pass
+                        break
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readline()
+                content = b"".join(chunks)
+            elif "Content-Length" in res_headers:
+                content = await reader.readexactly(int(res_headers["Content-Length"]))
+            else:
+                content = await reader.read()
+                keep_alive = False
+        except (EOFError, ValueError) as e:
+            # IncompleteReadError, invalid status, size or too long line
+            writer.close()
+            raise ProtocolError("invalid response: %s" % e) from e
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._release(key, (reader, writer))
+        else:
+            writer.close()
+
+        wire_bytes = len(content)
+        try:
+            content = decompress(content, res_headers.get("Content-Encoding"))
+        except DECODING_ERRORS as e:
+            raise ProtocolError("invalid content encoding: %s" % e) from e
+        return Response(url, status, reason, res_headers, content, wire_bytes)
@@ -0,0 +1,65 @@
+# global imports
+import threading
+
+# local imports
+from getmyancestors.classes.constants import MAX_PERSONS, MIN_PERSONS
+
+# the lists of a persons response counted by max_records
+RECORDS = ("persons", "places", "childAndParentsRelationships", "relationships")
+
+
+class BatchSizer:
+    """Size of the batches of the persons endpoint, adapted to the responses
+    The size grows slowly while the batches are fast and small, is reduced
+    in proportion when a batch is slower or larger than the targets, and
+    is halved when a batch fails (the failed batch is split in two).
+    :param min_size: the smallest batch
+    :param max_size: the largest batch, and the initial size
+    :param target_latency: the longest expected duration in seconds of a batch
+    :param max_records: the largest expected number of persons, places and
+                        relationships in a response
+    :param metrics: a Metrics object recording the batch sizes
+    """
+
+    def __init__(
+        self,
+        min_size=MIN_PERSONS,
+        max_size=MAX_PERSONS,
+        target_latency=5,
+        max_records=5000,
+        metrics=None,
+    ):
+        self.min_size = max(1, min(min_size, max_size))
+        self.max_size = max_size
+        self.size = max_size
+        self.target_latency = target_latency
+        self.max_records = max_records
+        self.metrics = metrics
+        self.lock = threading.Lock()
+
+    def split(self, fids):
+        """split a list in batches of nearly equal sizes,
+        so that the last batch is not much smaller than the others
+        """
+        n = len(fids)
+        count = -(-n // self.size)
+        return [fids[i * n // count : (i + 1) * n // count] for i in range(count)]
+
+    def success(self, size, latency, data):
+        """a batch of size items returned data in latency seconds"""
+        records = sum(len(data.get(key, ())) for key in RECORDS) if data else 0
+        ratio = max(latency / self.target_latency, records / self.max_records)
+        with self.lock:
+            if ratio > 1:
+                self.size = max(self.min_size, min(self.size, int(size / ratio)))
+            elif size >= self.size:
+                self.size = min(self.max_size, self.size + max(1, self.size // 10))
+        if self.metrics:
+            self.metrics.batch("persons", size, "ok")
+
+    def failure(self, size):
+        """a batch of size items failed or timed out"""
+        with self.lock:
+            self.size = max(self.min_size, min(self.size, size // 2))
+        if self.metrics:
+            self.metrics.batch("persons", size, "failed")
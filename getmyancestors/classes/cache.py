@@ -0,0 +1,172 @@
+# global imports
+import os
+import stat
+import time
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from diskcache import Cache
+
+# local imports
+from getmyancestors.classes.constants import CACHE_TTL, endpoint
+
+# a directory of the user: the responses hold living persons, and the
+# cache unpickles its entries
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "getmyancestors",
+)
+DEFAULT_CACHE_SIZE = 1024  # megabytes
+# time in seconds during which a stale response is kept for revalidation
+DEFAULT_CACHE_RETENTION = 30 * 24 * 3600
+
+
+def normalize_url(url):
+    """return a canonical form of an URL, where the order of the query
+    parameters and of the person ids does not matter
+    """
+    parts = urlsplit(url)
+    query = list()
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if key == "pids":
+            value = ",".join(sorted(set(value.split(","))))
+        query.append((key, value))
+    return parts._replace(query=urlencode(sorted(query), safe=","), fragment="").geturl()
+
+
+def person_slices(data):
+    """split the data of a persons request by person, as if each person
+    had been requested alone: yield (fid, data) with the places and
+    relationships of the person
+    """
+    places = {place["id"]: place for place in data.get("places", ())}
+    trios, couples = dict(), dict()
+    for rel in data.get("childAndParentsRelationships", ()):
+        for role in ("parent1", "parent2", "child"):
+            if role in rel:
+                trios.setdefault(rel[role]["resourceId"], []).append(rel)
+    for rel in data.get("relationships", ()):
+        for role in ("person1", "person2"):
+            couples.setdefault(rel[role]["resourceId"], []).append(rel)
+    for person in data.get("persons", ()):
+        fid = person["id"]
+        refs = dict.fromkeys(
+            fact["place"]["description"].lstrip("#")
+            for fact in person.get("facts", ())
+            if "description" in fact.get("place", {})
+        )
+        yield fid, {
+            "persons": [person],
+            "places": [places[ref] for ref in refs if ref in places],
+            "childAndParentsRelationships": trios.get(fid, []),
+            "relationships": couples.get(fid, []),
+        }
+
+
+def merge_persons(slices):
+    """return the data of a persons request made of the data of persons
+    requested alone
+    """
+    data = {
+        "persons": [],
+        "places": [],
+        "childAndParentsRelationships": [],
+        "relationships": [],
+    }
+    for piece in slices:
+        for key, values in data.items():
+            values.extend(piece.get(key, ()))
+    return data
+
+
+def make_private(directory):
+    """create a directory readable by its owner only, or make it so;
+    raise PermissionError if it belongs to another user
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError("%s belongs to another user" % directory)
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directory, 0o700)
+
+
+class ResponseCache:
+    """Persistent cache of FamilySearch API responses
+    A response is fresh during the TTL of its endpoint family, then it is
+    kept during the retention time if it has validators (ETag or
+    Last-Modified), so that it can be revalidated by a conditional request.
+    The persons requests are cached by person (see Session.cached_persons):
+    their batches change from a run to the next.
+    :param directory: the cache directory, made private to the user
+    :param size_limit: maximum size of the cache in bytes,
+                       the least recently stored responses are evicted first
+    :param ttl: time to live in seconds by endpoint family (see CACHE_TTL)
+    :param retention: time in seconds during which stale responses are kept
+    :param revalidate: True to revalidate even the fresh responses
+    """
+
+    version = 2
+
+    def __init__(
+        self,
+        directory=DEFAULT_CACHE_DIR,
+        size_limit=None,
+        ttl=None,
+        retention=DEFAULT_CACHE_RETENTION,
+        revalidate=False,
+    ):
+        self.directory = directory
+        make_private(directory)
+        self.cache = Cache(
+            directory, size_limit=size_limit or DEFAULT_CACHE_SIZE * 2**20
+        )
+        self.ttl = dict(CACHE_TTL, **(ttl or {}))
+        self.retention = retention
+        self.revalidate = revalidate
+
+    def key(self, account, url):
+        return "%s %s %s" % (self.version, (account or "").lower(), normalize_url(url))
+
+    def ttl_of(self, url):
+        """return the time to live of the response of an URL, 0 if not cached"""
+        parts = urlsplit(url)
+        return self.ttl.get(endpoint(parts.path + "?" + parts.query), 0)
+
+    def get(self, account, url):
+        """return the cached entry of an URL, or None
+        an entry is a dict with the response data, its validators
+        (etag, last_modified) and the end of its freshness (expires)
+        """
+        if not self.ttl_of(url):
+            return None
+        return self.cache.get(self.key(account, url))
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry["expires"] > time.time()
+
+    def set(self, account, url, data, etag=None, last_modified=None):
+        """store the response of an URL if its endpoint family is cached"""
+        ttl = self.ttl_of(url)
+        if ttl and data is not None:
+            entry = {
+                "data": data,
+                "etag": etag,
+                "last_modified": last_modified,
+                "expires": time.time() + ttl,
+            }
+            expire = max(ttl, self.retention) if etag or last_modified else ttl
+            self.cache.set(self.key(account, url), entry, expire=expire)
+
+    def close(self):
+        self.cache.close()
+
+
+def parse_ttl(string):
+    """parse a --cache-ttl value, ENDPOINT=SECONDS"""
+    name, _, seconds = string.partition("=")
+    if name not in CACHE_TTL or not seconds.isdigit():
+        raise ValueError(string)
+    return name, int(seconds)
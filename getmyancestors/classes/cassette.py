@@ -0,0 +1,144 @@
+# global imports
+import time
+import json
+import gzip
+import base64
+import atexit
+import asyncio
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+# local imports
+from getmyancestors.classes.asynchttp import Response
+from getmyancestors.classes.cache import normalize_url
+
+# response headers which do not describe the decoded body
+SKIPPED_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "keep-alive",
+    "set-cookie",
+    "transfer-encoding",
+}
+
+
+class Cassette:
+    """Record the API responses of a run in a file, or replay them
+    instead of sending requests to FamilySearch
+    The file is a gzipped JSON document per line: the URL path and query,
+    the status code, the headers, the decoded body and the duration of
+    each response.
+    :param path: the cassette file
+    :param mode: "record" or "replay"
+    :param latency: in replay mode, the time in seconds to wait before
+                    each response, or None to wait the recorded duration
+    """
+
+    version = 1
+
+    def __init__(self, path, mode="replay", latency=None):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.responses = defaultdict(list)
+        self.played = defaultdict(int)
+        self.file = None
+        if mode == "record":
+            self.file = gzip.open(path, "wt", encoding="utf-8")
+            self.file.write(json.dumps({"version": self.version}) + "\n")
+            atexit.register(self.close)
+        else:
+            self.load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(url):
+        """the recorded responses do not depend on the host"""
+        parts = urlsplit(normalize_url(url))
+        return parts.path + ("?" + parts.query if parts.query else "")
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    entry = json.loads(line)
+                    if "url" in entry:
+                        self.responses[entry["url"]].append(entry)
+            except EOFError:
+                # the recording run was interrupted
+                pass
+
+    def record(self, url, r, elapsed):
+        """record a response
+        :param r: a requests.Response or an asynchttp.Response
+        :param elapsed: the duration of the request in seconds
+        """
+        entry = {
+            "url": self.key(url),
+            "status": r.status_code,
+            "reason": r.reason,
+            "headers": {
+                k: v for k, v in r.headers.items() if k.lower() not in SKIPPED_HEADERS
+            },
+            "elapsed": round(elapsed, 4),
+        }
+        try:
+            entry["body"] = r.content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body64"] = base64.b64encode(r.content).decode("ascii")
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps(entry) + "\n")
+
+    def lookup(self, url):
+        """return the next recorded response of an URL, and the time to wait
+        the responses of an URL are replayed in the recorded order,
+        the last one is repeated
+        """
+        key = self.key(url)
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                headers = CaseInsensitiveDict()
+                return Response(url, 404, "Not Recorded", headers, b""), 0
+            entry = responses[min(self.played[key], len(responses) - 1)]
+            self.played[key] += 1
+        if "body64" in entry:
+            content = base64.b64decode(entry["body64"])
+        else:
+            content = entry["body"].encode("utf-8")
+        r = Response(
+            url,
+            entry["status"],
+            entry["reason"],
+            CaseInsensitiveDict(entry["headers"]),
+            content,
+            len(content),
+        )
+        return r, entry["elapsed"] if self.latency is None else self.latency
+
+    def play(self, url):
+        """replay the response of an URL"""
+        r, delay = self.lookup(url)
+        time.sleep(delay)
+        return r
+
+    async def play_async(self, url):
+        """replay the response of an URL without blocking the event loop"""
+        r, delay = self.lookup(url)
+        await asyncio.sleep(delay)
+        return r
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
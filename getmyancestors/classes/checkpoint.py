@@ -0,0 +1,195 @@
+# global imports
+import os
+import sys
+import time
+import pickle
+
+# GEDCOM classes numbered by a class counter
+NUMBERED = ("Indi", "Fam", "Note", "Source")
+
+
+class TreePickler(pickle.Pickler):
+    """pickle the objects of a tree without the tree itself
+    (it holds the session)
+    """
+
+    def __init__(self, file, tree):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.tree = tree
+
+    def persistent_id(self, obj):
+        return "tree" if obj is self.tree else None
+
+
+class TreeUnpickler(pickle.Unpickler):
+    """unpickle the objects of a tree, attached to another tree"""
+
+    def __init__(self, file, tree):
+        super().__init__(file)
+        self.tree = tree
+
+    def persistent_load(self, pid):
+        return self.tree
+
+
+class Checkpoint:
+    """Save the state of a download in a file, to resume it after a failure
+    The file holds the individuals, families, notes, sources, places and
+    relationships graph of the tree, the pending individuals (whose sources
+    and memories are downloaded again), the counters of the GEDCOM
+    identifiers, the finished phases and the progress of the current one:
+    its todo and done fids and the number of generations already downloaded.
+    The checkpoint of a finished download is a snapshot, from which a later
+    download is refreshed.
+    :param path: the checkpoint file, or None to disable the checkpoints
+    :param key: identify the download (starting individuals, options):
+                a checkpoint of another download is not resumed
+    :param interval: the minimum time in seconds between two saves
+                     during a phase
+    """
+
+    version = 4
+
+    def __init__(self, path, key=None, interval=60):
+        self.path = path
+        self.key = key
+        self.interval = interval
+        self.saved = time.monotonic()
+        self.finished = list()
+        self.phase = None
+        self.todo = self.done = set()
+        self.generation = 0
+
+    def numbered(self, tree):
+        module = sys.modules[type(tree).__module__]
+        return {
+            name: getattr(module, name) for name in NUMBERED if hasattr(module, name)
+        }
+
+    def save(self, tree):
+        """write the checkpoint file, replacing the previous one at once"""
+        if not self.path:
+            return
+        state = {
+            "version": self.version,
+            "key": self.key,
+            "finished": self.finished,
+            "phase": self.phase,
+            "todo": self.todo,
+            "done": self.done,
+            "generation": self.generation,
+            "counters": {
+                name: cls.counter for name, cls in self.numbered(tree).items()
+            },
+            "indi": tree.indi,
+            "fam": tree.fam,
+            "notes": tree.notes,
+            "sources": tree.sources,
+            "places": tree.places,
+            "graph": tree.graph,
+            "pending": tree.pending,
+        }
+        with open(self.path + ".tmp", "wb") as file:
+            TreePickler(file, tree).dump(state)
+        os.replace(self.path + ".tmp", self.path)
+        self.saved = time.monotonic()
+
+    def read(self, tree):
+        """return the state of the checkpoint file, or None"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                state = TreeUnpickler(file, tree).load()
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+            print("Unable to read %s: %s" % (self.path, repr(e)), file=sys.stderr)
+            return None
+        if state.get("version") != self.version:
+            print("%s is not a checkpoint" % self.path, file=sys.stderr)
+            return None
+        return state
+
+    def restore(self, tree, state):
+        """restore the tree and the progress of a checkpoint state"""
+        for name, cls in self.numbered(tree).items():
+            cls.counter = max(cls.counter, state["counters"].get(name, 0))
+        for name in ("indi", "fam", "notes", "sources", "places", "graph", "pending"):
+            setattr(tree, name, state[name])
+        self.finished = state["finished"]
+        self.phase = state["phase"]
+        self.todo, self.done = state["todo"], state["done"]
+        self.generation = state["generation"]
+
+    def resume(self, tree):
+        """restore the tree and the progress of the checkpoint file,
+        return False if there is no checkpoint of this download
+        """
+        state = self.read(tree)
+        if state is None:
+            return False
+        if state["key"] != self.key:
+            print(
+                "%s is the checkpoint of another download" % self.path,
+                file=sys.stderr,
+            )
+            return False
+        self.restore(tree, state)
+        return True
+
+    def load(self, tree):
+        """restore the tree of a snapshot: the checkpoint file of a finished
+        download, whatever its key; return False if there is none
+        """
+        state = self.read(tree)
+        if state is None:
+            return False
+        self.restore(tree, state)
+        return True
+
+    def start(self, phase, todo):
+        """start a phase, or continue it if it was interrupted
+        :return: the todo and done fids and the first generation
+        """
+        if not self.path:
+            # nothing to save: no copy of the fids
+            self.phase = phase
+            return set(todo), set(), 0
+        if phase != self.phase:
+            self.phase = phase
+            self.todo, self.done, self.generation = set(todo), set(), 0
+        return set(self.todo), set(self.done), self.generation
+
+    def update(self, tree, todo, done, generation):
+        """record the progress of the current phase,
+        and save it if the last save is older than interval
+        """
+        if not self.path:
+            return
+        self.todo, self.done, self.generation = set(todo), set(done), generation
+        self.tick(tree)
+
+    def tick(self, tree):
+        """save the tree if the last save is older than interval, with the
+        progress last recorded (the phases downloading without generations
+        resume from the individuals already in the tree)
+        """
+        if time.monotonic() - self.saved >= self.interval:
+            self.save(tree)
+
+    def finish(self, tree, phase):
+        """record a finished phase and save it"""
+        self.finished.append(phase)
+        self.phase = None
+        self.todo, self.done, self.generation = set(), set(), 0
+        self.save(tree)
+
+    def snapshot(self, tree, path):
+        """save the tree of a finished download in a snapshot file"""
+        snapshot = Checkpoint(path, self.key)
+        snapshot.finished = self.finished
+        snapshot.save(tree)
+
+    def remove(self):
+        """remove the checkpoint file of a finished download"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
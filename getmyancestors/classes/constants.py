@@ -1,7 +1,20 @@
 # getmyancestors constants
+import re
 
 # Subject to change: see https://www.familysearch.org/developers/docs/api/tree/Persons_resource
 MAX_PERSONS = 200
+# smallest batch of the adaptive batch size (see batching.BatchSizer)
+MIN_PERSONS = 10
+# maximum number of generations of an ancestry request
+MAX_ANCESTRY_GENERATIONS = 8
+# maximum number of generations of a descendancy request
+MAX_DESCENDANCY_GENERATIONS = 2
+# number of persons batches downloaded at the same time
+MAX_BATCHES = 4
+# number of sources and memories downloaded at the same time
+MAX_FETCHES = 16
+# number of objects of each table of a SqliteStore kept in memory
+STORE_CACHE = 10000
 
 FACT_TAGS = {
     "http://gedcomx.org/Birth": "BIRT",
@@ -44,6 +57,40 @@ ORDINANCES_STATUS = {
     "NotNeeded": "INFANT",
 }
 
+# API endpoint families, matched in order against the requested URL
+ENDPOINTS = (
+    ("persons", re.compile(r"/platform/tree/persons\?")),
+    ("ancestry", re.compile(r"/platform/tree/ancestry\?")),
+    ("descendancy", re.compile(r"/platform/tree/descendancy\?")),
+    ("notes", re.compile(r"/platform/tree/persons/[^/?]+/notes")),
+    ("sources", re.compile(r"/platform/tree/persons/[^/?]+/sources")),
+    ("person", re.compile(r"/platform/tree/persons/[^/?]+(\?|$)")),
+    ("couple-relationships", re.compile(r"/platform/tree/couple-relationships/")),
+    ("memories", re.compile(r"/platform/memories/memories/")),
+    ("users", re.compile(r"/platform/users/")),
+    ("ordinances", re.compile(r"/service/tree/tree-data/reservations/")),
+)
+
+# time to live in seconds of the cached API responses, by endpoint family
+CACHE_TTL = {
+    "persons": 24 * 3600,
+    "ancestry": 24 * 3600,
+    "descendancy": 24 * 3600,
+    "couple-relationships": 24 * 3600,
+    "notes": 24 * 3600,
+    "sources": 24 * 3600,
+    "memories": 7 * 24 * 3600,
+}
+
+
+def endpoint(url):
+    """return the endpoint family of an API URL, or "other" """
+    for name, regex in ENDPOINTS:
+        if regex.match(url):
+            return name
+    return "other"
+
+
 # mergemyancestors constants and functions
 def reversed_dict(d):
     return {val: key for key, val in d.items()}
@@ -0,0 +1,57 @@
+# global imports
+import json
+import zlib
+
+# optional faster JSON decoder and Brotli decompression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# compressions accepted from FamilySearch
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+# errors of a corrupted response body
+DECODING_ERRORS = (zlib.error, brotli.error) if brotli else (zlib.error,)
+
+
+def loads(content):
+    """decode a JSON document from the bytes of a response body,
+    with orjson if it is installed
+    """
+    if orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decompress(content, encoding):
+    """decode a response body according to its Content-Encoding"""
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    if encoding == "br" and brotli:
+        return brotli.decompress(content)
+    return content
+
+
+def wire_size(r):
+    """return the number of bytes of a response body on the wire,
+    before decompression
+    """
+    size = getattr(r, "wire_bytes", None)
+    if size is None and hasattr(r.raw, "tell"):
+        size = r.raw.tell()
+    if not size:
+        size = int(r.headers.get("Content-Length") or len(r.content))
+    return size
@@ -0,0 +1,190 @@
+# global imports
+from array import array
+
+# the end of a chain of rows
+END = -1
+
+
+class Ids:
+    """Intern FamilySearch ids as dense integers
+    The ids start at 1: 0 stands for a missing person (None).
+    """
+
+    def __init__(self):
+        self.index = dict()
+        self.fids = [None]
+
+    def __len__(self):
+        return len(self.fids)
+
+    def intern(self, fid):
+        """return the integer of a fid, interning it if it is new"""
+        if not fid:
+            return 0
+        i = self.index.get(fid)
+        if i is None:
+            i = self.index[fid] = len(self.fids)
+            self.fids.append(fid)
+        return i
+
+    def get(self, fid):
+        """return the integer of a fid, or None if it was never interned"""
+        return self.index.get(fid) if fid else 0
+
+
+class Links:
+    """Rows of interned ids, stored by column in arrays
+    The rows of an id in a column are chained: heads[column][id] is its
+    last row, and next[column][row] the previous row with the same id.
+    :param width: the number of columns
+    """
+
+    def __init__(self, width):
+        self.columns = tuple(array("i") for _ in range(width))
+        self.heads = tuple(array("i") for _ in range(width))
+        self.next = tuple(array("i") for _ in range(width))
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def rows(self, column, i):
+        """yield the rows with the id i in a column"""
+        heads, chain = self.heads[column], self.next[column]
+        row = heads[i] if 0 < i < len(heads) else END
+        while row != END:
+            yield row
+            row = chain[row]
+
+    def row(self, row):
+        """return the ids of a row"""
+        return tuple(column[row] for column in self.columns)
+
+    def find(self, ids):
+        """return the row of ids, or None"""
+        for c, i in enumerate(ids):
+            if i:
+                for row in self.rows(c, i):
+                    if self.row(row) == ids:
+                        return row
+                return None
+        return None
+
+    def add(self, ids):
+        """add a row of ids, unless it exists"""
+        if not any(ids) or self.find(ids) is not None:
+            return
+        row = len(self)
+        for column, heads, chain, i in zip(self.columns, self.heads, self.next, ids):
+            column.append(i)
+            if not i:
+                chain.append(END)
+                continue
+            if i >= len(heads):
+                # grow by half at least, to extend the array seldom
+                size = max(i + 1, len(heads) * 3 // 2)
+                heads.extend(array("i", [END]) * (size - len(heads)))
+            chain.append(heads[i])
+            heads[i] = row
+
+
+class Graph:
+    """Parent-child and couple relationships of a tree, stored once
+    as arrays of interned ids instead of tuples of fids in each individual
+    A trio (father, mother, child) is a childAndParents relationship,
+    a couple (person1, person2, relationship id) a couple relationship.
+    """
+
+    def __init__(self):
+        self.ids = Ids()
+        self.couple_ids = Ids()
+        self.trios = Links(3)
+        self.couples = Links(3)
+
+    def add_trio(self, father, mother, child):
+        """add a childAndParents relationship
+        :param father: the father fid or None
+        :param mother: the mother fid or None
+        :param child: the child fid or None
+        """
+        intern = self.ids.intern
+        self.trios.add((intern(father), intern(mother), intern(child)))
+
+    def add_couple(self, person1, person2, relfid):
+        """add a couple relationship"""
+        intern = self.ids.intern
+        self.couples.add(
+            (intern(person1), intern(person2), self.couple_ids.intern(relfid))
+        )
+
+    def add_relationships(self, data):
+        """add the relationships of a persons response"""
+        for rel in data.get("childAndParentsRelationships", ()):
+            self.add_trio(
+                rel["parent1"]["resourceId"] if "parent1" in rel else None,
+                rel["parent2"]["resourceId"] if "parent2" in rel else None,
+                rel["child"]["resourceId"] if "child" in rel else None,
+            )
+        for rel in data.get("relationships", ()):
+            if rel["type"] == "http://gedcomx.org/Couple":
+                self.add_couple(
+                    rel["person1"]["resourceId"],
+                    rel["person2"]["resourceId"],
+                    rel["id"],
+                )
+
+    def trio(self, row):
+        fids = self.ids.fids
+        return tuple(fids[i] for i in self.trios.row(row))
+
+    def parents(self, fid):
+        """yield the (father, mother) couples of the parents of a fid"""
+        fids = self.ids.fids
+        father, mother = self.trios.columns[:2]
+        for row in self.trios.rows(2, self.ids.get(fid) or 0):
+            yield fids[father[row]], fids[mother[row]]
+
+    def children(self, fid):
+        """yield the (father, mother, child) trios of the children of a fid"""
+        parent = self.ids.get(fid) or 0
+        for column in (0, 1):
+            for row in self.trios.rows(column, parent):
+                yield self.trio(row)
+
+    def spouses(self, fid):
+        """yield the (person1, person2, relationship id) couples of a fid"""
+        person = self.ids.get(fid) or 0
+        fids, relfids = self.ids.fids, self.couple_ids.fids
+        person1, person2, relfid = self.couples.columns
+        for column in (0, 1):
+            for row in self.couples.rows(column, person):
+                yield fids[person1[row]], fids[person2[row]], relfids[relfid[row]]
+
+    def parent_fids(self, fids):
+        """return the fids of the parents of several fids, walking the
+        chains of the child column in the arrays
+        """
+        father, mother = self.trios.columns[:2]
+        heads, chain = self.trios.heads[2], self.trios.next[2]
+        ids = set()
+        for child in filter(None, map(self.ids.get, fids)):
+            row = heads[child] if child < len(heads) else END
+            while row != END:
+                ids.add(father[row])
+                ids.add(mother[row])
+                row = chain[row]
+        ids.discard(0)
+        return {self.ids.fids[i] for i in ids}
+
+    def restricted(self, fids):
+        """return a graph of the relationships of some fids"""
+        graph = Graph()
+        ids = set(filter(None, map(self.ids.get, fids)))
+        for row in range(len(self.trios)):
+            if ids.intersection(self.trios.row(row)):
+                graph.add_trio(*self.trio(row))
+        fids_of, relfids = self.ids.fids, self.couple_ids.fids
+        for row in range(len(self.couples)):
+            person1, person2, relfid = self.couples.row(row)
+            if person1 in ids or person2 in ids:
+                graph.add_couple(fids_of[person1], fids_of[person2], relfids[relfid])
+        return graph
@@ -396,10 +396,13 @@ class Options(Frame):
 
 
 class Download(Frame):
-    """Main widget"""
+    """Main widget
+    :param session_options: keyword arguments of the Session
+    """
 
-    def __init__(self, master, **kwargs):
+    def __init__(self, master, session_options=None, **kwargs):
         super().__init__(master, borderwidth=20, **kwargs)
+        self.session_options = session_options or {}
         self.fs = None
         self.tree = None
         self.logfile = None
@@ -485,6 +488,7 @@ class Download(Frame):
             verbose=True,
             logfile=self.logfile,
             timeout=1,
+            **self.session_options,
         )
         if not self.fs.logged:
             messagebox.showinfo(
@@ -644,11 +648,13 @@ class Download(Frame):
 
 
 class FStoGEDCOM(Notebook):
-    """Main notebook"""
+    """Main notebook
+    :param session_options: keyword arguments of the Session
+    """
 
-    def __init__(self, master, **kwargs):
+    def __init__(self, master, session_options=None, **kwargs):
         super().__init__(master, width=400, **kwargs)
-        self.download = Download(self)
+        self.download = Download(self, session_options)
         self.merge = Merge(self)
         self.add(self.download, text=_("Download GEDCOM"))
         self.add(self.merge, text=_("Merge GEDCOMs"))
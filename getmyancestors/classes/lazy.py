@@ -0,0 +1,73 @@
+class PendingSet(set):
+    """Empty set returned by a LazySet attribute which was never set:
+    it is stored in the object by its first change, and freed otherwise
+    Only the mutators which can add items change it: the others (remove,
+    discard, pop, clear, intersection and difference updates) leave an
+    empty set empty.
+    """
+
+    __slots__ = ("owner", "slot")
+
+    def __init__(self, owner=None, slot=None):
+        super().__init__()
+        self.owner = owner
+        self.slot = slot
+
+    def attach(self):
+        if self.owner is not None:
+            setattr(self.owner, self.slot, self)
+            self.owner = None
+
+    def add(self, item):
+        self.attach()
+        super().add(item)
+
+    def update(self, *others):
+        self.attach()
+        super().update(*others)
+
+    def __ior__(self, other):
+        self.attach()
+        return super().__ior__(other)
+
+    def symmetric_difference_update(self, other):
+        self.attach()
+        super().symmetric_difference_update(other)
+
+    def __ixor__(self, other):
+        self.attach()
+        return super().__ixor__(other)
+
+    def __reduce__(self):
+        return set, (list(self),)
+
+
+class LazySet:
+    """Set attribute of a class with __slots__, created at its first change
+    The set is stored in the slot of the same name prefixed by "_": an
+    object holds no empty set, which saves about 200 bytes per attribute.
+    """
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot, None)
+        if value is None:
+            return PendingSet(obj, self.slot)
+        return value
+
+    def __set__(self, obj, value):
+        if isinstance(value, PendingSet) and value.owner is not None:
+            if value.owner is obj and value.slot == self.slot:
+                # the attribute itself after a change leaving it empty (-=)
+                return
+            # the empty set of another object
+            value.owner = None
+        setattr(obj, self.slot, value)
+
+    def __delete__(self, obj):
+        if hasattr(obj, self.slot):
+            delattr(obj, self.slot)
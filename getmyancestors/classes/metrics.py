@@ -0,0 +1,204 @@
+# global imports
+import json
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class EndpointMetrics:
+    """Request metrics of an endpoint family"""
+
+    def __init__(self):
+        self.requests = 0
+        self.status = Counter()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.retries = Counter()
+        self.bytes = Counter()
+        self.cache = Counter()
+        self.batches = Counter()
+
+    def to_dict(self):
+        buckets = dict()
+        total = 0
+        for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), self.latency_buckets):
+            total += n
+            buckets[str(bound)] = total
+        return {
+            "requests": self.requests,
+            "status": {str(k): v for k, v in sorted(self.status.items(), key=str)},
+            "latency": {"sum": round(self.latency_sum, 6), "buckets": buckets},
+            "retries": dict(self.retries),
+            "bytes": dict(self.bytes),
+            "cache": dict(self.cache),
+            "batches": {
+                outcome: {
+                    str(size): n
+                    for (o, size), n in sorted(self.batches.items())
+                    if o == outcome
+                }
+                for outcome in sorted({o for o, _ in self.batches})
+            },
+        }
+
+
+class Metrics:
+    """Thread-safe request metrics by endpoint family
+    (see constants.ENDPOINTS, plus "login")
+    """
+
+    def __init__(self):
+        self.endpoints = dict()
+        self.lock = threading.Lock()
+
+    def _endpoint(self, family):
+        if family not in self.endpoints:
+            self.endpoints[family] = EndpointMetrics()
+        return self.endpoints[family]
+
+    def request(self, family, status, latency, wire=0, decoded=0):
+        """record an HTTP request
+        :param status: the HTTP status code, or the error class
+                       of a request without response
+        :param latency: the duration of the request in seconds
+        :param wire: the size of the body on the wire
+        :param decoded: the size of the decompressed body
+        """
+        with self.lock:
+            metrics = self._endpoint(family)
+            metrics.requests += 1
+            metrics.status[status] += 1
+            metrics.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.latency_sum += latency
+            metrics.bytes["wire"] += wire
+            metrics.bytes["decoded"] += decoded
+
+    def retry(self, family, error):
+        """record a retry, by error class"""
+        with self.lock:
+            self._endpoint(family).retries[error] += 1
+
+    def cache(self, family, outcome):
+        """record a cache outcome: hit, revalidated, miss or coalesced"""
+        with self.lock:
+            self._endpoint(family).cache[outcome] += 1
+
+    def batch(self, family, size, outcome):
+        """record the size of a batch request: ok or failed (split)"""
+        with self.lock:
+            self._endpoint(family).batches[(outcome, size)] += 1
+
+    def to_dict(self, timing=None):
+        """return the metrics as a dict
+        :param timing: the duration in seconds of the phases of the run
+        """
+        with self.lock:
+            return {
+                "phases": dict(timing or {}),
+                "endpoints": {
+                    family: metrics.to_dict()
+                    for family, metrics in sorted(self.endpoints.items())
+                },
+            }
+
+    def to_prometheus(self, timing=None):
+        """return the metrics in the Prometheus text exposition format"""
+        data = self.to_dict(timing)
+        lines = list()
+
+        def metric(name, kind, text, samples):
+            lines.append("# HELP getmyancestors_%s %s" % (name, text))
+            lines.append("# TYPE getmyancestors_%s %s" % (name, kind))
+            for suffix, labels, value in samples:
+                labels = ",".join('%s="%s"' % item for item in labels)
+                lines.append(
+                    "getmyancestors_%s%s{%s} %s" % (name, suffix, labels, value)
+                )
+
+        endpoints = data["endpoints"].items()
+        metric(
+            "phase_seconds",
+            "gauge",
+            "Duration of the phases of the run.",
+            [("", [("phase", k)], v) for k, v in data["phases"].items()],
+        )
+        metric(
+            "requests_total",
+            "counter",
+            "HTTP requests by endpoint and status code or error.",
+            [
+                ("", [("endpoint", family), ("status", status)], n)
+                for family, m in endpoints
+                for status, n in m["status"].items()
+            ],
+        )
+        samples = list()
+        for family, m in endpoints:
+            for bound, n in m["latency"]["buckets"].items():
+                samples.append(("_bucket", [("endpoint", family), ("le", bound)], n))
+            samples.append(("_sum", [("endpoint", family)], m["latency"]["sum"]))
+            samples.append(("_count", [("endpoint", family)], m["requests"]))
+        metric(
+            "request_duration_seconds",
+            "histogram",
+            "Latency of the HTTP requests.",
+            samples,
+        )
+        metric(
+            "retries_total",
+            "counter",
+            "Retried requests by endpoint and error class.",
+            [
+                ("", [("endpoint", family), ("error", error)], n)
+                for family, m in endpoints
+                for error, n in m["retries"].items()
+            ],
+        )
+        metric(
+            "response_bytes_total",
+            "counter",
+            "Size of the response bodies, on the wire and decoded.",
+            [
+                ("", [("endpoint", family), ("kind", kind)], n)
+                for family, m in endpoints
+                for kind, n in m["bytes"].items()
+            ],
+        )
+        metric(
+            "cache_total",
+            "counter",
+            "Cache outcomes by endpoint.",
+            [
+                ("", [("endpoint", family), ("outcome", outcome)], n)
+                for family, m in endpoints
+                for outcome, n in m["cache"].items()
+            ],
+        )
+        metric(
+            "batches_total",
+            "counter",
+            "Batch requests by endpoint, outcome and number of items.",
+            [
+                ("", [("endpoint", family), ("outcome", outcome), ("size", size)], n)
+                for family, m in endpoints
+                for outcome, sizes in m["batches"].items()
+                for size, n in sizes.items()
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, timing=None, fmt=None):
+        """write the metrics in a file
+        :param fmt: "json" or "prometheus", guessed from the file extension
+                    if None (.prom or .txt for Prometheus)
+        """
+        if fmt is None:
+            fmt = "prometheus" if path.endswith((".prom", ".txt")) else "json"
+        with open(path, "w", encoding="utf-8") as file:
+            if fmt == "prometheus":
+                file.write(self.to_prometheus(timing))
+            else:
+                json.dump(self.to_dict(timing), file, indent=2)
@@ -0,0 +1,141 @@
+# local imports
+from getmyancestors.classes.constants import FACT_TAGS
+
+BIRTH_DEATH = frozenset(("http://gedcomx.org/Birth", "http://gedcomx.org/Death"))
+MARRIAGE = frozenset(("http://gedcomx.org/Marriage",))
+# the fact type of the life sketches, kept as notes
+LIFE_SKETCH = "http://familysearch.org/v1/LifeSketch"
+FACT_URIS = {tag: uri for uri, tag in FACT_TAGS.items()}
+
+
+class Projection:
+    """What a download keeps of the FamilySearch data: the fields left out
+    are neither downloaded nor parsed
+    :param facts: the fact types (URIs) of the individuals, or None for all
+    :param names: "preferred" for the preferred name only, or "all"
+    :param notes: the life sketches, the change messages of the names and
+                  facts, and the notes of the individuals (Tree.get_notes)
+    :param sources: the Wikipedia sources of the individuals
+                    (a download per individual)
+    :param memories: the text memories of the individuals
+                     (a download per memory)
+    :param places: the coordinates of the places of the facts
+    :param marriage: the fact types of the marriages, or None for all;
+                     without any, the marriages are not downloaded
+    """
+
+    fields = ("facts", "names", "notes", "sources", "memories", "places", "marriage")
+
+    def __init__(
+        self,
+        facts=BIRTH_DEATH,
+        names="preferred",
+        notes=False,
+        sources=False,
+        memories=False,
+        places=False,
+        marriage=MARRIAGE,
+    ):
+        if names not in ("preferred", "all"):
+            raise ValueError("names is preferred or all, not %s" % names)
+        self.facts = None if facts is None else frozenset(facts)
+        self.names = names
+        self.notes = notes
+        self.sources = sources
+        self.memories = memories
+        self.places = places
+        self.marriage = None if marriage is None else frozenset(marriage)
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+    def __eq__(self, other):
+        return isinstance(other, Projection) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __repr__(self):
+        def types(uris):
+            if uris is None:
+                return "all"
+            return "+".join(sorted(FACT_TAGS.get(uri, uri) for uri in uris)) or "none"
+
+        items = ["facts=" + types(self.facts), "names=" + self.names]
+        items += [
+            name if getattr(self, name) else "-" + name
+            for name in ("notes", "sources", "memories", "places")
+        ]
+        items.append("marriage=" + types(self.marriage))
+        return ",".join(items)
+
+    def replace(self, **changes):
+        """return a copy of the projection with other values of some fields"""
+        values = dict(zip(self.fields, self.values()))
+        values.update(changes)
+        return Projection(**values)
+
+    def fact(self, uri):
+        """tell if the facts of a type are kept"""
+        return self.facts is None or uri in self.facts
+
+    def marriage_fact(self, uri):
+        """tell if the marriage facts of a type are kept"""
+        return self.marriage is None or uri in self.marriage
+
+    def marriages(self):
+        """tell if the marriages are downloaded (for some of their facts)"""
+        return self.marriage is None or bool(self.marriage)
+
+    @staticmethod
+    def parse(spec):
+        """return the projection of a specification: items separated by
+        commas, applied in order to the essential projection, each one of
+        - a preset: full or essential
+        - a field to keep (notes, sources, memories, places)
+          or to leave out (-notes...)
+        - facts=<TYPES> or marriage=<TYPES>: GEDCOM tags or fact type URIs
+          separated by "+", all or none
+        - names=preferred or names=all
+        e.g. "essential,memories,facts=BIRT+DEAT+BURI"
+        """
+        projection = ESSENTIAL
+        for item in filter(None, (x.strip() for x in spec.split(","))):
+            name, sep, value = item.partition("=")
+            if item in PRESETS:
+                projection = PRESETS[item]
+            elif item.lstrip("-") in ("notes", "sources", "memories", "places"):
+                projection = projection.replace(**{item.lstrip("-"): item[0] != "-"})
+            elif sep and name in ("facts", "marriage"):
+                projection = projection.replace(**{name: parse_types(value)})
+            elif sep and name == "names":
+                projection = projection.replace(names=value)
+            else:
+                raise ValueError("unknown projection item: %s" % item)
+        return projection
+
+
+def parse_types(value):
+    """return the fact type URIs of GEDCOM tags or URIs separated by "+",
+    None for all
+    """
+    if value == "all":
+        return None
+    if value == "none":
+        return frozenset()
+    uris = set()
+    for item in value.split("+"):
+        if item.upper() in FACT_URIS:
+            uris.add(FACT_URIS[item.upper()])
+        elif "://" in item:
+            uris.add(item)
+        else:
+            raise ValueError("unknown fact type: %s" % item)
+    return frozenset(uris)
+
+
+# the data kept by getmyancestors_fast
+ESSENTIAL = Projection()
+# the data kept by getmyancestors
+FULL = Projection(notes=True, memories=True, places=True)
+PRESETS = {"essential": ESSENTIAL, "full": FULL}
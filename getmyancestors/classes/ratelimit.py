@@ -0,0 +1,114 @@
+# global imports
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value):
+    """return the delay in seconds of a Retry-After header, or None"""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket shared by all the requests of a run
+    The rate is halved each time the server throttles us (HTTP 429) and
+    increases slowly again with each successful request, so that it stays
+    close to the highest rate accepted by the server.
+    :param max_rate: maximum number of requests per second
+    :param min_rate: minimum number of requests per second
+    :param burst: number of requests which can be sent at once
+    """
+
+    def __init__(self, max_rate=50, min_rate=0.5, burst=None):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst or max(1, max_rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """take a token, return the time to wait before sending the request"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.paused_until - now)
+
+    def success(self):
+        """a request succeeded: increase the rate"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def throttled(self, retry_after=None):
+        """the server throttled a request: decrease the rate
+        and pause all the requests during retry_after seconds
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + retry_after
+                )
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter by error class, and a retry budget
+    shared by all the requests of a run
+    :param max_retries: maximum number of retries of a request
+    :param budget_ratio: number of retries earned by each request
+    :param min_budget: number of retries available from the start
+    :param cap: maximum delay in seconds between two attempts
+    """
+
+    # base delay in seconds by error class
+    BASE_DELAY = {
+        "timeout": 1,
+        "connection": 2,
+        "server": 2,
+        "throttle": 5,
+    }
+
+    def __init__(self, max_retries=8, budget_ratio=0.2, min_budget=20, cap=60):
+        self.max_retries = max_retries
+        self.budget_ratio = budget_ratio
+        self.budget = min_budget
+        self.cap = cap
+        self.lock = threading.Lock()
+
+    def request(self):
+        """a new request earns a part of a retry"""
+        with self.lock:
+            self.budget += self.budget_ratio
+
+    def delay(self, error, attempt, retry_after=None):
+        """return the time to wait before the next attempt,
+        or None if the request should not be retried
+        :param error: the error class, a key of BASE_DELAY
+        :param attempt: the number of retries already done
+        :param retry_after: the delay requested by the server
+        """
+        with self.lock:
+            if attempt >= self.max_retries or self.budget < 1:
+                return None
+            self.budget -= 1
+        delay = min(self.cap, self.BASE_DELAY[error] * 2**attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
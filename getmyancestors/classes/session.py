@@ -1,25 +1,235 @@
 # global imports
 import sys
 import time
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
 from urllib.parse import urlparse, parse_qs
+from urllib.request import getproxies
 import webbrowser
 
 import requests
+from requests.cookies import get_cookie_header
 from fake_useragent import UserAgent
 
 # local imports
+from getmyancestors.classes.adapter import (
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_WORKERS,
+    KeepAliveAdapter,
+)
+from getmyancestors.classes.asynchttp import ConnectionPool
+from getmyancestors.classes.cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_SIZE,
+    ResponseCache,
+    merge_persons,
+    normalize_url,
+    parse_ttl,
+    person_slices,
+)
+from getmyancestors.classes.cassette import Cassette
+from getmyancestors.classes.constants import endpoint
+from getmyancestors.classes.decoding import ACCEPT_ENCODING, loads, wire_size
+from getmyancestors.classes.metrics import Metrics
+from getmyancestors.classes.ratelimit import (
+    RateLimiter,
+    RetryPolicy,
+    parse_retry_after,
+)
+from getmyancestors.classes.token import DEFAULT_TOKEN_DIR, TokenStore
 from getmyancestors.classes.translation import translations
 
 DEFAULT_CLIENT_ID = "a02j000000KTRjpAAH"
 DEFAULT_REDIRECT_URI = "https://misbach.github.io/fs-auth/index_raw.html"
 
+# outcomes of Session.check_response
+DONE, RETRY, LOGIN = range(3)
+# errors of a fail_fast request which are not retried
+SPLIT_ERRORS = {"timeout", "connection", "server"}
+# the persons requests, followed by the fids
+PERSONS_URL = "/platform/tree/persons?pids="
+# result of a conditional request whose resource did not change
+NOT_MODIFIED = "not modified"
+# request headers with which the response cache does not answer a request:
+# its own validators (a conditional request) or cache directives
+UNCACHED = {"if-modified-since", "if-none-match", "cache-control"}
+
+
+class RequestFailed(Exception):
+    """a fail_fast get_url request failed, the error class is its argument"""
+
+
+def add_session_arguments(parser):
+    """add the Session options shared by the command line tools"""
+    parser.add_argument(
+        "--cache-dir",
+        metavar="<DIR>",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the API response cache [%s]" % DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Always download, do not use the API response cache [False]",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="<INT>",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Maximum size of the API response cache in MB [%s]"
+        % DEFAULT_CACHE_SIZE,
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="<ENDPOINT=SECONDS>",
+        nargs="+",
+        type=parse_ttl,
+        default=[],
+        help="Time to live of the cached responses of an endpoint "
+        "(persons, ancestry, descendancy, couple-relationships, notes, "
+        "sources or memories)",
+    )
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        default=False,
+        help="Check with FamilySearch that fresh cached responses "
+        "are still valid [False]",
+    )
+    parser.add_argument(
+        "--max-rate",
+        metavar="<FLOAT>",
+        type=float,
+        default=50,
+        help="Maximum number of requests per second [50]",
+    )
+    parser.add_argument(
+        "--max-retries",
+        metavar="<INT>",
+        type=int,
+        default=8,
+        help="Maximum number of retries of a request [8]",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<INT>",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of threads downloading at the same time [%s]"
+        % DEFAULT_WORKERS,
+    )
+    parser.add_argument(
+        "--max-connections",
+        metavar="<INT>",
+        type=int,
+        default=0,
+        help="Maximum number of connections kept open per host "
+        "[0: one per worker]",
+    )
+    parser.add_argument(
+        "--keep-alive",
+        metavar="<SECONDS>",
+        type=float,
+        default=DEFAULT_KEEP_ALIVE,
+        help="Time after which an idle connection is closed [%s]"
+        % DEFAULT_KEEP_ALIVE,
+    )
+    parser.add_argument(
+        "--record",
+        metavar="<FILE>",
+        type=str,
+        help="Record the API responses in the cassette <FILE>",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="<FILE>",
+        type=str,
+        help="Replay the API responses of the cassette <FILE>, "
+        "without FamilySearch",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        metavar="<SECONDS>",
+        type=float,
+        help="Time to wait before each replayed response [recorded time]",
+    )
+    parser.add_argument(
+        "--base-url",
+        metavar="<URL>",
+        type=str,
+        help="Send all the requests to a FamilySearch stand-in "
+        "(see fsserver) instead of FamilySearch",
+    )
+    parser.add_argument(
+        "--token-dir",
+        metavar="<DIR>",
+        type=str,
+        default=DEFAULT_TOKEN_DIR,
+        help="Directory where the access token is saved between runs [%s]"
+        % DEFAULT_TOKEN_DIR,
+    )
+    parser.add_argument(
+        "--no-save-token",
+        action="store_true",
+        default=False,
+        help="Log in at each run, do not save the access token [False]",
+    )
+
+
+def session_options(args):
+    """return the Session keyword arguments for the parsed command line"""
+    cache = cassette = None
+    if args.record:
+        cassette = Cassette(args.record, "record")
+    elif args.replay:
+        cassette = Cassette(args.replay, "replay", args.replay_latency)
+    # a cached response would be neither recorded nor replayed
+    if not args.no_cache and not cassette:
+        try:
+            cache = ResponseCache(
+                args.cache_dir,
+                args.cache_size * 2**20,
+                dict(args.cache_ttl),
+                revalidate=args.revalidate,
+            )
+        except PermissionError as e:
+            sys.exit("Unable to use the cache: %s (see --cache-dir)" % e)
+    return {
+        "cache": cache,
+        "limiter": RateLimiter(args.max_rate),
+        "retry_policy": RetryPolicy(args.max_retries),
+        "token_store": None if args.no_save_token else TokenStore(args.token_dir),
+        "workers": args.workers,
+        "max_connections": args.max_connections,
+        "keep_alive": args.keep_alive,
+        "cassette": cassette,
+        "base_url": args.base_url,
+    }
+
 
 class Session(requests.Session):
     """Create a FamilySearch session
     :param username and password: valid FamilySearch credentials
     :param verbose: True to active verbose mode
     :param logfile: a file object or similar
-    :param timeout: time before retry a request
+    :param timeout: time before a request is abandoned and retried
+    :param cache: a ResponseCache object, or None to always download
+    :param limiter: a RateLimiter shared by all the requests
+    :param retry_policy: a RetryPolicy shared by all the requests
+    :param token_store: a TokenStore to reuse the access token between runs
+    :param workers: number of threads downloading at the same time
+    :param max_connections: maximum number of connections kept per host,
+                            one per worker by default
+    :param keep_alive: idle time in seconds before a connection is closed
+    :param cassette: a Cassette to record the API responses,
+                     or to replay them without login
+    :param base_url: the URL of a FamilySearch stand-in (see fsserver),
+                     replacing all the FamilySearch hosts
     """
 
     def __init__(
@@ -31,6 +241,15 @@ class Session(requests.Session):
         verbose=False,
         logfile=False,
         timeout=60,
+        cache=None,
+        limiter=None,
+        retry_policy=None,
+        token_store=None,
+        workers=DEFAULT_WORKERS,
+        max_connections=None,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        cassette=None,
+        base_url=None,
     ):
         super().__init__()
         self.username = username
@@ -40,15 +259,54 @@ class Session(requests.Session):
         self.verbose = verbose
         self.logfile = logfile
         self.timeout = timeout
+        self.cache = cache
+        self.limiter = limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.token_store = token_store
+        self.cassette = cassette
+        self.base_url = base_url.rstrip("/") if base_url else None
         self.fid = self.lang = self.display_name = None
-        self.counter = 0
-        self.headers = {"User-Agent": UserAgent().firefox}
-        self.login()
+        self.stats = Counter()
+        # the URLs of the requests given up after the retries
+        self.abandoned = set()
+        self.metrics = Metrics()
+        self.stats_lock = threading.Lock()
+        self.inflight = dict()
+        self.inflight_lock = threading.Lock()
+        self.token_generation = 0
+        self.login_lock = threading.RLock()
+        self.login_hooks = {"response": self.record_login}
+        self.workers = workers
+        self.max_connections = max_connections or workers
+        self.keep_alive = keep_alive
+        adapter = KeepAliveAdapter(workers, max_connections, keep_alive, self.count)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers = {
+            "User-Agent": UserAgent().firefox,
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
+        if self.replaying or not self.restore_token():
+            self.login()
+
+    @property
+    def replaying(self):
+        return bool(self.cassette and self.cassette.replaying)
 
     @property
     def logged(self):
         return bool(self.cookies.get("fssessionid"))
 
+    @property
+    def counter(self):
+        """number of API requests"""
+        return self.stats["requests"]
+
+    def count(self, name, n=1):
+        """increment a counter of the run statistics"""
+        with self.stats_lock:
+            self.stats[name] += n
+
     def write_log(self, text):
         """write text in the log file"""
         log = "[%s]: %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), text)
@@ -61,13 +319,21 @@ class Session(requests.Session):
         """retrieve FamilySearch session ID
         (https://familysearch.org/developers/docs/guides/oauth2)
         """
+        if self.replaying:
+            # the recorded responses do not need an access token
+            self.cookies.set("fssessionid", "replay")
+            self.token_generation += 1
+            if not self.fid:
+                self.set_current()
+                self.lang = self.lang or "en"
+            return
         while True:
             try:
-                url = "https://www.familysearch.org/auth/familysearch/login"
+                url = self.host_url("www", "/auth/familysearch/login")
                 self.write_log("Downloading: " + url)
-                self.get(url, headers=self.headers)
+                self.get(url, headers=self.headers, hooks=self.login_hooks)
                 xsrf = self.cookies["XSRF-TOKEN"]
-                url = "https://ident.familysearch.org/login"
+                url = self.host_url("ident", "/login")
                 self.write_log("Logging in: " + url)
                 res = self.post(
                     url,
@@ -77,10 +343,11 @@ class Session(requests.Session):
                         "password": self.password,
                     },
                     headers=self.headers,
+                    hooks=self.login_hooks,
                 )
                 res.raise_for_status()
 
-                url = f"https://ident.familysearch.org/cis-web/oauth2/v3/authorization"
+                url = self.host_url("ident", "/cis-web/oauth2/v3/authorization")
                 params = {
                     "response_type": "code",
                     "scope": "profile email qualifies_for_affiliate_account country",
@@ -90,7 +357,9 @@ class Session(requests.Session):
                 }
                 self.write_log("Getting an authorization code: " + url)
                 self.write_log(f"OAuth parameters: {params}")
-                response = self.get(url, headers=self.headers, params=params)
+                response = self.get(
+                    url, headers=self.headers, params=params, hooks=self.login_hooks
+                )
                 response.raise_for_status()
                 self.write_log(f"OAuth response URL: {response.url}")
                 try:
@@ -106,7 +375,7 @@ class Session(requests.Session):
                     print(f"Debug info: Response URL was: {response.url}")
                     sys.exit(2)
 
-                url = "https://ident.familysearch.org/cis-web/oauth2/v3/token"
+                url = self.host_url("ident", "/cis-web/oauth2/v3/token")
                 self.write_log("Exchanging for an access token: " + url)
                 res = self.post(
                     url,
@@ -117,6 +386,7 @@ class Session(requests.Session):
                         "redirect_uri": self.redirect_uri,
                     },
                     headers=self.headers,
+                    hooks=self.login_hooks,
                 )
 
                 try:
@@ -129,7 +399,12 @@ class Session(requests.Session):
                     self.write_log(res.text)
                     continue
                 access_token = data["access_token"]
-                self.headers.update({"Authorization": f"Bearer {access_token}"})
+                # replace the headers at once, they are read by other threads
+                headers = self.headers.copy()
+                headers["Authorization"] = f"Bearer {access_token}"
+                self.headers = headers
+                self.token_generation += 1
+                lifetime = data.get("expires_in")
 
             except requests.exceptions.ReadTimeout:
                 self.write_log("Read timed out")
@@ -152,77 +427,346 @@ class Session(requests.Session):
                 continue
             if self.logged:
                 self.set_current()
+                if self.token_store:
+                    self.token_store.save(
+                        self.username, access_token, self.cookies, lifetime
+                    )
                 break
 
-    def get_url(self, url, headers=None, no_api=False):
-        """retrieve JSON structure from a FamilySearch URL"""
-        self.counter += 1
-        request_start = time.time()
+    def record(self, url, started, r=None, error=None):
+        """record the metrics of an API request
+        :param started: the time when the request was sent
+        :param r: the response, or None
+        :param error: the error class of a request without response
+        """
+        wire = decoded = 0
+        if r is not None:
+            wire, decoded = wire_size(r), len(r.content)
+            self.count("bytes_wire", wire)
+            self.count("bytes_decoded", decoded)
+        self.metrics.request(
+            endpoint(url),
+            error if r is None else r.status_code,
+            time.time() - started,
+            wire,
+            decoded,
+        )
+
+    def record_login(self, r, *args, **kwargs):
+        """response hook recording the metrics of the login requests"""
+        self.metrics.request(
+            "login",
+            r.status_code,
+            r.elapsed.total_seconds(),
+            wire_size(r),
+            len(r.content),
+        )
+
+    def refresh_token(self, generation):
+        """log in again after a 401 response, unless another request
+        already did it: only one refresh happens at a time, and the other
+        requests are parked until it is done
+        :param generation: the token generation used by the rejected request
+        """
+        parked = time.time()
+        with self.login_lock:
+            if self.token_generation == generation:
+                self.write_log("Refreshing the access token")
+                self.count("token_refreshes")
+                self.login()
+        self.count("parked_seconds", time.time() - parked)
+
+    def restore_token(self):
+        """reuse the access token and the cookies saved by a previous run,
+        after checking them with a single request
+        :return: True if the session is logged in
+        """
+        saved = self.token_store and self.token_store.load(self.username)
+        if not saved:
+            return False
+        self.headers.update({"Authorization": "Bearer %s" % saved["access_token"]})
+        for cookie in saved["cookies"]:
+            self.cookies.set(**cookie)
+        url = "/platform/users/current"
+        full_url, headers = self.request_args(url)
+        self.write_log("Checking the saved access token: " + url)
+        try:
+            r = self.get(full_url, headers=headers, timeout=self.timeout)
+            if r.status_code == 200 and self.logged:
+                self.set_user(r.json())
+                self.count("token_reused")
+                return True
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            pass
+        self.write_log("The saved access token was rejected")
+        self.token_store.delete(self.username)
+        self.headers.pop("Authorization", None)
+        self.cookies.clear()
+        return False
+
+    def host_url(self, host, path):
+        """return the URL of a path on a FamilySearch host
+        (www, ident, api or None for familysearch.org), or on the base URL
+        """
+        if self.base_url:
+            return self.base_url + path
+        return "https://%sfamilysearch.org%s" % (host + "." if host else "", path)
+
+    def request_args(self, url, headers=None, no_api=False):
+        """return the full URL and the headers of a get_url request"""
         if headers is None:
             headers = {"Accept": "application/x-gedcomx-v1+json"}
         headers.update(self.headers)
-        base = "https://api.familysearch.org"
-        if no_api:
-            base = "https://familysearch.org"
+        return self.host_url(None if no_api else "api", url), headers
+
+    def check_response(self, url, r):
+        """interpret the response of a get_url request
+        :return: (RETRY, error class), (LOGIN, None) or (DONE, result)
+        """
+        self.write_log("Status code: %s" % r.status_code)
+        if r.status_code == 204:
+            return DONE, None
+        if r.status_code == 304:
+            return DONE, NOT_MODIFIED
+        if r.status_code in {404, 405, 410, 500}:
+            self.write_log("WARNING: " + url)
+            return DONE, None
+        if r.status_code == 401:
+            return LOGIN, None
+        if r.status_code >= 400:
+            self.write_log("HTTPError")
+            if r.status_code == 403:
+                if (
+                    "message" in r.json()["errors"][0]
+                    and r.json()["errors"][0]["message"] == "Unable to get ordinances."
+                ):
+                    self.write_log(
+                        "Unable to get ordinances. "
+                        "Try with an LDS account or without option -c."
+                    )
+                    return DONE, "error"
+                self.write_log(
+                    "WARNING: code 403 from %s %s"
+                    % (url, r.json()["errors"][0]["message"] or "")
+                )
+                return DONE, None
+            if r.status_code == 429:
+                return RETRY, "throttle"
+            return RETRY, "server"
+        try:
+            return DONE, loads(r.content)
+        except Exception as e:
+            self.write_log("WARNING: corrupted file from %s, error: %s" % (url, e))
+            return DONE, None
+
+    def cache_lookup(self, url, full_url, headers, request_headers=None):
+        """return the cached entry of a get_url request and True if it is fresh,
+        add the validators of a stale entry to the request headers
+        :param request_headers: the headers of the request, the cache does not
+                                answer a request with UNCACHED headers
+        """
+        if request_headers and UNCACHED & {h.lower() for h in request_headers}:
+            return None, False
+        entry = self.cache.get(self.username, full_url) if self.cache else None
+        if entry is None:
+            return None, False
+        if self.cache.is_fresh(entry) and not self.cache.revalidate:
+            self.count("cache_hit")
+            self.metrics.cache(endpoint(url), "hit")
+            self.write_log("Cached: " + url)
+            return entry, True
+        if not (entry["etag"] or entry["last_modified"]):
+            return None, False
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return entry, False
+
+    def cache_store(self, url, full_url, entry, r, res):
+        """store the response of a get_url request in the cache
+        a 304 response revalidates the cached entry
+        :return: the response data
+        """
+        if entry and r.status_code == 304:
+            self.count("cache_revalidated")
+            self.metrics.cache(endpoint(url), "revalidated")
+            self.write_log("Not modified: " + url)
+            res = entry["data"]
+        elif self.cache and self.cache.ttl_of(full_url):
+            self.count("cache_miss")
+            self.metrics.cache(endpoint(url), "miss")
+        if self.cache and isinstance(res, dict) and "persons" in res:
+            # cached by person, a repeat run does not split the same batches
+            for fid, data in person_slices(res):
+                self.cache.set(self.username, self.person_url(fid), data)
+        elif self.cache and res not in ("error", NOT_MODIFIED):
+            self.cache.set(
+                self.username,
+                full_url,
+                res,
+                r.headers.get("ETag") or (entry and entry["etag"]),
+                r.headers.get("Last-Modified") or (entry and entry["last_modified"]),
+            )
+        return res
+
+    def person_url(self, fid):
+        """return the URL of a persons request of a single person"""
+        return self.request_args(PERSONS_URL + fid, {})[0]
+
+    def cached_persons(self, fids):
+        """return the data of the persons fresh in the cache, merged as the
+        response of a persons request (or None), and the fids to download
+        """
+        if not self.cache or self.cache.revalidate:
+            return None, list(fids)
+        found, missing = list(), list()
+        for fid in fids:
+            entry = self.cache.get(self.username, self.person_url(fid))
+            if entry and self.cache.is_fresh(entry):
+                found.append(entry["data"])
+            else:
+                missing.append(fid)
+        if not found:
+            return None, missing
+        self.count("cache_hit", len(found))
+        for _ in found:
+            self.metrics.cache("persons", "hit")
+        return merge_persons(found), missing
+
+    def retry_delay(self, url, error, attempt, r=None):
+        """return the time to wait before retrying a get_url request,
+        or None if it should be abandoned
+        :param error: the error class (see RetryPolicy)
+        :param attempt: the number of retries already done
+        :param r: the response, if any
+        """
+        retry_after = None
+        if error == "throttle":
+            retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            self.count("throttled")
+            self.limiter.throttled(retry_after)
+        delay = self.retry_policy.delay(error, attempt, retry_after)
+        if delay is None:
+            self.count("abandoned")
+            self.abandoned.add(url)
+            self.write_log("WARNING: giving up " + url)
+        else:
+            self.count("retries")
+            self.metrics.retry(endpoint(url), error)
+        return delay
+
+    def log_slow(self, url, request_start):
+        """log the requests slower than a second"""
+        request_time = time.time() - request_start
+        if self.verbose and request_time > 1.0:  # Log slow requests
+            self.write_log(f"Slow request ({request_time:.2f}s): {url}")
+
+    def request_key(self, url, headers=None, no_api=False):
+        """return the key identifying identical get_url requests"""
+        full_url, _ = self.request_args(url, {}, no_api)
+        return normalize_url(full_url), headers and tuple(sorted(headers.items()))
+
+    def get_url(self, url, headers=None, no_api=False, fail_fast=False):
+        """retrieve JSON structure from a FamilySearch URL
+        concurrent requests of the same URL share a single download
+        :param fail_fast: raise RequestFailed on a timeout or a server error
+                          instead of retrying (the caller splits the request)
+        """
+        key = self.request_key(url, headers, no_api)
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            self.count("coalesced")
+            self.metrics.cache(endpoint(url), "coalesced")
+            self.write_log("Waiting for: " + url)
+            return future.result()
+        try:
+            res = self._download(url, headers, no_api, fail_fast)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(res)
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+        return res
+
+    def _download(self, url, headers=None, no_api=False, fail_fast=False):
+        """retrieve JSON structure from a FamilySearch URL"""
+        full_url, _ = self.request_args(url, {}, no_api)
+        validators = dict()
+        entry, fresh = self.cache_lookup(url, full_url, validators, headers)
+        if fresh:
+            return entry["data"]
+        self.count("requests")
+        self.retry_policy.request()
+        request_start = time.time()
+        attempt = 0
         while True:
+            time.sleep(self.limiter.reserve())
+            generation = self.token_generation
+            full_url, req_headers = self.request_args(
+                url, None if headers is None else dict(headers), no_api
+            )
+            req_headers.update(validators)
+            started, error = time.time(), None
             try:
                 self.write_log("Downloading: " + url)
-                r = self.get(base + url, timeout=self.timeout, headers=headers)
+                if self.replaying:
+                    r = self.cassette.play(full_url)
+                else:
+                    r = self.get(full_url, timeout=self.timeout, headers=req_headers)
+                    if self.cassette:
+                        self.cassette.record(full_url, r, time.time() - started)
             except requests.exceptions.ReadTimeout:
                 self.write_log("Read timed out")
-                continue
-            except requests.exceptions.ConnectionError:
+                r, error = None, "timeout"
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ContentDecodingError,
+            ):
                 self.write_log("Connection aborted")
-                time.sleep(self.timeout)
-                continue
-            self.write_log("Status code: %s" % r.status_code)
-            if r.status_code == 204:
-                return None
-            if r.status_code in {404, 405, 410, 500}:
-                self.write_log("WARNING: " + url)
-                return None
-            if r.status_code == 401:
-                self.login()
-                continue
-            try:
-                r.raise_for_status()
-            except requests.exceptions.HTTPError:
-                self.write_log("HTTPError")
-                if r.status_code == 403:
-                    if (
-                        "message" in r.json()["errors"][0]
-                        and r.json()["errors"][0]["message"]
-                        == "Unable to get ordinances."
-                    ):
-                        self.write_log(
-                            "Unable to get ordinances. "
-                            "Try with an LDS account or without option -c."
-                        )
-                        return "error"
-                    self.write_log(
-                        "WARNING: code 403 from %s %s"
-                        % (url, r.json()["errors"][0]["message"] or "")
-                    )
-                    return None
-                time.sleep(self.timeout)
-                continue
-            try:
-                request_time = time.time() - request_start
-                if self.verbose and request_time > 1.0:  # Log slow requests
-                    self.write_log(f"Slow request ({request_time:.2f}s): {url}")
-                return r.json()
-            except Exception as e:
-                self.write_log("WARNING: corrupted file from %s, error: %s" % (url, e))
+                r, error = None, "connection"
+            self.record(url, started, r, error)
+            if r is not None:
+                if entry and r.status_code == 304:
+                    self.limiter.success()
+                    return self.cache_store(url, full_url, entry, r, None)
+                action, res = self.check_response(url, r)
+                if action == LOGIN:
+                    self.refresh_token(generation)
+                    continue
+                if action == DONE:
+                    self.limiter.success()
+                    self.log_slow(url, request_start)
+                    return self.cache_store(url, full_url, entry, r, res)
+                error = res
+            if fail_fast and error in SPLIT_ERRORS:
+                raise RequestFailed(error)
+            delay = self.retry_delay(url, error, attempt, r)
+            if delay is None:
                 return None
+            attempt += 1
+            time.sleep(delay)
 
     def set_current(self):
         """retrieve FamilySearch current user ID, name and language"""
         url = "/platform/users/current"
         data = self.get_url(url)
         if data:
-            self.fid = data["users"][0]["personId"]
-            self.lang = data["users"][0]["preferredLanguage"]
-            self.display_name = data["users"][0]["displayName"]
+            self.set_user(data)
+
+    def set_user(self, data):
+        """set the current user ID, name and language from FS user data"""
+        self.fid = data["users"][0]["personId"]
+        self.lang = data["users"][0]["preferredLanguage"]
+        self.display_name = data["users"][0]["displayName"]
 
     def _(self, string):
         """translate a string into user's language
@@ -231,3 +775,146 @@ class Session(requests.Session):
         if string in translations and self.lang in translations[string]:
             return translations[string][self.lang]
         return string
+
+
+class AsyncSession:
+    """Asynchronous FamilySearch session, sharing the login, retry and
+    status code handling of a Session
+    :param fs: a logged in Session object
+    :param max_in_flight: maximum number of concurrent requests
+    """
+
+    def __init__(self, fs, max_in_flight=64):
+        self.fs = fs
+        self.max_in_flight = max_in_flight
+        self.pool = ConnectionPool(
+            limit=min(max_in_flight, fs.max_connections),
+            timeout=fs.timeout,
+            keep_alive=fs.keep_alive,
+            count=fs.count,
+            # the proxies of the environment, overridden by those of the Session
+            proxies=dict(getproxies() if fs.trust_env else {}, **fs.proxies),
+        )
+        self.loop = self.semaphore = self.refreshing = None
+        self.inflight = dict()
+
+    def _get_semaphore(self):
+        """the semaphore and the in-flight requests are bound to
+        the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+            self.inflight = dict()
+            self.refreshing = None
+        return self.semaphore
+
+    async def refresh_token(self, generation):
+        """log in again after a 401 response, sharing a single refresh
+        between all the tasks of the event loop
+        :param generation: the token generation used by the rejected request
+        """
+        if self.refreshing is None:
+            self.refreshing = asyncio.ensure_future(
+                self.loop.run_in_executor(None, self.fs.refresh_token, generation)
+            )
+            self.refreshing.add_done_callback(self._refreshed)
+            await asyncio.shield(self.refreshing)
+            return
+        parked = time.time()
+        await asyncio.shield(self.refreshing)
+        self.fs.count("parked_seconds", time.time() - parked)
+
+    def _refreshed(self, future):
+        self.refreshing = None
+
+    async def get_url(self, url, headers=None, no_api=False, fail_fast=False):
+        """retrieve JSON structure from a FamilySearch URL
+        concurrent requests of the same URL share a single download
+        :param fail_fast: see Session.get_url
+        """
+        self._get_semaphore()
+        key = self.fs.request_key(url, headers, no_api)
+        if key in self.inflight:
+            self.fs.count("coalesced")
+            self.fs.metrics.cache(endpoint(url), "coalesced")
+            self.fs.write_log("Waiting for: " + url)
+            return await asyncio.shield(self.inflight[key])
+        self.inflight[key] = future = self.loop.create_future()
+        try:
+            res = await self._download(url, headers, no_api, fail_fast)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieve the exception if no other task is waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(res)
+        finally:
+            del self.inflight[key]
+        return res
+
+    async def _download(self, url, headers=None, no_api=False, fail_fast=False):
+        """retrieve JSON structure from a FamilySearch URL"""
+        fs = self.fs
+        full_url, _ = fs.request_args(url, {}, no_api)
+        validators = dict()
+        entry, fresh = fs.cache_lookup(url, full_url, validators, headers)
+        if fresh:
+            return entry["data"]
+        fs.count("requests")
+        fs.retry_policy.request()
+        request_start = time.time()
+        attempt = 0
+        async with self._get_semaphore():
+            while True:
+                await asyncio.sleep(fs.limiter.reserve())
+                generation = fs.token_generation
+                full_url, req_headers = fs.request_args(
+                    url, None if headers is None else dict(headers), no_api
+                )
+                cookie = get_cookie_header(fs.cookies, requests.Request("GET", full_url))
+                if cookie:
+                    req_headers["Cookie"] = cookie
+                req_headers.update(validators)
+                started, error = time.time(), None
+                try:
+                    fs.write_log("Downloading: " + url)
+                    if fs.replaying:
+                        r = await fs.cassette.play_async(full_url)
+                    else:
+                        r = await self.pool.request("GET", full_url, req_headers)
+                        if fs.cassette:
+                            fs.cassette.record(full_url, r, time.time() - started)
+                except asyncio.TimeoutError:
+                    fs.write_log("Read timed out")
+                    r, error = None, "timeout"
+                except OSError:
+                    # ProtocolError included
+                    fs.write_log("Connection aborted")
+                    r, error = None, "connection"
+                fs.record(url, started, r, error)
+                if r is not None:
+                    if entry and r.status_code == 304:
+                        fs.limiter.success()
+                        return fs.cache_store(url, full_url, entry, r, None)
+                    action, res = fs.check_response(url, r)
+                    if action == LOGIN:
+                        await self.refresh_token(generation)
+                        continue
+                    if action == DONE:
+                        fs.limiter.success()
+                        fs.log_slow(url, request_start)
+                        return fs.cache_store(url, full_url, entry, r, res)
+                    error = res
+                if fail_fast and error in SPLIT_ERRORS:
+                    raise RequestFailed(error)
+                delay = fs.retry_delay(url, error, attempt, r)
+                if delay is None:
+                    return None
+                attempt += 1
+                await asyncio.sleep(delay)
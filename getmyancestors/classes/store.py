@@ -0,0 +1,381 @@
+# global imports
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+# local imports
+from getmyancestors.classes.checkpoint import TreePickler, TreeUnpickler
+from getmyancestors.classes.constants import STORE_CACHE
+
+# rows read at once when iterating over a table
+CHUNK = 1000
+
+
+def by_num(objects):
+    """return the objects of a tree (indi, fam, sources or notes)
+    sorted by GEDCOM identifier, streamed from the store if they are in one
+    """
+    if hasattr(objects, "by_num"):
+        return objects.by_num()
+    if isinstance(objects, dict):
+        objects = objects.values()
+    return sorted(objects, key=lambda x: x.num)
+
+
+def pin(objects, key):
+    """keep an object of a tree (indi, fam or sources) in memory until it
+    is unpinned: a table of a store writes the objects it forgets, so a
+    change made to an object after it is forgotten would be lost
+    """
+    if hasattr(objects, "pin"):
+        objects.pin(key)
+
+
+def unpin(objects, key):
+    """let a pinned object of a tree leave the memory"""
+    if hasattr(objects, "unpin"):
+        objects.unpin(key)
+
+
+@contextmanager
+def pinned(objects, key):
+    """pin an object of a tree while it is used, yield it"""
+    pin(objects, key)
+    try:
+        yield objects[key]
+    finally:
+        unpin(objects, key)
+
+
+class StorePickler(TreePickler):
+    """pickle an object of a table with references to the sources and
+    notes of the tree, which have their own tables, instead of copies
+    :param obj: the pickled object
+    """
+
+    def __init__(self, file, tree, obj):
+        super().__init__(file, tree)
+        self.obj = obj
+
+    def persistent_id(self, obj):
+        if obj is not self.obj:
+            name = type(obj).__name__
+            if name == "Source" and obj.fid:
+                return ("source", obj.fid)
+            if name == "Note":
+                return ("note", obj.num)
+        return super().persistent_id(obj)
+
+
+class StoreUnpickler(TreeUnpickler):
+    """unpickle an object of a table, with the sources and notes
+    of the tree it references
+    """
+
+    def persistent_load(self, pid):
+        if pid == "tree":
+            return self.tree
+        name, key = pid
+        if name == "source":
+            return self.tree.sources[key]
+        return self.tree.notes.get(key)
+
+
+class Table(MutableMapping):
+    """Mapping of a tree (individuals, families or sources) kept in a
+    SQLite table: the objects used recently stay in memory, the others are
+    pickled in the table and loaded again when they are needed. An object
+    changed while other objects are used is pinned (see pinned), so that it
+    stays in memory with its changes.
+    :param store: a SqliteStore
+    :param name: the name of the table
+    :param pairs: the keys are (husband, wife) couples of fids
+    """
+
+    def __init__(self, store, name, pairs=False):
+        self.store = store
+        self.name = name
+        self.pairs = pairs
+        self.cache = OrderedDict()
+        self.pins = Counter()
+        self.length = 0
+
+    def encode(self, key):
+        if self.pairs:
+            return "%s|%s" % (key[0] or "", key[1] or "")
+        return key
+
+    def decode(self, key):
+        if self.pairs:
+            return tuple(x or None for x in key.split("|"))
+        return key
+
+    def exists(self, key):
+        sql = "SELECT 1 FROM %s WHERE key = ?" % self.name
+        return bool(self.store.execute(sql, (self.encode(key),)))
+
+    def write(self, items):
+        """write (key, object) items in the table, updating the rows in place:
+        a row keeps its rowid, which orders the iteration over the table
+        """
+        self.store.execute(
+            "INSERT INTO %s (key, num, data) VALUES (?, ?, ?) ON CONFLICT (key) "
+            "DO UPDATE SET num = excluded.num, data = excluded.data" % self.name,
+            [(self.encode(k), obj.num, self.store.dumps(obj)) for k, obj in items],
+            many=True,
+        )
+
+    def pin(self, key):
+        with self.store.lock:
+            self.pins[key] += 1
+
+    def unpin(self, key):
+        with self.store.lock:
+            self.pins[key] -= 1
+            if self.pins[key] <= 0:
+                del self.pins[key]
+                self.evict(None)
+
+    def evict(self, used):
+        """write the least recently used objects in the table, and forget
+        them, until the cache is back under the capacity of the store
+        :param used: the key in use, kept with the pinned ones
+        """
+        capacity = self.store.capacity
+        if len(self.cache) <= capacity:
+            return
+        evicted = list()
+        for _ in range(len(self.cache)):
+            if len(self.cache) <= capacity * 9 // 10:
+                break
+            key, obj = self.cache.popitem(last=False)
+            if key in self.pins or key == used:
+                self.cache[key] = obj
+            else:
+                evicted.append((key, obj))
+        if evicted:
+            self.write(evicted)
+
+    def flush(self):
+        """write the objects in memory in the table"""
+        with self.store.lock:
+            if self.cache:
+                self.write(self.cache.items())
+
+    def __getitem__(self, key):
+        with self.store.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            sql = "SELECT data FROM %s WHERE key = ?" % self.name
+            rows = self.store.execute(sql, (self.encode(key),))
+            if not rows:
+                raise KeyError(key)
+            obj = self.cache[key] = self.store.loads(rows[0][0])
+            self.evict(key)
+            return obj
+
+    def __setitem__(self, key, obj):
+        with self.store.lock:
+            if key not in self.cache and not self.exists(key):
+                self.length += 1
+            self.cache[key] = obj
+            self.cache.move_to_end(key)
+            self.evict(key)
+
+    def __delitem__(self, key):
+        with self.store.lock:
+            if key not in self.cache and not self.exists(key):
+                raise KeyError(key)
+            self.cache.pop(key, None)
+            sql = "DELETE FROM %s WHERE key = ?" % self.name
+            self.store.execute(sql, (self.encode(key),))
+            self.length -= 1
+
+    def __contains__(self, key):
+        with self.store.lock:
+            return key in self.cache or self.exists(key)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        self.flush()
+        sql = "SELECT rowid, key FROM %s WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        rowid = 0
+        while True:
+            rows = self.store.execute(sql % self.name, (rowid, CHUNK))
+            for rowid, key in rows:
+                yield self.decode(key)
+            if len(rows) < CHUNK:
+                return
+
+    def clear(self):
+        with self.store.lock:
+            self.cache.clear()
+            self.store.execute("DELETE FROM %s" % self.name)
+            self.length = 0
+
+    def by_num(self):
+        """yield copies of the objects in the order of their GEDCOM identifiers"""
+        self.flush()
+        yield from self.store.stream(
+            "SELECT num, data FROM %s ORDER BY num, rowid" % self.name
+        )
+
+
+class NoteList:
+    """Append-only list of the notes of a tree kept in a SQLite table:
+    the notes are written by chunks as they are added
+    :param store: a SqliteStore
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # the notes not written yet by number
+        self.pending = dict()
+        self.length = 0
+
+    def append(self, note):
+        with self.store.lock:
+            self.pending[note.num] = note
+            self.length += 1
+            if len(self.pending) >= CHUNK:
+                self.flush()
+
+    def extend(self, notes):
+        for note in notes:
+            self.append(note)
+
+    def flush(self):
+        """write the pending notes in the table"""
+        with self.store.lock:
+            if self.pending:
+                self.store.execute(
+                    "INSERT INTO notes (num, data) VALUES (?, ?)",
+                    [
+                        (num, self.store.dumps(note))
+                        for num, note in self.pending.items()
+                    ],
+                    many=True,
+                )
+                self.pending = dict()
+
+    def get(self, num):
+        """return the note of a GEDCOM identifier"""
+        with self.store.lock:
+            if num in self.pending:
+                return self.pending[num]
+            sql = "SELECT data FROM notes WHERE num = ? LIMIT 1"
+            return self.store.loads(self.store.execute(sql, (num,))[0][0])
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        self.flush()
+        yield from self.store.stream("SELECT rowid, data FROM notes ORDER BY rowid")
+
+    def clear(self):
+        with self.store.lock:
+            self.pending = dict()
+            self.store.execute("DELETE FROM notes")
+            self.length = 0
+
+    def by_num(self):
+        """yield copies of the notes in the order of their GEDCOM identifiers"""
+        self.flush()
+        yield from self.store.stream("SELECT num, data FROM notes ORDER BY num, rowid")
+
+
+class SqliteStore:
+    """Keep the individuals, families, notes and sources of a tree in a
+    SQLite database instead of memory, for trees larger than the memory:
+    only the objects in use (the frontier of the download), the
+    relationships graph and the fids of the current phase stay in memory.
+    :param path: the database file (its previous content is replaced),
+                 or None for a temporary file
+    :param capacity: the number of objects of each table kept in memory
+    """
+
+    def __init__(self, path=None, capacity=STORE_CACHE):
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(suffix=".sqlite")
+            os.close(fd)
+        self.path = path
+        self.capacity = capacity
+        self.tree = None
+        # the tables are used by the threads of the downloads
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        for name in ("indi", "fam", "sources"):
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS %s "
+                "(key TEXT PRIMARY KEY, num INTEGER, data BLOB)" % name
+            )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS notes "
+            "(rowid INTEGER PRIMARY KEY, num INTEGER, data BLOB)"
+        )
+        for name in ("indi", "fam", "sources", "notes"):
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS %s_num ON %s (num)" % (name, name)
+            )
+            self.connection.execute("DELETE FROM %s" % name)
+
+    def attach(self, tree):
+        """keep the individuals, families, notes and sources of a tree"""
+        self.tree = tree
+        tree.indi = Table(self, "indi")
+        tree.fam = Table(self, "fam", pairs=True)
+        tree.sources = Table(self, "sources")
+        tree.notes = NoteList(self)
+
+    def execute(self, sql, parameters=(), many=False):
+        """execute a statement, return its rows"""
+        with self.lock:
+            if many:
+                self.connection.executemany(sql, parameters)
+                return []
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def stream(self, sql):
+        """yield the objects of the (_, data) rows of a query, read by chunks"""
+        with self.lock:
+            cursor = self.connection.execute(sql)
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(CHUNK)
+            for _, data in rows:
+                yield self.loads(data)
+            if len(rows) < CHUNK:
+                return
+
+    def dumps(self, obj):
+        file = io.BytesIO()
+        StorePickler(file, self.tree, obj).dump(obj)
+        return file.getvalue()
+
+    def loads(self, data):
+        return StoreUnpickler(io.BytesIO(data), self.tree).load()
+
+    def clear(self):
+        """empty the tables"""
+        for table in (self.tree.indi, self.tree.fam, self.tree.sources, self.tree.notes):
+            table.clear()
+
+    def close(self):
+        """close the database, removing it if it is temporary"""
+        self.connection.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,429 @@
+# global imports
+import math
+from collections import Counter
+
+BASE36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+GIVEN_NAMES = {
+    "M": ("John", "William", "James", "Pierre", "Hans", "Carlos", "Ole", "Jan"),
+    "F": ("Mary", "Anna", "Elizabeth", "Marie", "Ingrid", "Rosa", "Sarah", "Emma"),
+}
+SURNAMES = (
+    "Smith", "Martin", "Muller", "Garcia", "Hansen", "Rossi", "Novak", "Jensen",
+    "Dubois", "Schmidt", "Lopez", "Olsen", "Brown", "Bernard", "Weber", "Silva",
+)  # fmt: skip
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN",
+          "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")  # fmt: skip
+PLACES = 50
+# modification times in milliseconds, as in the attributions of FamilySearch
+EPOCH = 1577836800000
+DAY = 86400000
+MALE = "http://gedcomx.org/Male"
+FEMALE = "http://gedcomx.org/Female"
+
+
+class SyntheticTree:
+    """Deterministic synthetic FamilySearch tree, generated on demand
+    The direct ancestors are numbered as in an Ahnentafel list starting
+    at 0: the parents of n are 2n+1 (father) and 2n+2 (mother). Each couple
+    has branching - 1 other children, without spouse nor descendants.
+    With pedigree collapse, some ancestors share the parents of their
+    cousin n-2, so that some couples appear in several lines.
+    :param size: number of direct ancestors, including the root person
+    :param branching: number of children of each couple
+    :param collapse: probability that an ancestor shares the parents of a cousin
+    :param seed: seed of the generated names, dates and places
+    """
+
+    def __init__(self, size=1000, branching=3, collapse=0.0, seed=0):
+        self.size = size
+        self.branching = max(1, branching)
+        self.collapse = collapse
+        self.seed = seed
+        self.revisions = Counter()
+        self.couple_revisions = Counter()
+
+    # identifiers
+
+    @staticmethod
+    def fid(n):
+        """return the FamilySearch id of the person n"""
+        digits = ""
+        for _ in range(7):
+            n, r = divmod(n, 36)
+            digits = BASE36[r] + digits
+        return digits[:4] + "-" + digits[4:]
+
+    def index(self, fid):
+        """return the number of a FamilySearch id, or None if unknown"""
+        digits = (fid or "").replace("-", "")
+        if len(digits) != 7 or any(c not in BASE36 for c in digits):
+            return None
+        n = 0
+        for c in digits:
+            n = n * 36 + BASE36.index(c)
+        if n >= self.size * (self.branching + 1) or (
+            self.is_sibling(n) and not (n - self.size) % self.branching
+        ):
+            return None
+        return n
+
+    def couple_id(self, father):
+        return "C" + self.fid(father).replace("-", "")
+
+    def couple_index(self, relid):
+        """return the number of the husband of a couple id, or None"""
+        n = self.index(relid[1:]) if relid.startswith("C") else None
+        if n is None or self.is_sibling(n) or not n % 2:
+            return None
+        return n
+
+    def rand(self, n, salt=0):
+        """return a deterministic pseudo-random number in [0, 1) for n"""
+        x = n * 0x9E3779B1 + salt * 0x85EBCA77 + self.seed * 0xC2B2AE3D
+        x &= 0xFFFFFFFF
+        x ^= x >> 16
+        x = (x * 0x45D9F3B) & 0xFFFFFFFF
+        x ^= x >> 16
+        return x / 2**32
+
+    # relationships
+
+    @staticmethod
+    def generation(n):
+        return int(math.log2(n + 1))
+
+    def is_sibling(self, n):
+        """True if n is not a direct ancestor but one of their siblings"""
+        return n >= self.size
+
+    def collapsed(self, n):
+        """True if the ancestor n shares the parents of n-2"""
+        return (
+            self.collapse > 0
+            and 3 <= n < self.size
+            and self.generation(n - 2) == self.generation(n)
+            and self.rand(n, 1) < self.collapse
+        )
+
+    def parents(self, n):
+        """return the father and mother of n, or None"""
+        if self.is_sibling(n):
+            return self.parents((n - self.size) // self.branching)
+        if self.collapsed(n):
+            return self.parents(n - 2)
+        if 2 * n + 2 < self.size:
+            return 2 * n + 1, 2 * n + 2
+        return None
+
+    def siblings(self, n):
+        """return the other children of the parents of the ancestor n"""
+        if self.collapsed(n) or not self.parents(n):
+            return []
+        start = self.size + n * self.branching
+        return list(range(start + 1, start + self.branching))
+
+    def children(self, father):
+        """return the children of the couple of the ancestor father"""
+        child = (father - 1) // 2
+        if self.collapsed(child):
+            return []
+        children = [child] + self.siblings(child)
+        cousin = child + 2
+        while self.collapsed(cousin):
+            children.append(cousin)
+            cousin += 2
+        return children
+
+    def spouse(self, n):
+        """return the spouse of n, or None"""
+        if n == 0 or self.is_sibling(n):
+            return None
+        return n + 1 if n % 2 else n - 1
+
+    # changes
+
+    def revise(self, n):
+        """edit the person n: change their given name and modification time"""
+        self.revisions[n] += 1
+
+    def revise_couple(self, father):
+        """edit the couple of the ancestor father: change their marriage date"""
+        self.couple_revisions[father] += 1
+
+    def modified(self, n):
+        """return the modification time of the person n"""
+        return EPOCH + int(self.rand(n, 9) * 365) * DAY + self.revisions[n] * DAY
+
+    def couple_modified(self, father):
+        """return the modification time of the couple of the ancestor father"""
+        return (
+            EPOCH
+            + int(self.rand(father, 42) * 365) * DAY
+            + self.couple_revisions[father] * DAY
+        )
+
+    # FamilySearch data
+
+    def gender(self, n):
+        if self.is_sibling(n):
+            return "M" if self.rand(n, 2) < 0.5 else "F"
+        return "M" if n % 2 or n == 0 else "F"
+
+    def surname(self, n):
+        """the surname of the paternal line"""
+        parents = self.parents(n)
+        while parents:
+            n = parents[0]
+            parents = self.parents(n)
+        return SURNAMES[int(self.rand(n, 3) * len(SURNAMES))]
+
+    def birth_year(self, n):
+        if self.is_sibling(n):
+            child = (n - self.size) // self.branching
+            return self.birth_year(child) + int(self.rand(n, 4) * 10) - 5
+        return 1990 - 28 * self.generation(n) - int(self.rand(n, 4) * 8)
+
+    def date(self, n, year, salt):
+        day = 1 + int(self.rand(n, salt) * 28)
+        month = MONTHS[int(self.rand(n, salt + 1) * 12)]
+        return "%s %s %s" % (day, month, year)
+
+    def place(self, n, salt):
+        return int(self.rand(n, salt) * PLACES)
+
+    def fact(self, n, kind, year, salt):
+        place = self.place(n, salt)
+        return {
+            "type": "http://gedcomx.org/" + kind,
+            "date": {"original": self.date(n, year, salt)},
+            "place": {
+                "original": "Town %s, Region" % place,
+                "description": "#P%s" % place,
+            },
+            "attribution": {},
+        }
+
+    def living(self, n):
+        return self.birth_year(n) > 1940
+
+    def person(self, n):
+        """return the FamilySearch data of the person n"""
+        gender = self.gender(n)
+        names = GIVEN_NAMES[gender]
+        index = int(self.rand(n, 5) * len(names)) + self.revisions[n]
+        given = names[index % len(names)]
+        surname = self.surname(n)
+        year = self.birth_year(n)
+        facts = [self.fact(n, "Birth", year, 10)]
+        if not self.living(n):
+            death = year + 50 + int(self.rand(n, 6) * 40)
+            facts.append(self.fact(n, "Death", death, 20))
+        data = {
+            "id": self.fid(n),
+            "living": self.living(n),
+            "names": [
+                {
+                    "preferred": True,
+                    "nameForms": [
+                        {
+                            "fullText": "%s %s" % (given, surname),
+                            "parts": [
+                                {
+                                    "type": "http://gedcomx.org/Given",
+                                    "value": given,
+                                },
+                                {
+                                    "type": "http://gedcomx.org/Surname",
+                                    "value": surname,
+                                },
+                            ],
+                        }
+                    ],
+                    "attribution": {},
+                }
+            ],
+            "gender": {"type": MALE if gender == "M" else FEMALE},
+            "facts": facts,
+            "attribution": {"modified": self.modified(n)},
+        }
+        if self.rand(n, 7) < 0.3:
+            data["sources"] = [{"id": "S%s" % self.fid(n)}]
+        if self.rand(n, 8) < 0.2:
+            data["evidence"] = [{"id": "%s-1" % self.memory_id(n)}]
+        return data
+
+    def persons(self, fids):
+        """return the FamilySearch data of a batch of persons,
+        as /platform/tree/persons?pids= does
+        """
+        numbers = [self.index(fid) for fid in fids]
+        numbers = [n for n in dict.fromkeys(numbers) if n is not None]
+        persons, places, families, couples = [], set(), [], dict()
+        for n in numbers:
+            data = self.person(n)
+            persons.append(data)
+            for fact in data["facts"]:
+                if "place" in fact:
+                    places.add(int(fact["place"]["description"][2:]))
+            parents = self.parents(n)
+            if parents:
+                families.append((parents[0], parents[1], n))
+            spouse = self.spouse(n)
+            if spouse is not None:
+                father, mother = (n, spouse) if n % 2 else (spouse, n)
+                couples[father] = mother
+                families.extend((father, mother, c) for c in self.children(father))
+        return {
+            "persons": persons,
+            "places": [
+                {
+                    "id": "P%s" % p,
+                    "latitude": round(40 + self.rand(p, 30) * 20, 4),
+                    "longitude": round(-5 + self.rand(p, 31) * 30, 4),
+                }
+                for p in sorted(places)
+            ],
+            "childAndParentsRelationships": [
+                {
+                    "parent1": {"resourceId": self.fid(father)},
+                    "parent2": {"resourceId": self.fid(mother)},
+                    "child": {"resourceId": self.fid(child)},
+                }
+                for father, mother, child in dict.fromkeys(families)
+            ],
+            "relationships": [
+                {
+                    "id": self.couple_id(father),
+                    "type": "http://gedcomx.org/Couple",
+                    "person1": {"resourceId": self.fid(father)},
+                    "person2": {"resourceId": self.fid(mother)},
+                }
+                for father, mother in couples.items()
+            ],
+        }
+
+    def summary(self, n, **display):
+        """return the summary of a person in a pedigree response"""
+        data = self.person(n)
+        display["name"] = data["names"][0]["nameForms"][0]["fullText"]
+        return {"id": data["id"], "display": display}
+
+    def ancestry(self, n, generations=4):
+        """return the data of /platform/tree/ancestry?person=&generations=
+        the ancestors are numbered from 1 as in an Ahnentafel list
+        """
+        persons, todo = [], [(n, 1)]
+        while todo:
+            m, number = todo.pop(0)
+            persons.append(self.summary(m, ascendancyNumber=str(number)))
+            parents = self.parents(m)
+            if parents and number.bit_length() <= generations:
+                todo.append((parents[0], 2 * number))
+                todo.append((parents[1], 2 * number + 1))
+        return {"persons": persons}
+
+    def descendancy(self, n, generations=2):
+        """return the data of /platform/tree/descendancy?person=&generations=
+        the descendants are numbered 1, 1.1, 1.2, 1.1.1... and their
+        spouses 1-S, 1.1-S...
+        """
+        persons, todo = [], [(n, "1")]
+        while todo:
+            m, number = todo.pop(0)
+            persons.append(self.summary(m, descendancyNumber=number))
+            spouse = self.spouse(m)
+            if spouse is None:
+                continue
+            persons.append(self.summary(spouse, descendancyNumber=number + "-S"))
+            if number.count(".") < generations:
+                children = self.children(m if m % 2 else spouse)
+                for i, child in enumerate(children, 1):
+                    todo.append((child, "%s.%s" % (number, i)))
+        return {"persons": persons}
+
+    def couple(self, father):
+        """return the data of /platform/tree/couple-relationships/{id}"""
+        year = self.birth_year(father) + 22 + int(self.rand(father, 40) * 8)
+        year += self.couple_revisions[father]
+        return {
+            "relationships": [
+                {
+                    "id": self.couple_id(father),
+                    "facts": [self.fact(father, "Marriage", year, 41)],
+                    "attribution": {"modified": self.couple_modified(father)},
+                }
+            ]
+        }
+
+    def notes(self, n):
+        """return the data of /platform/tree/persons/{id}/notes, or None"""
+        if self.rand(n, 50) >= 0.25:
+            return None
+        return {
+            "persons": [
+                {
+                    "notes": [
+                        {
+                            "subject": "Research",
+                            "text": "Synthetic note about %s." % self.fid(n),
+                        }
+                    ]
+                }
+            ]
+        }
+
+    def sources(self, n):
+        """return the data of /platform/tree/persons/{id}/sources, or None"""
+        if "sources" not in self.person(n):
+            return None
+        sid = "S%s" % self.fid(n)
+        return {
+            "persons": [
+                {
+                    "sources": [
+                        {
+                            "descriptionId": sid,
+                            "attribution": {"changeMessage": "Added"},
+                        }
+                    ]
+                }
+            ],
+            "sourceDescriptions": [
+                {
+                    "id": sid,
+                    "about": "https://en.wikipedia.org/wiki/%s" % self.surname(n),
+                    "titles": [{"value": "Wikipedia: %s" % self.surname(n)}],
+                    "citations": [{"value": "Wikipedia contributors"}],
+                }
+            ],
+        }
+
+    def memory_id(self, n):
+        return "M%s" % n
+
+    def memory(self, mid):
+        """return the data of /platform/memories/memories/{id}, or None"""
+        if not mid.startswith("M") or not mid[1:].isdigit():
+            return None
+        n = int(mid[1:])
+        return {
+            "sourceDescriptions": [
+                {
+                    "mediaType": "text/plain",
+                    "titles": [{"value": "Story of %s" % self.fid(n)}],
+                    "descriptions": [{"value": "A synthetic life story."}],
+                }
+            ]
+        }
+
+    def user(self):
+        """return the data of /platform/users/current"""
+        return {
+            "users": [
+                {
+                    "personId": self.fid(0),
+                    "preferredLanguage": "en",
+                    "displayName": "Synthetic User",
+                }
+            ]
+        }
@@ -0,0 +1,71 @@
+# global imports
+import os
+import json
+import time
+import hashlib
+
+DEFAULT_TOKEN_DIR = os.path.join(os.path.expanduser("~"), ".getmyancestors")
+# lifetime in seconds of an access token when FamilySearch does not tell it
+DEFAULT_TOKEN_LIFETIME = 3600
+
+
+class TokenStore:
+    """Persist the access token and the cookies of a FamilySearch session,
+    in files readable only by the current user
+    :param directory: the directory of the token files
+    """
+
+    def __init__(self, directory=DEFAULT_TOKEN_DIR):
+        self.directory = directory
+
+    def path(self, username):
+        name = hashlib.sha256((username or "").lower().encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".token")
+
+    def load(self, username):
+        """return the saved session of a user if it has not expired, or None
+        :return: a dict with the access token, the cookies and the expiry
+        """
+        try:
+            with open(self.path(username), encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if saved.get("expires", 0) <= time.time():
+            self.delete(username)
+            return None
+        return saved
+
+    def save(self, username, access_token, cookies, lifetime=None):
+        """save the session of a user
+        :param cookies: a cookie jar
+        :param lifetime: the lifetime of the access token in seconds
+        """
+        saved = {
+            "access_token": access_token,
+            "cookies": [
+                {
+                    "name": c.name,
+                    "value": c.value,
+                    "domain": c.domain,
+                    "path": c.path,
+                    "expires": c.expires,
+                    "secure": c.secure,
+                }
+                for c in cookies
+            ],
+            "expires": time.time() + (lifetime or DEFAULT_TOKEN_LIFETIME),
+        }
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self.path(username)
+        tmp = path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(saved, file)
+        os.replace(tmp, path)
+
+    def delete(self, username):
+        try:
+            os.remove(self.path(username))
+        except OSError:
+            pass
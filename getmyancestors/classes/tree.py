@@ -2,6 +2,10 @@ import sys
 import re
 import time
 import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
 from urllib.parse import unquote
 
 # global imports
@@ -9,12 +13,22 @@ import babelfish
 
 # local imports
 import getmyancestors
+from getmyancestors.classes.batching import BatchSizer
+from getmyancestors.classes.cache import merge_persons, person_slices
 from getmyancestors.classes.constants import (
-    MAX_PERSONS,
+    MAX_ANCESTRY_GENERATIONS,
+    MAX_BATCHES,
+    MAX_DESCENDANCY_GENERATIONS,
+    MAX_FETCHES,
     FACT_EVEN,
     FACT_TAGS,
     ORDINANCES_STATUS,
 )
+from getmyancestors.classes.graph import Graph
+from getmyancestors.classes.lazy import LazySet
+from getmyancestors.classes.projection import FULL, LIFE_SKETCH
+from getmyancestors.classes.session import NOT_MODIFIED, RequestFailed
+from getmyancestors.classes.store import by_num, pin, pinned, unpin
 
 
 # getmyancestors classes and functions
@@ -50,6 +64,7 @@ class Note:
     :param num: the GEDCOM identifier
     """
 
+    __slots__ = ("num", "text")
     counter = 0
 
     def __init__(self, text="", tree=None, num=None):
@@ -79,7 +94,9 @@ class Source:
     :param num: the GEDCOM identifier
     """
 
+    __slots__ = ("num", "tree", "url", "citation", "title", "fid", "_notes")
     counter = 0
+    notes = LazySet()
 
     def __init__(self, data=None, tree=None, num=None):
         if num:
@@ -90,7 +107,6 @@ class Source:
 
         self.tree = tree
         self.url = self.citation = self.title = self.fid = None
-        self.notes = set()
         if data:
             self.fid = data["id"]
             if "about" in data:
@@ -131,6 +147,8 @@ class Fact:
     :param tree: a tree object
     """
 
+    __slots__ = ("value", "type", "date", "place", "note", "map")
+
     def __init__(self, data=None, tree=None):
         self.value = self.type = self.date = self.place = self.note = self.map = None
         if data:
@@ -149,9 +167,13 @@ class Fact:
             if "place" in data:
                 place = data["place"]
                 self.place = place["original"]
-                if "description" in place and place["description"][1:] in tree.places:
+                if (
+                    tree.projection.places
+                    and "description" in place
+                    and place["description"][1:] in tree.places
+                ):
                     self.map = tree.places[place["description"][1:]]
-            if "changeMessage" in data["attribution"]:
+            if tree.projection.notes and "changeMessage" in data["attribution"]:
                 self.note = Note(data["attribution"]["changeMessage"], tree)
             if self.type == "http://gedcomx.org/Death" and not (
                 self.date or self.place
@@ -215,6 +237,8 @@ class Name:
     :param tree: a Tree object
     """
 
+    __slots__ = ("given", "surname", "prefix", "suffix", "note")
+
     def __init__(self, data=None, tree=None):
         self.given = ""
         self.surname = ""
@@ -232,7 +256,7 @@ class Name:
                         self.prefix = z["value"]
                     if z["type"] == "http://gedcomx.org/Suffix":
                         self.suffix = z["value"]
-            if "changeMessage" in data["attribution"]:
+            if tree.projection.notes and "changeMessage" in data["attribution"]:
                 self.note = Note(data["attribution"]["changeMessage"], tree)
 
     def print(self, file=sys.stdout, typ=None):
@@ -286,9 +310,28 @@ class Indi:
     :param fid' FamilySearch id
     :param tree: a tree object
     :param num: the GEDCOM identifier
+    The sets of an individual are created when they are first changed.
     """
 
+    __slots__ = (
+        "num", "fid", "tree", "name", "gender", "living", "modified",
+        "baptism", "confirmation", "initiatory", "endowment", "sealing_child",
+        "_famc_fid", "_fams_fid", "_famc_num", "_fams_num", "_nicknames", "_facts",
+        "_birthnames", "_married", "_aka", "_notes", "_sources", "_memories",
+    )  # fmt: skip
     counter = 0
+    famc_fid = LazySet()
+    fams_fid = LazySet()
+    famc_num = LazySet()
+    fams_num = LazySet()
+    nicknames = LazySet()
+    facts = LazySet()
+    birthnames = LazySet()
+    married = LazySet()
+    aka = LazySet()
+    notes = LazySet()
+    sources = LazySet()
+    memories = LazySet()
 
     def __init__(self, fid=None, tree=None, num=None):
         if num:
@@ -298,54 +341,73 @@ class Indi:
             self.num = Indi.counter
         self.fid = fid
         self.tree = tree
-        self.famc_fid = set()
-        self.fams_fid = set()
-        self.famc_num = set()
-        self.fams_num = set()
         self.name = None
         self.gender = None
         self.living = None
-        self.parents = set()
-        self.spouses = set()
-        self.children = set()
+        self.modified = None
         self.baptism = self.confirmation = self.initiatory = None
         self.endowment = self.sealing_child = None
-        self.nicknames = set()
-        self.facts = set()
-        self.birthnames = set()
-        self.married = set()
-        self.aka = set()
-        self.notes = set()
-        self.sources = set()
-        self.memories = set()
+
+    @property
+    def parents(self):
+        """iterate the (father, mother) couples of the parents of the
+        individual, from the relationships graph of the tree
+        """
+        return self.tree.graph.parents(self.fid)
+
+    @property
+    def children(self):
+        """iterate the (father, mother, child) trios of the children"""
+        return self.tree.graph.children(self.fid)
+
+    @property
+    def spouses(self):
+        """iterate the (person1, person2, relationship id) couples"""
+        return self.tree.graph.spouses(self.fid)
 
     def add_data(self, data):
         """add FS individual data - SIMPLIFIED VERSION"""
         if data:
-            self.living = data["living"]
-            
-            # Only get the preferred name
-            for x in data["names"]:
-                if x["preferred"]:
-                    self.name = Name(x, self.tree)
+            self.parse_data(data)
+            for url, add in self.extra_urls(data):
+                add(self.tree.fs.get_url(url))
+
+    def parse_data(self, data):
+        """parse the FS individual data which requires no download,
+        keeping the fields of the projection of the tree
+        """
+        projection = self.tree.projection
+        self.living = data["living"]
+        self.modified = data.get("attribution", {}).get("modified")
+
+        for x in data["names"]:
+            if x["preferred"]:
+                self.name = Name(x, self.tree)
+                if projection.names == "preferred":
                     break
-            
-            # Only get gender
-            if "gender" in data:
-                if data["gender"]["type"] == "http://gedcomx.org/Male":
-                    self.gender = "M"
-                elif data["gender"]["type"] == "http://gedcomx.org/Female":
-                    self.gender = "F"
-                elif data["gender"]["type"] == "http://gedcomx.org/Unknown":
-                    self.gender = "U"
-            
-            # Only get birth and death facts
-            if "facts" in data:
-                for x in data["facts"]:
-                    if x["type"] == "http://gedcomx.org/Birth" or x["type"] == "http://gedcomx.org/Death":
-                        self.facts.add(Fact(x, self.tree))
-                    elif x["type"] == "http://familysearch.org/v1/LifeSketch":
-                        # Keep life sketch as it contains the brief history/bio
+            elif x["type"] == "http://gedcomx.org/Nickname":
+                self.nicknames.add(Name(x, self.tree))
+            elif x["type"] == "http://gedcomx.org/BirthName":
+                self.birthnames.add(Name(x, self.tree))
+            elif x["type"] == "http://gedcomx.org/AlsoKnownAs":
+                self.aka.add(Name(x, self.tree))
+            elif x["type"] == "http://gedcomx.org/MarriedName":
+                self.married.add(Name(x, self.tree))
+
+        # Only get gender
+        if "gender" in data:
+            if data["gender"]["type"] == "http://gedcomx.org/Male":
+                self.gender = "M"
+            elif data["gender"]["type"] == "http://gedcomx.org/Female":
+                self.gender = "F"
+            elif data["gender"]["type"] == "http://gedcomx.org/Unknown":
+                self.gender = "U"
+
+        if "facts" in data:
+            for x in data["facts"]:
+                if x["type"] == LIFE_SKETCH:
+                    # Keep life sketch as it contains the brief history/bio
+                    if projection.notes:
                         self.notes.add(
                             Note(
                                 "=== %s ===\n%s"
@@ -353,60 +415,75 @@ class Indi:
                                 self.tree,
                             )
                         )
-            
-            # Only get Wikipedia sources - IMPLEMENTED
-            if "sources" in data and hasattr(self.tree, 'get_wikipedia_sources') and self.tree.get_wikipedia_sources:
-                sources = self.tree.fs.get_url(
-                    "/platform/tree/persons/%s/sources" % self.fid
-                )
-                if sources:
-                    quotes = dict()
-                    for quote in sources["persons"][0]["sources"]:
-                        quotes[quote["descriptionId"]] = (
-                            quote["attribution"]["changeMessage"]
-                            if "changeMessage" in quote["attribution"]
-                            else None
-                        )
-                    for source in sources["sourceDescriptions"]:
-                        # Check if this is a Wikipedia source
-                        is_wikipedia = False
-                        if "about" in source:
-                            url = source["about"].lower()
-                            if "wikipedia" in url or "wiki" in url:
-                                is_wikipedia = True
-                        if "titles" in source:
-                            title = source["titles"][0]["value"].lower()
-                            if "wikipedia" in title or "wiki" in title:
-                                is_wikipedia = True
-                        if "citations" in source:
-                            citation = source["citations"][0]["value"].lower()
-                            if "wikipedia" in citation or "wiki" in citation:
-                                is_wikipedia = True
-                        
-                        # Only add Wikipedia sources
-                        if is_wikipedia:
-                            if source["id"] not in self.tree.sources:
-                                self.tree.sources[source["id"]] = Source(source, self.tree)
-                            self.sources.add(
-                                (self.tree.sources[source["id"]], quotes[source["id"]])
-                            )
-            
-            # Only get text-based memories (bios/histories), ignore photos/documents
+                elif projection.fact(x["type"]):
+                    self.facts.add(Fact(x, self.tree))
+
+    def extra_urls(self, data):
+        """list the additional downloads required by the FS individual data
+        :return: a list of (url, function to add the downloaded data)
+        """
+        urls = list()
+        projection = self.tree.projection
+        # Only get Wikipedia sources - IMPLEMENTED
+        if projection.sources and "sources" in data:
+            urls.append(
+                ("/platform/tree/persons/%s/sources" % self.fid, self.add_sources)
+            )
+        if projection.memories:
             for evidence in data.get("evidence", []):
                 memory_id, *_ = evidence["id"].partition("-")
-                url = "/platform/memories/memories/%s" % memory_id
-                memorie = self.tree.fs.get_url(url)
-                if memorie and "sourceDescriptions" in memorie:
-                    for x in memorie["sourceDescriptions"]:
-                        # Only get text-based memories (bios/histories)
-                        if x["mediaType"] == "text/plain":
-                            text = "\n".join(
-                                val.get("value", "")
-                                for val in x.get("titles", [])
-                                + x.get("descriptions", [])
-                            )
-                            if text.strip():  # Only add if there's actual content
-                                self.notes.add(Note(text, self.tree))
+                urls.append(
+                    ("/platform/memories/memories/%s" % memory_id, self.add_memorie)
+                )
+        return urls
+
+    def add_sources(self, sources):
+        """add the Wikipedia sources of the individual"""
+        if sources:
+            quotes = dict()
+            for quote in sources["persons"][0]["sources"]:
+                quotes[quote["descriptionId"]] = (
+                    quote["attribution"]["changeMessage"]
+                    if "changeMessage" in quote["attribution"]
+                    else None
+                )
+            for source in sources["sourceDescriptions"]:
+                # Check if this is a Wikipedia source
+                is_wikipedia = False
+                if "about" in source:
+                    url = source["about"].lower()
+                    if "wikipedia" in url or "wiki" in url:
+                        is_wikipedia = True
+                if "titles" in source:
+                    title = source["titles"][0]["value"].lower()
+                    if "wikipedia" in title or "wiki" in title:
+                        is_wikipedia = True
+                if "citations" in source:
+                    citation = source["citations"][0]["value"].lower()
+                    if "wikipedia" in citation or "wiki" in citation:
+                        is_wikipedia = True
+
+                # Only add Wikipedia sources
+                if is_wikipedia:
+                    if source["id"] not in self.tree.sources:
+                        self.tree.sources[source["id"]] = Source(source, self.tree)
+                    self.sources.add(
+                        (self.tree.sources[source["id"]], quotes[source["id"]])
+                    )
+
+    def add_memorie(self, memorie):
+        """add the text-based memories (bios/histories), ignore photos/documents"""
+        if memorie and "sourceDescriptions" in memorie:
+            for x in memorie["sourceDescriptions"]:
+                # Only get text-based memories (bios/histories)
+                if x["mediaType"] == "text/plain":
+                    text = "\n".join(
+                        val.get("value", "")
+                        for val in x.get("titles", [])
+                        + x.get("descriptions", [])
+                    )
+                    if text.strip():  # Only add if there's actual content
+                        self.notes.add(Note(text, self.tree))
 
     def add_fams(self, fams):
         """add family fid (for spouse or parent)"""
@@ -418,7 +495,18 @@ class Indi:
 
     def get_notes(self):
         """retrieve individual notes - SIMPLIFIED VERSION"""
-        notes = self.tree.fs.get_url("/platform/tree/persons/%s/notes" % self.fid)
+        self.add_notes(
+            self.tree.fs.get_url("/platform/tree/persons/%s/notes" % self.fid)
+        )
+
+    async def get_notes_async(self):
+        """retrieve individual notes through the AsyncSession of the tree"""
+        self.add_notes(
+            await self.tree.afs.get_url("/platform/tree/persons/%s/notes" % self.fid)
+        )
+
+    def add_notes(self, notes):
+        """add the downloaded individual notes"""
         if notes:
             for n in notes["persons"][0]["notes"]:
                 # Only get notes that have actual content and aren't contributor lists
@@ -474,6 +562,14 @@ class Indi:
         file.write("0 @I%s@ INDI\n" % self.num)
         if self.name:
             self.name.print(file)
+        for o in self.nicknames:
+            file.write(cont("2 NICK %s %s" % (o.given, o.surname)))
+        for o in self.birthnames:
+            o.print(file)
+        for o in self.aka:
+            o.print(file, "aka")
+        for o in self.married:
+            o.print(file, "married")
         if self.gender:
             file.write("1 SEX %s\n" % self.gender)
         for o in self.facts:
@@ -497,9 +593,20 @@ class Fam:
     :param wife: wife fid
     :param tree: a Tree object
     :param num: a GEDCOM identifier
+    The sets of a family are created when they are first changed.
     """
 
+    __slots__ = (
+        "num", "husb_fid", "wife_fid", "tree", "husb_num", "wife_num", "fid",
+        "modified", "sealing_spouse",
+        "_facts", "_chil_fid", "_chil_num", "_notes", "_sources",
+    )  # fmt: skip
     counter = 0
+    facts = LazySet()
+    chil_fid = LazySet()
+    chil_num = LazySet()
+    notes = LazySet()
+    sources = LazySet()
 
     def __init__(self, husb=None, wife=None, tree=None, num=None):
         if num:
@@ -510,13 +617,8 @@ class Fam:
         self.husb_fid = husb if husb else None
         self.wife_fid = wife if wife else None
         self.tree = tree
-        self.husb_num = self.wife_num = self.fid = None
-        self.facts = set()
+        self.husb_num = self.wife_num = self.fid = self.modified = None
         self.sealing_spouse = None
-        self.chil_fid = set()
-        self.chil_num = set()
-        self.notes = set()
-        self.sources = set()
 
     def add_child(self, child):
         """add a child fid to the family"""
@@ -528,15 +630,32 @@ class Fam:
         :param fid: the marriage fid
         """
         if not self.fid:
+            if self.tree.projection.marriages():
+                url = "/platform/tree/couple-relationships/%s" % fid
+                self.add_marriage_data(self.tree.fs.get_url(url))
+            # set once the marriage is added: an interrupted download adds it again
+            self.fid = fid
+
+    async def add_marriage_async(self, fid):
+        """retrieve and add marriage information through the AsyncSession
+        of the tree
+        :param fid: the marriage fid
+        """
+        if not self.fid:
+            if self.tree.projection.marriages():
+                url = "/platform/tree/couple-relationships/%s" % fid
+                self.add_marriage_data(await self.tree.afs.get_url(url))
             self.fid = fid
-            url = "/platform/tree/couple-relationships/%s" % self.fid
-            data = self.tree.fs.get_url(url)
-            if data:
-                # Only get marriage facts (date/place)
-                if "facts" in data["relationships"][0]:
-                    for x in data["relationships"][0]["facts"]:
-                        if x["type"] == "http://gedcomx.org/Marriage":
-                            self.facts.add(Fact(x, self.tree))
+
+    def add_marriage_data(self, data):
+        """add the downloaded marriage information"""
+        if data:
+            relationship = data["relationships"][0]
+            self.modified = relationship.get("attribution", {}).get("modified")
+            if "facts" in relationship:
+                for x in relationship["facts"]:
+                    if self.tree.projection.marriage_fact(x["type"]):
+                        self.facts.add(Fact(x, self.tree))
 
     def get_notes(self):
         """retrieve marriage notes - SIMPLIFIED VERSION"""
@@ -563,85 +682,345 @@ class Fam:
             file.write("1 _FSFTID %s\n" % self.fid)
 
 
+def ascendancy_generation(person):
+    """return the generation of a person of an ancestry response
+    (the ascendancy numbers are those of an Ahnentafel list)
+    """
+    number = person.get("display", {}).get("ascendancyNumber", "")
+    return int(number).bit_length() - 1 if number.isdigit() else None
+
+
+def descendancy_generation(person):
+    """return the generation of a descendant of a descendancy response
+    (1, 1.1, 1.1.2...), None for the spouses (1-S, 1.2-S...): they are
+    downloaded as other parents of the children
+    """
+    number = person.get("display", {}).get("descendancyNumber", "")
+    if not number or "-" in number:
+        return None
+    return number.count(".")
+
+
 class Tree:
     """family tree class
     :param fs: a Session object
+    :param afs: an AsyncSession object, to download without threads
+    :param batches: the number of persons batches downloaded concurrently
+    :param sizer: a BatchSizer object, to adapt the size of the batches
+    :param projection: a Projection object, the data to download and keep
+    :param store: a SqliteStore object, to keep the individuals, families,
+                  notes and sources in a database instead of memory
     """
 
-    def __init__(self, fs=None, get_wikipedia_sources=False):
+    # the name of the program in the GEDCOM header
+    program = "getmyancestors"
+
+    def __init__(
+        self,
+        fs=None,
+        projection=FULL,
+        afs=None,
+        batches=MAX_BATCHES,
+        sizer=None,
+        store=None,
+    ):
         self.fs = fs
+        self.afs = afs
+        self.batches = batches
+        self.sizer = sizer or BatchSizer(metrics=fs.metrics if fs else None)
+        self.loop = None
         self.indi = dict()
         self.fam = dict()
         self.notes = list()
         self.sources = dict()
         self.places = dict()
+        self.graph = Graph()
+        # the fids of the individuals whose sources and memories
+        # are not added yet
+        self.pending = set()
+        # a Checkpoint, saved from time to time as the persons are downloaded
+        self.checkpoint = None
+        # the individuals and families of a snapshot which did not change
+        self.unchanged = dict()
+        self.unchanged_fam = dict()
+        self.reused = set()
+        # the persons data of the changed individuals, read by check_changes
+        self.refreshed = dict()
+        # the fids of the persons batches given up after the retries
+        self.failed = set()
+        self.store = store
+        if store:
+            store.attach(self)
         self.display_name = self.lang = None
-        self.get_wikipedia_sources = get_wikipedia_sources
+        self.projection = projection
         if fs:
             self.display_name = fs.display_name
             self.lang = babelfish.Language.fromalpha2(fs.lang).name
 
+    def run(self, coro):
+        """run a coroutine in the event loop of the tree"""
+        if not self.loop:
+            self.loop = asyncio.new_event_loop()
+            if self.fs:
+                # one thread per kept-alive connection of the session
+                self.loop.set_default_executor(ThreadPoolExecutor(self.fs.workers))
+        asyncio.set_event_loop(self.loop)
+        return self.loop.run_until_complete(coro)
+
+    async def get_url(self, url, fail_fast=False, headers=None):
+        """retrieve JSON structure from a FamilySearch URL
+        with the AsyncSession, or with the Session in a thread
+        :param fail_fast: see Session.get_url
+        :param headers: the request headers, instead of the default ones
+        """
+        if self.afs:
+            return await self.afs.get_url(url, headers, fail_fast=fail_fast)
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(self.fs.get_url, url, headers, fail_fast=fail_fast),
+        )
+
+    def check_changes(self):
+        """set aside the individuals and families of a snapshot loaded in
+        the tree, keeping those which did not change for reuse: the
+        individuals are read again in batches of persons, which give their
+        modification time and their current relationships, and the changed
+        ones are kept to be added without another download; the families
+        are checked with a conditional request on their modification time,
+        which FamilySearch answers without data (304) if they did not change
+        :return: the fids of the changed individuals
+        """
+
+        async def unchanged(url, modified, fetches):
+            if not modified:
+                return False
+            headers = {
+                "Accept": "application/x-gedcomx-v1+json",
+                "If-Modified-Since": formatdate(modified / 1000, usegmt=True),
+            }
+            async with fetches:
+                return await self.get_url(url, headers=headers) == NOT_MODIFIED
+
+        async def check(urls):
+            fetches = asyncio.Semaphore(MAX_FETCHES)
+            return await asyncio.gather(*(unchanged(*url, fetches) for url in urls))
+
+        async def read(batch, semaphore, times):
+            # the current data, not the cached one
+            headers = {
+                "Accept": "application/x-gedcomx-v1+json",
+                "Cache-Control": "no-cache",
+            }
+            async with semaphore:
+                data = await self.get_url(
+                    "/platform/tree/persons?pids=" + ",".join(batch), headers=headers
+                )
+            if not data:
+                return
+            graph.add_relationships(data)
+            for fid, piece in person_slices(data):
+                person = piece["persons"][0]
+                times[fid] = person.get("attribution", {}).get("modified")
+                indi = self.indi.get(fid)
+                if not (indi and indi.modified and times[fid] == indi.modified):
+                    self.refreshed[fid] = piece
+
+        async def check_batches(indis):
+            semaphore = asyncio.Semaphore(self.batches)
+            times = dict()
+            await asyncio.gather(
+                *(
+                    read(batch, semaphore, times)
+                    for batch in self.sizer.split(sorted(x.fid for x in indis))
+                )
+            )
+            return [bool(x.modified) and times.get(x.fid) == x.modified for x in indis]
+
+        indis = list(self.indi.values())
+        fams = [(key, fam) for key, fam in self.fam.items() if fam.fid]
+        graph = Graph()
+        self.refreshed = dict()
+        same_indis = self.run(check_batches(indis))
+        same_fams = self.run(
+            check(
+                ("/platform/tree/couple-relationships/%s" % x.fid, x.modified)
+                for _, x in fams
+            )
+        )
+        self.unchanged = {x.fid: x for x, same in zip(indis, same_indis) if same}
+        # the families without couple relationship have nothing to download
+        self.unchanged_fam = {key: fam for key, fam in self.fam.items() if not fam.fid}
+        self.unchanged_fam.update(fam for fam, same in zip(fams, same_fams) if same)
+        # the current relationships, new ones of the unchanged individuals too
+        self.graph = graph.restricted(self.unchanged)
+        self.indi, self.fam, self.notes, self.sources = dict(), dict(), list(), dict()
+        return {indi.fid for indi, same in zip(indis, same_indis) if not same}
+
+    def reuse(self, fid):
+        """add an unchanged individual of the snapshot to the tree,
+        return False if there is none
+        """
+        indi = self.unchanged.pop(fid, None)
+        if indi is None:
+            return False
+        indi.famc_fid, indi.fams_fid = set(), set()
+        self.indi[fid] = indi
+        self.reused.add(fid)
+        names = {indi.name} | indi.nicknames | indi.birthnames | indi.married | indi.aka
+        self.notes.extend(indi.notes)
+        self.notes.extend(x.note for x in names | indi.facts if x and x.note)
+        for source, _ in indi.sources:
+            self.sources[source.fid] = source
+            self.notes.extend(source.notes)
+        return True
+
     def add_indis(self, fids):
         """add individuals to the family tree
         :param fids: an iterable of fid
         """
+        self.run(self.add_indis_async(fids))
 
-        async def add_datas(loop, data):
-            futures = set()
+    async def add_indis_async(self, fids):
+        """add individuals to the family tree
+        :param fids: an iterable of fid
+        """
+
+        def add_datas(data):
+            """parse the persons in the event loop (CPU work only, a thread
+            per person costs more), return the fids of the persons with
+            downloads to add, and these downloads
+            """
+            added, extras = list(), list()
             for person in data["persons"]:
-                self.indi[person["id"]] = Indi(person["id"], self)
-                futures.add(
-                    loop.run_in_executor(None, self.indi[person["id"]].add_data, person)
-                )
-            for future in futures:
-                await future
-
-        new_fids = [fid for fid in fids if fid and fid not in self.indi]
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        while new_fids:
-            data = self.fs.get_url(
-                "/platform/tree/persons?pids=" + ",".join(new_fids[:MAX_PERSONS])
-            )
+                if person["id"] in self.indi:
+                    continue
+                # kept in memory by a store until the extras are added
+                pin(self.indi, person["id"])
+                indi = self.indi[person["id"]] = Indi(person["id"], self)
+                indi.parse_data(person)
+                urls = indi.extra_urls(person)
+                if urls:
+                    added.append(indi.fid)
+                    extras.extend(urls)
+                else:
+                    unpin(self.indi, indi.fid)
+            return added, extras
+
+        async def add_batch(batch):
+            url = "/platform/tree/persons?pids=" + ",".join(batch)
+            async with semaphore:
+                started = time.time()
+                try:
+                    data = await self.get_url(url, fail_fast=len(batch) > 1)
+                except RequestFailed:
+                    data = False
+            if data is False:
+                # download the halves instead of retrying the whole batch
+                self.sizer.failure(len(batch))
+                half = len(batch) // 2
+                await asyncio.gather(add_batch(batch[:half]), add_batch(batch[half:]))
+                return
+            if data is None and url in self.fs.abandoned:
+                # reported at the end of the download
+                self.failed.update(batch)
+                return
+            self.sizer.success(len(batch), time.time() - started, data)
+            # merged in the event loop thread, as each batch returns
             if data:
-                if "places" in data:
-                    for place in data["places"]:
-                        if place["id"] not in self.places:
-                            self.places[place["id"]] = (
-                                str(place["latitude"]),
-                                str(place["longitude"]),
-                            )
-                loop.run_until_complete(add_datas(loop, data))
-                if "childAndParentsRelationships" in data:
-                    for rel in data["childAndParentsRelationships"]:
-                        father = (
-                            rel["parent1"]["resourceId"] if "parent1" in rel else None
+                await add_data(data)
+
+        async def add_data(data):
+            """merge the data of a persons request into the tree"""
+            if "places" in data:
+                for place in data["places"]:
+                    if place["id"] not in self.places:
+                        self.places[place["id"]] = (
+                            str(place["latitude"]),
+                            str(place["longitude"]),
                         )
-                        mother = (
-                            rel["parent2"]["resourceId"] if "parent2" in rel else None
-                        )
-                        child = rel["child"]["resourceId"] if "child" in rel else None
-                        if child in self.indi:
-                            self.indi[child].parents.add((father, mother))
-                        if father in self.indi:
-                            self.indi[father].children.add((father, mother, child))
-                        if mother in self.indi:
-                            self.indi[mother].children.add((father, mother, child))
-                if "relationships" in data:
-                    for rel in data["relationships"]:
-                        if rel["type"] == "http://gedcomx.org/Couple":
-                            person1 = rel["person1"]["resourceId"]
-                            person2 = rel["person2"]["resourceId"]
-                            relfid = rel["id"]
-                            if person1 in self.indi:
-                                self.indi[person1].spouses.add(
-                                    (person1, person2, relfid)
-                                )
-                            if person2 in self.indi:
-                                self.indi[person2].spouses.add(
-                                    (person1, person2, relfid)
-                                )
-            new_fids = new_fids[MAX_PERSONS:]
+            added, extras = add_datas(data)
+            self.graph.add_relationships(data)
+            # the sources and memories, downloaded apart from the parsing
+            await self.add_extras(added, extras, fetches)
+            if self.checkpoint:
+                self.checkpoint.tick(self)
+
+        new_fids = {f for f in fids if f and f not in self.indi}
+        # sorted, so that a repeat run splits the same batches
+        new_fids = sorted(fid for fid in new_fids if not self.reuse(fid))
+        semaphore = asyncio.Semaphore(self.batches)
+        fetches = asyncio.Semaphore(MAX_FETCHES)
+        missing = list()
+        for batch in self.sizer.split(new_fids):
+            # read by check_changes, or cached one by one whatever their
+            # batches were
+            rest = [fid for fid in batch if fid not in self.refreshed]
+            found = [self.refreshed.pop(fid) for fid in batch if fid in self.refreshed]
+            if self.fs:
+                data, rest = self.fs.cached_persons(rest)
+                found.append(data or {})
+            missing.extend(rest)
+            data = merge_persons(found)
+            if data["persons"]:
+                await add_data(data)
+        new_fids = missing
+        await asyncio.gather(*map(add_batch, self.sizer.split(new_fids)))
+
+    async def add_extras(self, fids, extras, fetches):
+        """download the sources and memories of individuals, and add them
+        at once when they are all downloaded: until then the individuals
+        stay pending, and a checkpoint saved meanwhile has them downloaded
+        again when it is resumed
+        :param fids: the fids of the individuals, pinned until they are added
+        :param extras: a list of (url, function to add the downloaded data)
+        :param fetches: a semaphore limiting the concurrent downloads
+        """
+
+        async def fetch(url):
+            async with fetches:
+                return await self.get_url(url)
+
+        self.pending.update(fids)
+        try:
+            results = await asyncio.gather(*(fetch(url) for url, _ in extras))
+            for (_, add), res in zip(extras, results):
+                add(res)
+            self.pending.difference_update(fids)
+        finally:
+            for fid in fids:
+                unpin(self.indi, fid)
+
+    def add_pending(self):
+        """add the sources and memories of the pending individuals of an
+        interrupted download: their persons are downloaded again for the
+        urls of the extras
+        """
+
+        async def complete(batch, semaphore, fetches):
+            async with semaphore:
+                url = "/platform/tree/persons?pids=" + ",".join(batch)
+                data = await self.get_url(url)
+            extras = list()
+            for fid in batch:
+                pin(self.indi, fid)
+            for person in data["persons"] if data else ():
+                if person["id"] in self.pending and person["id"] in self.indi:
+                    extras.extend(self.indi[person["id"]].extra_urls(person))
+            # the persons gone from FamilySearch have nothing left to add
+            await self.add_extras(batch, extras, fetches)
+
+        async def download():
+            semaphore = asyncio.Semaphore(self.batches)
+            fetches = asyncio.Semaphore(MAX_FETCHES)
+            await asyncio.gather(
+                *(
+                    complete(batch, semaphore, fetches)
+                    for batch in self.sizer.split(sorted(self.pending))
+                )
+            )
+
+        if self.pending:
+            self.run(download())
 
     def add_fam(self, father, mother):
         """add a family to the family tree
@@ -649,7 +1028,13 @@ class Tree:
         :param mother: the mother fid or None
         """
         if (father, mother) not in self.fam:
-            self.fam[(father, mother)] = Fam(father, mother, self)
+            fam = self.unchanged_fam.pop((father, mother), None)
+            if fam:
+                fam.chil_fid = set()
+                self.notes.extend(x.note for x in fam.facts if x.note)
+                self.fam[(father, mother)] = fam
+            else:
+                self.fam[(father, mother)] = Fam(father, mother, self)
 
     def add_trio(self, father, mother, child):
         """add a children relationship to the family tree
@@ -670,46 +1055,232 @@ class Tree:
         """add parents relationships
         :param fids: a set of fids
         """
-        parents = set()
-        for fid in fids & self.indi.keys():
-            for couple in self.indi[fid].parents:
-                parents |= set(couple)
+        parents = self.graph.parent_fids(fids & self.indi.keys())
         if parents:
             self.add_indis(parents)
         for fid in fids & self.indi.keys():
-            for father, mother in self.indi[fid].parents:
-                if (
-                    mother in self.indi
-                    and father in self.indi
-                    or not father
-                    and mother in self.indi
-                    or not mother
-                    and father in self.indi
-                ):
-                    self.add_trio(father, mother, fid)
-        return set(filter(None, parents))
+            self.link_parents(fid)
+        return parents
+
+    def link_parents(self, fid):
+        """add the families of the downloaded parents of an individual"""
+        for father, mother in self.graph.parents(fid):
+            if (
+                mother in self.indi
+                and father in self.indi
+                or not father
+                and mother in self.indi
+                or not mother
+                and father in self.indi
+            ):
+                self.add_trio(father, mother, fid)
+
+    def link_children(self, fid):
+        """add the families of the downloaded children of an individual"""
+        for father, mother, child in self.graph.children(fid):
+            if child in self.indi and (
+                mother in self.indi
+                and father in self.indi
+                or not father
+                and mother in self.indi
+                or not mother
+                and father in self.indi
+            ):
+                self.add_trio(father, mother, child)
+
+    def parent_fids(self, fid):
+        """return the fids to download and to traverse for the ancestors"""
+        parents = self.graph.parent_fids((fid,))
+        return parents, parents
+
+    def child_fids(self, fid):
+        """return the fids to download (children and their other parent)
+        and to traverse (children) for the descendants
+        """
+        relatives, children = set(), set()
+        for father, mother, child in self.graph.children(fid):
+            relatives |= set(filter(None, (father, mother, child)))
+            if child:
+                children.add(child)
+        return relatives, children
+
+    def add_ancestors(self, fids, generations):
+        """add the ancestors of individuals, without waiting for a whole
+        generation before downloading the next one
+        :param fids: an iterable of fid
+        :param generations: the number of generations to ascend
+        """
+        for fid in self.run(self.traverse(fids, generations, self.parent_fids)):
+            self.link_parents(fid)
+
+    def add_descendants(self, fids, generations):
+        """add the descendants of individuals, without waiting for a whole
+        generation before downloading the next one
+        :param fids: an iterable of fid
+        :param generations: the number of generations to descend
+        """
+        for fid in self.run(self.traverse(fids, generations, self.child_fids)):
+            self.link_children(fid)
+
+    def add_pedigree(self, fids, generations):
+        """add the ancestors of individuals: they are found with ancestry
+        requests of up to MAX_ANCESTRY_GENERATIONS generations, downloaded in
+        batches, then add_ancestors links them and downloads the ancestors
+        missing from the ancestry responses
+        :param fids: an iterable of fid
+        :param generations: the number of generations to ascend
+        """
+        fids = [fid for fid in fids if fid]
+        depth = self.run(
+            self.bulk(
+                fids,
+                generations,
+                "/platform/tree/ancestry?person=%s&generations=%s",
+                MAX_ANCESTRY_GENERATIONS,
+                ascendancy_generation,
+            )
+        )
+        self.add_indis(depth)
+        self.add_ancestors(fids, generations)
+
+    def add_descendancy(self, fids, generations):
+        """add the descendants of individuals: they are found with
+        descendancy requests of up to MAX_DESCENDANCY_GENERATIONS generations,
+        downloaded in batches, then add_descendants links them with add_trio
+        and downloads the other parents of the children and the descendants
+        missing from the descendancy responses
+        :param fids: an iterable of fid
+        :param generations: the number of generations to descend
+        """
+        fids = [fid for fid in fids if fid]
+        depth = self.run(
+            self.bulk(
+                fids,
+                generations,
+                "/platform/tree/descendancy?person=%s&generations=%s",
+                MAX_DESCENDANCY_GENERATIONS,
+                descendancy_generation,
+            )
+        )
+        self.add_indis(depth)
+        self.add_descendants(fids, generations)
+
+    async def bulk(self, fids, generations, url, steps, relative):
+        """return the relatives of individuals found in ancestry or
+        descendancy responses and their generation, up to generations from
+        the individuals; the requests start again from the last generation
+        of the responses until generations are reached
+        :param fids: an iterable of fid
+        :param url: the endpoint URL, formatted with a fid and generations
+        :param steps: the maximum number of generations of a request
+        :param relative: a function returning the generation of a person of
+                         a response from the requested person, or None
+        """
+        depth = dict()
+        seeds = {fid: 0 for fid in fids}
+        while seeds:
+            seeds = list(seeds.items())
+            responses = await asyncio.gather(
+                *(
+                    self.get_url(url % (fid, min(steps, generations - d)))
+                    for fid, d in seeds
+                )
+            )
+            frontier = dict()
+            for (fid, d), data in zip(seeds, responses):
+                for person in data["persons"] if data else ():
+                    step = relative(person)
+                    if step is None:
+                        continue
+                    generation = d + step
+                    if generation < depth.get(person["id"], generations + 1):
+                        depth[person["id"]] = generation
+                        if step == steps and generation < generations:
+                            frontier[person["id"]] = generation
+            seeds = {fid: d for fid, d in frontier.items() if depth[fid] == d}
+        return depth
+
+    async def traverse(self, fids, generations, relatives):
+        """download the relatives of individuals with a work queue:
+        the relatives of an individual are scheduled as soon as its batch
+        is downloaded, up to a number of generations from the starting
+        individuals in each lineage
+        :param fids: an iterable of fid
+        :param relatives: parent_fids or child_fids
+        :return: the fids whose relatives were added
+        """
+        depth = dict()
+        queue = deque()
+        queued = set()
+        batches = dict()
+        expanded = set()
+
+        def fetch(fid):
+            if fid not in self.indi and fid not in queued and not self.reuse(fid):
+                queued.add(fid)
+                queue.append(fid)
+
+        def reach(fid, generation):
+            # a shorter lineage through a collapsed pedigree goes further
+            if depth.get(fid, generations + 1) <= generation:
+                return
+            depth[fid] = generation
+            if fid in self.indi or self.reuse(fid):
+                expand(fid)
+            else:
+                fetch(fid)
+
+        def expand(fid):
+            if depth[fid] >= generations:
+                return
+            expanded.add(fid)
+            download, following = relatives(fid)
+            for relative in download:
+                fetch(relative)
+            for relative in following:
+                reach(relative, depth[fid] + 1)
+
+        for fid in fids:
+            if fid:
+                reach(fid, 0)
+        while queue or batches:
+            while queue and len(batches) < self.batches:
+                size = min(self.sizer.size, len(queue))
+                batch = [queue.popleft() for _ in range(size)]
+                batches[asyncio.ensure_future(self.add_indis_async(batch))] = batch
+            done, _ = await asyncio.wait(batches, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+                for fid in batches.pop(task):
+                    if fid in self.indi and fid in depth:
+                        expand(fid)
+        return expanded
 
     def add_spouses(self, fids):
         """add spouse relationships
         :param fids: a set of fid
         """
 
-        async def add(loop, rels):
-            futures = set()
-            for father, mother, relfid in rels:
-                if (father, mother) in self.fam:
-                    futures.add(
-                        loop.run_in_executor(
-                            None, self.fam[(father, mother)].add_marriage, relfid
-                        )
-                    )
-            for future in futures:
-                await future
+        async def marry(key, relfid):
+            with pinned(self.fam, key) as fam:
+                if self.afs:
+                    await fam.add_marriage_async(relfid)
+                else:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(None, fam.add_marriage, relfid)
+
+        async def add(rels):
+            await asyncio.gather(
+                *(
+                    marry((father, mother), relfid)
+                    for father, mother, relfid in rels
+                    if (father, mother) in self.fam
+                )
+            )
 
         rels = set()
         for fid in fids & self.indi.keys():
-            rels |= self.indi[fid].spouses
-        loop = asyncio.get_event_loop()
+            rels.update(self.graph.spouses(fid))
         if rels:
             self.add_indis(
                 set.union(*({father, mother} for father, mother, relfid in rels))
@@ -719,7 +1290,7 @@ class Tree:
                     self.indi[father].add_fams((father, mother))
                     self.indi[mother].add_fams((father, mother))
                     self.add_fam(father, mother)
-            loop.run_until_complete(add(loop, rels))
+            self.run(add(rels))
 
     def add_children(self, fids):
         """add children relationships
@@ -727,7 +1298,7 @@ class Tree:
         """
         rels = set()
         for fid in fids & self.indi.keys():
-            rels |= self.indi[fid].children if fid in self.indi else set()
+            rels.update(self.graph.children(fid))
         children = set()
         if rels:
             self.add_indis(set.union(*(set(rel) for rel in rels)))
@@ -744,6 +1315,36 @@ class Tree:
                     children.add(child)
         return children
 
+    def get_notes(self):
+        """retrieve the notes of all individuals, but the reused ones,
+        unless the projection of the tree leaves the notes out
+        """
+
+        async def add_notes(fid, semaphore):
+            # the individuals in memory are those downloading their notes
+            async with semaphore:
+                with pinned(self.indi, fid) as indi:
+                    if self.afs:
+                        await indi.get_notes_async()
+                    else:
+                        loop = asyncio.get_running_loop()
+                        await loop.run_in_executor(None, indi.get_notes)
+
+        async def download():
+            semaphore = asyncio.Semaphore(
+                self.afs.max_in_flight if self.afs else self.fs.workers
+            )
+            await asyncio.gather(
+                *(
+                    add_notes(fid, semaphore)
+                    for fid in list(self.indi)
+                    if fid not in self.reused
+                )
+            )
+
+        if self.projection.notes:
+            self.run(download())
+
     def add_ordinances(self, fid):
         """retrieve ordinances
         :param fid: an individual fid
@@ -782,9 +1383,9 @@ class Tree:
         file.write("1 GEDC\n")
         file.write("2 VERS 5.5.1\n")
         file.write("2 FORM LINEAGE-LINKED\n")
-        file.write("1 SOUR getmyancestors\n")
+        file.write("1 SOUR %s\n" % self.program)
         file.write("2 VERS %s\n" % getmyancestors.__version__)
-        file.write("2 NAME getmyancestors\n")
+        file.write("2 NAME %s\n" % self.program)
         file.write("1 DATE %s\n" % time.strftime("%d %b %Y"))
         file.write("2 TIME %s\n" % time.strftime("%H:%M:%S"))
         file.write("1 SUBM @SUBM@\n")
@@ -792,17 +1393,16 @@ class Tree:
         file.write("1 NAME %s\n" % self.display_name)
         file.write("1 LANG %s\n" % self.lang)
 
-        for fid in sorted(self.indi, key=lambda x: self.indi.__getitem__(x).num):
-            self.indi[fid].print(file)
-        for husb, wife in sorted(self.fam, key=lambda x: self.fam.__getitem__(x).num):
-            self.fam[(husb, wife)].print(file)
-        sources = sorted(self.sources.values(), key=lambda x: x.num)
-        for s in sources:
+        for indi in by_num(self.indi):
+            indi.print(file)
+        for fam in by_num(self.fam):
+            fam.print(file)
+        for s in by_num(self.sources):
             s.print(file)
-        notes = sorted(self.notes, key=lambda x: x.num)
-        for i, n in enumerate(notes):
-            if i > 0:
-                if n.num == notes[i - 1].num:
-                    continue
-            n.print(file)
+        num = None
+        for n in by_num(self.notes):
+            # a note may be added several times
+            if n.num != num:
+                n.print(file)
+            num = n.num
         file.write("0 TRLR\n")
@@ -0,0 +1,352 @@
+# coding: utf-8
+
+# global imports
+import re
+import sys
+import json
+import time
+import random
+import secrets
+import argparse
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# local imports
+from getmyancestors.classes.synthetic import SyntheticTree
+
+ROUTES = (
+    ("persons", re.compile(r"/platform/tree/persons$")),
+    ("ancestry", re.compile(r"/platform/tree/ancestry$")),
+    ("descendancy", re.compile(r"/platform/tree/descendancy$")),
+    ("notes", re.compile(r"/platform/tree/persons/([^/]+)/notes$")),
+    ("sources", re.compile(r"/platform/tree/persons/([^/]+)/sources$")),
+    ("person", re.compile(r"/platform/tree/persons/([^/]+)$")),
+    ("couple", re.compile(r"/platform/tree/couple-relationships/([^/]+)$")),
+    ("memory", re.compile(r"/platform/memories/memories/([^/]+)$")),
+    ("user", re.compile(r"/platform/users/current$")),
+)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """answer the subset of the FamilySearch API used by getmyancestors"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+    def send(self, status, data=None, headers=None):
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if data is not None:
+            self.send_header("Content-Type", "application/x-gedcomx-v1+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_modified(self, modified, data):
+        """send data with its modification time (in milliseconds),
+        or 304 if it did not change since the If-Modified-Since header
+        :param data: a function returning the data
+        """
+        seconds = modified // 1000
+        headers = {"Last-Modified": formatdate(seconds, usegmt=True)}
+        since = self.headers.get("If-Modified-Since")
+        try:
+            unchanged = since and parsedate_to_datetime(since).timestamp() >= seconds
+        except (TypeError, ValueError):
+            unchanged = False
+        if unchanged:
+            return self.send(304, None, headers)
+        self.send(200, data(), headers)
+
+    def read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        return {k: v[0] for k, v in form.items()}
+
+    def cookie(self, name):
+        for item in (self.headers.get("Cookie") or "").split(";"):
+            key, _, value = item.strip().partition("=")
+            if key == name:
+                return value
+        return None
+
+    def do_POST(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        form = self.read_form()
+        if path == "/login":
+            if form.get("_csrf") != server.xsrf or not form.get("username"):
+                return self.send(401)
+            session = secrets.token_hex(8)
+            return self.send(
+                200, {}, {"Set-Cookie": "fssessionid=%s; Path=/" % session}
+            )
+        if path == "/cis-web/oauth2/v3/token":
+            if form.get("code") not in server.codes:
+                return self.send(400, {"error": "invalid_grant"})
+            server.codes.discard(form["code"])
+            return self.send(
+                200,
+                {
+                    "access_token": server.new_token(),
+                    "token_type": "Bearer",
+                    "expires_in": server.token_lifetime,
+                },
+            )
+        self.send(404)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        path, query = parts.path, parse_qs(parts.query)
+        if path == "/auth/familysearch/login":
+            cookie = "XSRF-TOKEN=%s; Path=/" % server.xsrf
+            return self.send(200, {}, {"Set-Cookie": cookie})
+        if path == "/cis-web/oauth2/v3/authorization":
+            # redirect to the stand-in itself instead of redirect_uri
+            code = secrets.token_hex(8)
+            server.codes.add(code)
+            location = "/cis-web/oauth2/v3/authorized?code=" + code
+            return self.send(302, None, {"Location": location})
+        if path == "/cis-web/oauth2/v3/authorized":
+            return self.send(200, {})
+        if "redirected" not in query and server.random() < server.redirect_rate:
+            # as FamilySearch answers for a merged person
+            location = self.path + ("&" if parts.query else "?") + "redirected=1"
+            return self.send(301, None, {"Location": location})
+        self.api(path, query)
+
+    def api(self, path, query):
+        server = self.server
+        tree = server.tree
+        if server.latency:
+            time.sleep(server.latency * (0.5 + server.random()))
+        if not server.valid_token(self.headers.get("Authorization")):
+            return self.send(401)
+        if server.random() < server.throttle_rate:
+            return self.send(429, None, {"Retry-After": "1"})
+        if server.random() < server.error_rate:
+            return self.send(503)
+        for name, regex in ROUTES:
+            match = regex.match(path)
+            if match:
+                break
+        else:
+            return self.send(404)
+        if name == "persons":
+            pids = ",".join(query.get("pids", [])).split(",")
+            if server.max_batch and len(pids) > server.max_batch:
+                return self.send(503)
+            data = tree.persons(pids)
+            return self.send(200 if data["persons"] else 404, data)
+        if name in ("ancestry", "descendancy"):
+            n = tree.index(query.get("person", [""])[0])
+            if n is None:
+                return self.send(404)
+            default, maximum = (4, 8) if name == "ancestry" else (2, 2)
+            generations = int(query.get("generations", [default])[0])
+            if not 1 <= generations <= maximum:
+                return self.send(400)
+            return self.send(200, getattr(tree, name)(n, generations))
+        if name == "user":
+            return self.send(200, tree.user())
+        if name == "person":
+            n = tree.index(match.group(1))
+            if n is None:
+                return self.send(404)
+            return self.send_modified(
+                tree.modified(n), lambda: tree.persons([tree.fid(n)])
+            )
+        if name == "couple":
+            n = tree.couple_index(match.group(1))
+            if n is None:
+                return self.send(204)
+            return self.send_modified(tree.couple_modified(n), lambda: tree.couple(n))
+        if name == "memory":
+            data = tree.memory(match.group(1))
+        else:
+            n = tree.index(match.group(1))
+            if n is None:
+                return self.send(404)
+            data = tree.notes(n) if name == "notes" else tree.sources(n)
+        self.send(204 if data is None else 200, data)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local stand-in of the FamilySearch API serving a SyntheticTree
+    :param address: (host, port) to listen on, port 0 to pick a free one
+    :param tree: a SyntheticTree
+    :param latency: mean time in seconds before each API response
+    :param error_rate: probability of a 503 response
+    :param throttle_rate: probability of a 429 response
+    :param token_lifetime: lifetime in seconds of the access tokens
+    :param seed: seed of the latency and errors
+    :param max_batch: the persons requests of more persons fail (503)
+    :param redirect_rate: probability of a 301 response to the same URL
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        tree,
+        latency=0,
+        error_rate=0,
+        throttle_rate=0,
+        token_lifetime=3600,
+        seed=0,
+        verbose=False,
+        max_batch=None,
+        redirect_rate=0,
+    ):
+        super().__init__(address, StandInHandler)
+        self.tree = tree
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.token_lifetime = token_lifetime
+        self.verbose = verbose
+        self.max_batch = max_batch
+        self.redirect_rate = redirect_rate
+        self.xsrf = secrets.token_hex(8)
+        self.codes = set()
+        self.tokens = dict()
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def new_token(self):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+        return token
+
+    def valid_token(self, authorization):
+        token = (authorization or "").partition("Bearer ")[2]
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def start(self):
+        """serve in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in of the FamilySearch API serving "
+        "a synthetic family tree",
+        usage="fsserver [options]",
+    )
+    parser.add_argument("--host", metavar="<STR>", default="127.0.0.1")
+    parser.add_argument("--port", metavar="<INT>", type=int, default=8080)
+    parser.add_argument(
+        "--size",
+        metavar="<INT>",
+        type=int,
+        default=1000,
+        help="Number of direct ancestors of the root person [1000]",
+    )
+    parser.add_argument(
+        "--branching",
+        metavar="<INT>",
+        type=int,
+        default=3,
+        help="Number of children of each couple [3]",
+    )
+    parser.add_argument(
+        "--collapse",
+        metavar="<FLOAT>",
+        type=float,
+        default=0.0,
+        help="Probability that an ancestor shares the parents of a cousin [0]",
+    )
+    parser.add_argument(
+        "--latency",
+        metavar="<SECONDS>",
+        type=float,
+        default=0.0,
+        help="Mean time before each API response [0]",
+    )
+    parser.add_argument(
+        "--error-rate",
+        metavar="<FLOAT>",
+        type=float,
+        default=0.0,
+        help="Probability of a 503 response [0]",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        metavar="<FLOAT>",
+        type=float,
+        default=0.0,
+        help="Probability of a 429 response [0]",
+    )
+    parser.add_argument(
+        "--token-lifetime",
+        metavar="<SECONDS>",
+        type=int,
+        default=3600,
+        help="Lifetime of the access tokens [3600]",
+    )
+    parser.add_argument(
+        "--max-batch",
+        metavar="<INT>",
+        type=int,
+        help="Fail the persons requests of more than <INT> persons [no limit]",
+    )
+    parser.add_argument(
+        "--redirect-rate",
+        metavar="<FLOAT>",
+        type=float,
+        default=0.0,
+        help="Probability of a 301 response, as for a merged person [0]",
+    )
+    parser.add_argument("--seed", metavar="<INT>", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true", default=False)
+    args = parser.parse_args()
+
+    tree = SyntheticTree(args.size, args.branching, args.collapse, args.seed)
+    server = StandInServer(
+        (args.host, args.port),
+        tree,
+        args.latency,
+        args.error_rate,
+        args.throttle_rate,
+        args.token_lifetime,
+        args.seed,
+        args.verbose,
+        args.max_batch,
+        args.redirect_rate,
+    )
+    print(
+        "Serving a tree of %s ancestors of %s on %s "
+        "(use getmyancestors --base-url %s)"
+        % (tree.size, tree.fid(0), server.url, server.url),
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
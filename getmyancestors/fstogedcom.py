@@ -4,6 +4,7 @@
 # global imports
 import os
 import sys
+import argparse
 from tkinter import (
     Tk,
     PhotoImage,
@@ -13,9 +14,17 @@ from tkinter import (
 from getmyancestors.classes.gui import (
     FStoGEDCOM,
 )
+from getmyancestors.classes.session import add_session_arguments, session_options
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Retrieve GEDCOM data from FamilySearch Tree with a GUI",
+        usage="fstogedcom [options]",
+    )
+    add_session_arguments(parser)
+    args = parser.parse_args()
+
     root = Tk()
     root.title("FamilySearch to GEDCOM")
     if sys.platform != "darwin":
@@ -23,7 +32,7 @@ def main():
             True,
             PhotoImage(file=os.path.join(os.path.dirname(__file__), "fstogedcom.png")),
         )
-    fstogedcom = FStoGEDCOM(root)
+    fstogedcom = FStoGEDCOM(root, session_options(args))
     fstogedcom.mainloop()
 
 
@@ -7,16 +7,42 @@ import sys
 import time
 from urllib.parse import urlparse, parse_qs
 import getpass
-import asyncio
 import argparse
 
 # local imports
 from getmyancestors.classes.tree import Tree
-from getmyancestors.classes.session import Session
+from getmyancestors.classes.batching import BatchSizer
+from getmyancestors.classes.checkpoint import Checkpoint
+from getmyancestors.classes.projection import Projection
+from getmyancestors.classes.store import SqliteStore
+from getmyancestors.classes.constants import (
+    MAX_ANCESTRY_GENERATIONS,
+    MAX_BATCHES,
+    MAX_DESCENDANCY_GENERATIONS,
+    MAX_PERSONS,
+    MIN_PERSONS,
+)
+from getmyancestors.classes.session import (
+    Session,
+    AsyncSession,
+    add_session_arguments,
+    session_options,
+)
 
 
+def projection_type(spec):
+    """argparse type of the --fields option"""
+    try:
+        return Projection.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 
-def main():
+def main(fields="full", tree_class=Tree):
+    """run getmyancestors
+    :param fields: the default projection specification (see Projection.parse)
+    :param tree_class: the Tree class, which names the program in the header
+    """
     parser = argparse.ArgumentParser(
         description="Retrieve GEDCOM data from FamilySearch Tree (4 Jul 2016)",
         add_help=False,
@@ -52,6 +78,27 @@ def main():
         default=0,
         help="Number of generations to descend [0]",
     )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="Download the next generations of a lineage without waiting "
+        "for the whole generation [False]",
+    )
+    parser.add_argument(
+        "--ancestry",
+        action="store_true",
+        default=False,
+        help="Find the ancestors with requests of up to %s generations "
+        "of the ancestry endpoint [False]" % MAX_ANCESTRY_GENERATIONS,
+    )
+    parser.add_argument(
+        "--descendancy",
+        action="store_true",
+        default=False,
+        help="Find the descendants with requests of up to %s generations "
+        "of the descendancy endpoint [False]" % MAX_DESCENDANCY_GENERATIONS,
+    )
     parser.add_argument(
         "-m",
         "--marriage",
@@ -71,6 +118,17 @@ def main():
         default=False,
         help="Download Wikipedia sources (adds significant time) [False]",
     )
+    parser.add_argument(
+        "--fields",
+        metavar="<SPEC>",
+        type=projection_type,
+        default=fields,
+        help="Data to download, as comma-separated items: a preset (full or "
+        "essential), notes, sources, memories or places to add them (-notes... "
+        "to leave them out), facts=<TAGS> and marriage=<TAGS> (tags separated "
+        "by +, all or none), names=preferred or names=all; e.g. "
+        "essential,memories,facts=BIRT+DEAT+BURI [%s]" % fields,
+    )
     # Contributors and ordinances options removed in simplified version
     parser.add_argument(
         "-v",
@@ -87,6 +145,74 @@ def main():
         default=60,
         help="Timeout in seconds [60]",
     )
+    add_session_arguments(parser)
+    parser.add_argument(
+        "--max-in-flight",
+        metavar="<INT>",
+        type=int,
+        default=0,
+        help="Download with the asyncio HTTP engine, "
+        "with at most <INT> concurrent requests [0: use threads]",
+    )
+    parser.add_argument(
+        "--batches",
+        metavar="<INT>",
+        type=int,
+        default=MAX_BATCHES,
+        help="Number of batches of persons downloaded concurrently [%s]"
+        % MAX_BATCHES,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="<FILE>",
+        type=str,
+        help="Save the progress of the download in <FILE> "
+        "[<outfile>.checkpoint, removed at the end of the download]",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        metavar="<SECONDS>",
+        type=float,
+        default=60,
+        help="Minimum time between two saves of the progress [60]",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Continue an interrupted download from its checkpoint [False]",
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="<FILE>",
+        type=str,
+        help="Save the downloaded tree in <FILE>, to refresh it later",
+    )
+    parser.add_argument(
+        "--refresh",
+        metavar="<FILE>",
+        type=str,
+        help="Update the tree of a snapshot: download only the individuals "
+        "and marriages changed since, and the new relatives (the snapshot "
+        "is replaced, unless --snapshot is given)",
+    )
+    parser.add_argument(
+        "--store",
+        metavar="<FILE>",
+        type=str,
+        help="Keep the individuals, families, notes and sources in the SQLite "
+        "database <FILE> instead of memory, for very large trees "
+        "(no checkpoint, snapshot or refresh)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        metavar=("<MIN>", "<MAX>"),
+        type=int,
+        nargs=2,
+        default=[MIN_PERSONS, MAX_PERSONS],
+        help="Bounds of the number of persons of a batch, adapted to the "
+        "response times [%s %s]" % (MIN_PERSONS, MAX_PERSONS),
+    )
     parser.add_argument(
         "--show-password",
         action="store_true",
@@ -115,6 +241,18 @@ def main():
         default=False,
         help="output log file [stderr]",
     )
+    parser.add_argument(
+        "--metrics",
+        metavar="<FILE>",
+        type=str,
+        help="Write the request metrics by endpoint in <FILE>, "
+        "in JSON or as a Prometheus textfile (.prom)",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["json", "prometheus"],
+        help="Format of the metrics file [guessed from the extension]",
+    )
     parser.add_argument(
         "--client_id", metavar="<STR>", type=str, help="Use Specific Client ID"
     )
@@ -133,6 +271,10 @@ def main():
         for fid in args.individuals:
             if not re.match(r"[A-Z0-9]{4}-[A-Z0-9]{3}", fid):
                 sys.exit("Invalid FamilySearch ID: " + fid)
+    if args.store and (
+        args.checkpoint or args.resume or args.snapshot or args.refresh
+    ):
+        sys.exit("--store cannot be used with a checkpoint, snapshot or refresh")
 
     args.username = (
         args.username if args.username else input("Enter FamilySearch username: ")
@@ -192,82 +334,172 @@ def main():
         args.verbose,
         args.logfile,
         args.timeout,
+        **session_options(args),
     )
     if not fs.logged:
         sys.exit(2)
     timing_data['login'] = time.time() - login_start
     _ = fs._
-    tree = Tree(fs, get_wikipedia_sources=args.get_sources)
+    afs = AsyncSession(fs, args.max_in_flight) if args.max_in_flight > 0 else None
+    projection = args.fields
+    if args.get_sources:
+        projection = projection.replace(sources=True)
+    if args.get_notes:
+        projection = projection.replace(notes=True)
+    tree = tree_class(
+        fs,
+        projection=projection,
+        afs=afs,
+        batches=args.batches,
+        sizer=BatchSizer(*args.batch_size, metrics=fs.metrics),
+        store=SqliteStore(args.store) if args.store else None,
+    )
 
     # LDS ordinances check removed in simplified version
 
+    if args.checkpoint:
+        checkpoint_path = args.checkpoint
+    elif args.outfile.name != "<stdout>" and not args.store:
+        checkpoint_path = args.outfile.name + ".checkpoint"
+    else:
+        checkpoint_path = None
+    checkpoint = Checkpoint(
+        checkpoint_path,
+        key=(
+            tuple(sorted(args.individuals or [fs.fid])),
+            args.ascend,
+            args.descend,
+            repr(projection),
+        ),
+        interval=args.checkpoint_interval,
+    )
+    tree.checkpoint = checkpoint
+    if args.resume:
+        if checkpoint.resume(tree):
+            print(
+                _("Resuming with %s individuals downloaded...") % len(tree.indi),
+                file=sys.stderr,
+            )
+            tree.add_pending()
+        else:
+            print(_("No checkpoint to resume, starting over"), file=sys.stderr)
+    snapshot = Checkpoint(args.refresh)
+    if args.refresh and not checkpoint.finished:
+        if snapshot.load(tree):
+            print(
+                _("Checking %s individuals for changes...") % len(tree.indi),
+                file=sys.stderr,
+            )
+            changed = tree.check_changes()
+            print(
+                _("%s individuals changed, %s unchanged")
+                % (len(changed), len(tree.unchanged)),
+                file=sys.stderr,
+            )
+        else:
+            print(_("No snapshot to refresh, downloading all"), file=sys.stderr)
+    finished = False
+
     try:
         # add list of starting individuals to the family tree
-        todo = args.individuals if args.individuals else [fs.fid]
         starting_start = time.time()
-        print(_("Downloading starting individuals..."), file=sys.stderr)
-        tree.add_indis(todo)
+        if "starting" not in checkpoint.finished:
+            todo = args.individuals if args.individuals else [fs.fid]
+            print(_("Downloading starting individuals..."), file=sys.stderr)
+            tree.add_indis(todo)
+            checkpoint.finish(tree, "starting")
         timing_data['starting_individuals'] = time.time() - starting_start
 
         # download ancestors
         ancestors_start = time.time()
-        todo = set(tree.indi.keys())
-        done = set()
-        for i in range(args.ascend):
-            if not todo:
-                break
-            done |= todo
-            print(
-                _("Downloading %s. of generations of ancestors...") % (i + 1),
-                file=sys.stderr,
-            )
-            todo = tree.add_parents(todo) - done
+        if "ancestors" not in checkpoint.finished:
+            todo, done, first = checkpoint.start("ancestors", tree.indi.keys())
+            if args.ancestry and args.ascend:
+                print(_("Downloading ancestors..."), file=sys.stderr)
+                tree.add_pedigree(todo, args.ascend)
+                todo = set()
+            elif args.pipeline and args.ascend:
+                print(_("Downloading ancestors..."), file=sys.stderr)
+                tree.add_ancestors(todo, args.ascend)
+                todo = set()
+            for i in range(first, args.ascend):
+                if not todo:
+                    break
+                done |= todo
+                print(
+                    _("Downloading %s. of generations of ancestors...") % (i + 1),
+                    file=sys.stderr,
+                )
+                todo = tree.add_parents(todo) - done
+                checkpoint.update(tree, todo, done, i + 1)
+            checkpoint.finish(tree, "ancestors")
         timing_data['ancestors'] = time.time() - ancestors_start
 
         # download descendants
         descendants_start = time.time()
-        todo = set(tree.indi.keys())
-        done = set()
-        for i in range(args.descend):
-            if not todo:
-                break
-            done |= todo
-            print(
-                _("Downloading %s. of generations of descendants...") % (i + 1),
-                file=sys.stderr,
-            )
-            todo = tree.add_children(todo) - done
+        if "descendants" not in checkpoint.finished:
+            todo, done, first = checkpoint.start("descendants", tree.indi.keys())
+            if args.descendancy and args.descend:
+                print(_("Downloading descendants..."), file=sys.stderr)
+                tree.add_descendancy(todo, args.descend)
+                todo = set()
+            elif args.pipeline and args.descend:
+                print(_("Downloading descendants..."), file=sys.stderr)
+                tree.add_descendants(todo, args.descend)
+                todo = set()
+            for i in range(first, args.descend):
+                if not todo:
+                    break
+                done |= todo
+                print(
+                    _("Downloading %s. of generations of descendants...") % (i + 1),
+                    file=sys.stderr,
+                )
+                todo = tree.add_children(todo) - done
+                checkpoint.update(tree, todo, done, i + 1)
+            checkpoint.finish(tree, "descendants")
         timing_data['descendants'] = time.time() - descendants_start
 
         # download spouses
-        if args.marriage:
+        if args.marriage and "spouses" not in checkpoint.finished:
             spouses_start = time.time()
             print(_("Downloading spouses and marriage information..."), file=sys.stderr)
             todo = set(tree.indi.keys())
             tree.add_spouses(todo)
+            checkpoint.finish(tree, "spouses")
             timing_data['spouses'] = time.time() - spouses_start
 
         # download notes only (simplified version) - OPTIONAL
         notes_start = time.time()
         if args.get_notes:  # Only download notes if explicitly requested
-            async def download_stuff(loop):
-                futures = set()
-                for fid, indi in tree.indi.items():
-                    futures.add(loop.run_in_executor(None, indi.get_notes))
-                for future in futures:
-                    await future
-
-            loop = asyncio.get_event_loop()
-            print(_("Downloading notes..."), file=sys.stderr)
-            loop.run_until_complete(download_stuff(loop))
+            if "notes" not in checkpoint.finished:
+                if "notes" not in snapshot.finished:
+                    # the reused individuals have no notes
+                    tree.reused.clear()
+                print(_("Downloading notes..."), file=sys.stderr)
+                tree.get_notes()
+                checkpoint.finish(tree, "notes")
         else:
             print(_("Skipping notes download (use --get-notes to include)"), file=sys.stderr)
         timing_data['notes'] = time.time() - notes_start
+        finished = True
 
     finally:
+        if not finished and checkpoint.path:
+            checkpoint.save(tree)
+            print(
+                _("Progress saved in %s, continue with --resume") % checkpoint.path,
+                file=sys.stderr,
+            )
         # compute number for family relationships and print GEDCOM file
         tree.reset_num()
         tree.print(args.outfile)
+        if tree.store:
+            tree.store.close()
+        if finished:
+            checkpoint.remove()
+            if args.snapshot or args.refresh:
+                checkpoint.snapshot(tree, args.snapshot or args.refresh)
         timing_data['total'] = time.time() - start_time
         
         print(
@@ -297,6 +529,44 @@ def main():
         print(f"Total: {timing_data['total']:.2f}s", file=sys.stderr)
         print(f"HTTP requests: {fs.counter}", file=sys.stderr)
         print(f"Requests per second: {fs.counter/timing_data['total']:.1f}", file=sys.stderr)
+        print(
+            f"Retries: {fs.stats['retries']} "
+            f"({fs.stats['throttled']} throttled, {fs.stats['abandoned']} abandoned)",
+            file=sys.stderr,
+        )
+        print(f"Coalesced requests: {fs.stats['coalesced']}", file=sys.stderr)
+        print(
+            f"Token refreshes: {fs.stats['token_refreshes']} "
+            f"(requests parked {fs.stats['parked_seconds']:.1f}s)",
+            file=sys.stderr,
+        )
+        print(
+            f"Connections: {fs.stats['connections_new']} new, "
+            f"{fs.stats['connections_reused']} reused",
+            file=sys.stderr,
+        )
+        print(
+            f"Bytes: {fs.stats['bytes_wire'] / 2**20:.1f} MB on the wire, "
+            f"{fs.stats['bytes_decoded'] / 2**20:.1f} MB decoded",
+            file=sys.stderr,
+        )
+        if fs.cache:
+            print(
+                f"Cache: {fs.stats['cache_hit']} hits, "
+                f"{fs.stats['cache_revalidated']} revalidated, "
+                f"{fs.stats['cache_miss']} misses",
+                file=sys.stderr,
+            )
+        if args.metrics:
+            fs.metrics.write(args.metrics, timing_data, args.metrics_format)
+    if tree.failed:
+        sys.exit(
+            _(
+                "WARNING: %s individuals could not be downloaded (%s), "
+                "run again to complete the tree"
+            )
+            % (len(tree.failed), ", ".join(sorted(tree.failed)[:10]))
+        )
 
 
 if __name__ == "__main__":
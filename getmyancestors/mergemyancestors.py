@@ -14,50 +14,18 @@ from getmyancestors.classes.gedcom import Gedcom
 sys.path.append(os.path.dirname(sys.argv[0]))
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Merge GEDCOM data from FamilySearch Tree (4 Jul 2016)",
-        add_help=False,
-        usage="mergemyancestors -i input1.ged input2.ged ... [options]",
-    )
-    try:
-        parser.add_argument(
-            "-i",
-            metavar="<FILE>",
-            nargs="+",
-            type=argparse.FileType("r", encoding="UTF-8"),
-            default=[sys.stdin],
-            help="input GEDCOM files [stdin]",
-        )
-        parser.add_argument(
-            "-o",
-            metavar="<FILE>",
-            nargs="?",
-            type=argparse.FileType("w", encoding="UTF-8"),
-            default=sys.stdout,
-            help="output GEDCOM files [stdout]",
-        )
-    except TypeError:
-        sys.stderr.write("Python >= 3.4 is required to run this script\n")
-        sys.stderr.write("(see https://docs.python.org/3/whatsnew/3.4.html#argparse)\n")
-        exit(2)
-
-    # extract arguments from the command line
-    try:
-        parser.error = parser.exit
-        args = parser.parse_args()
-    except SystemExit as e:
-        print(e.code)
-        parser.print_help()
-        exit(2)
-
+def merge(files):
+    """merge GEDCOM files into a single family tree
+    :param files: an iterable of GEDCOM file objects
+    :return: a Tree
+    """
     tree = Tree()
 
     indi_counter = 0
     fam_counter = 0
 
     # read the GEDCOM data
-    for file in args.i:
+    for file in files:
         ged = Gedcom(file, tree)
 
         # add information about individuals
@@ -115,6 +83,47 @@ def main():
             n.num = tree.notes[i - 1].num
         else:
             n.num = tree.notes[i - 1].num + 1
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge GEDCOM data from FamilySearch Tree (4 Jul 2016)",
+        add_help=False,
+        usage="mergemyancestors -i input1.ged input2.ged ... [options]",
+    )
+    try:
+        parser.add_argument(
+            "-i",
+            metavar="<FILE>",
+            nargs="+",
+            type=argparse.FileType("r", encoding="UTF-8"),
+            default=[sys.stdin],
+            help="input GEDCOM files [stdin]",
+        )
+        parser.add_argument(
+            "-o",
+            metavar="<FILE>",
+            nargs="?",
+            type=argparse.FileType("w", encoding="UTF-8"),
+            default=sys.stdout,
+            help="output GEDCOM files [stdout]",
+        )
+    except TypeError:
+        sys.stderr.write("Python >= 3.4 is required to run this script\n")
+        sys.stderr.write("(see https://docs.python.org/3/whatsnew/3.4.html#argparse)\n")
+        exit(2)
+
+    # extract arguments from the command line
+    try:
+        parser.error = parser.exit
+        args = parser.parse_args()
+    except SystemExit as e:
+        print(e.code)
+        parser.print_help()
+        exit(2)
+
+    tree = merge(args.i)
 
     # compute number for family relationships and print GEDCOM file
     tree.reset_num()
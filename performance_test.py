@@ -1,91 +1,440 @@
 #!/usr/bin/env python3
 """
-Performance test script to compare different versions of getmyancestors
+Benchmarks of getmyancestors on synthetic family trees
+
+Each benchmark runs on a deterministic SyntheticTree of the given size
+and reports its duration, its peak memory (traced in a second run) and,
+for the crawls, the number of HTTP requests. The crawls download from a
+local FamilySearch stand-in (fsserver) running in another process.
+
+    python3 performance_test.py --sizes 1000 10000 -o results.json
+    python3 performance_test.py --compare old.json results.json
 """
 
-import time
-import sys
 import os
+import io
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
 
 # Add the current directory to the path
 sys.path.insert(0, os.path.dirname(__file__))
 
-def test_imports():
-    """Test that all versions can be imported"""
-    try:
-        # Test original tree classes
-        from getmyancestors.classes.tree import Tree as OriginalTree
-        print("✓ Original tree classes imported")
-        
-        # Test ultra-fast tree classes
-        from getmyancestors.classes.tree_ultra_fast import Tree as UltraFastTree
-        print("✓ Ultra-fast tree classes imported")
-        
-        return True
-    except ImportError as e:
-        print(f"✗ Import error: {e}")
-        return False
-
-def test_performance_comparison():
-    """Compare the performance characteristics"""
-    print("\n=== PERFORMANCE COMPARISON ===")
-    print()
-    
-    print("ORIGINAL VERSION:")
-    print("- Downloads ALL sources (hundreds per person)")
-    print("- Downloads ALL notes and contributor lists")
-    print("- Downloads ALL memories (photos, documents)")
-    print("- Downloads ALL facts (occupation, military, etc.)")
-    print("- Downloads LDS ordinances")
-    print("- Makes ~10-15 API calls per person")
-    print("- Expected: 50-100MB GEDCOM files")
-    print("- Expected: 10-15 minutes for 4 generations")
-    print()
-    
-    print("SIMPLIFIED VERSION:")
-    print("- Downloads only Wikipedia sources")
-    print("- Downloads only essential notes (no contributors)")
-    print("- Downloads only text-based memories (bios)")
-    print("- Downloads only birth/death facts")
-    print("- No LDS ordinances")
-    print("- Makes ~5-8 API calls per person")
-    print("- Expected: 1-5MB GEDCOM files")
-    print("- Expected: 3-5 minutes for 4 generations")
-    print()
-    
-    print("ULTRA-FAST VERSION:")
-    print("- Downloads NO sources")
-    print("- Downloads NO notes")
-    print("- Downloads NO memories")
-    print("- Downloads only birth/death facts")
-    print("- Downloads only family relationships")
-    print("- Makes ~2-3 API calls per person")
-    print("- Expected: 0.1-0.5MB GEDCOM files")
-    print("- Expected: 30-60 seconds for 4 generations")
-    print()
-    
-    print("RECOMMENDATION:")
-    print("Use ULTRA-FAST version for quick family tree structure")
-    print("Use SIMPLIFIED version if you need Wikipedia sources and bios")
-    print("Use ORIGINAL version only if you need everything")
+import getmyancestors
+from getmyancestors.classes import tree_ultra_fast
+from getmyancestors.classes.batching import BatchSizer
+from getmyancestors.classes.cassette import Cassette
+from getmyancestors.classes.constants import MAX_PERSONS
+from getmyancestors.classes.gedcom import Gedcom
+from getmyancestors.classes.ratelimit import RateLimiter
+from getmyancestors.classes.session import Session
+from getmyancestors.classes.synthetic import SyntheticTree
+from getmyancestors.classes.tree import Indi, Tree
+from getmyancestors.fsserver import StandInServer
+from getmyancestors.mergemyancestors import merge
+
+BENCHMARKS = dict()
+
+
+def benchmark(name):
+    """register a benchmark: a function of the size returning
+    a function to measure and the number of persons it processes
+    """
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def build_tree(size, tree_class=Tree):
+    """return a Tree of the first size ancestors of a SyntheticTree,
+    built without download
+    """
+    synthetic = SyntheticTree(size)
+    tree = tree_class()
+    for n in range(size):
+        fid = synthetic.fid(n)
+        tree.indi[fid] = Indi(fid, tree)
+        tree.indi[fid].parse_data(synthetic.person(n))
+    for n in range(size):
+        parents = synthetic.parents(n)
+        if parents:
+            father, mother = map(synthetic.fid, parents)
+            tree.add_trio(father, mother, synthetic.fid(n))
+    tree.reset_num()
+    return tree
+
+
+def write_gedcom(tree):
+    file = tempfile.NamedTemporaryFile("w", suffix=".ged", delete=False)
+    with file:
+        tree.print(file)
+    return file.name
+
+
+def serve(size, queue):
+    """run a stand-in server in a child process"""
+    server = StandInServer(("127.0.0.1", 0), SyntheticTree(size))
+    queue.put(server.url)
+    server.serve_forever()
+
+
+def crawl(tree_class, size):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(size, queue), daemon=True)
+    process.start()
+    url = queue.get()
+    generations = math.ceil(math.log2(size + 1))
+    fs = Session(
+        "bench", "bench", timeout=30, base_url=url, limiter=RateLimiter(10**6)
+    )
+
+    def run():
+        requests = fs.counter
+        tree = tree_class(fs)
+        tree.add_indis([fs.fid])
+        todo = set(tree.indi)
+        done = set()
+        for _ in range(generations):
+            if not todo:
+                break
+            done |= todo
+            todo = tree.add_parents(todo) - done
+        process.terminate()
+        return {"persons": len(tree.indi), "requests": fs.counter - requests}
+
+    return run
+
+
+@benchmark("crawl_tree")
+def bench_crawl_tree(size):
+    """download the ancestors with tree.Tree"""
+    return crawl(Tree, size)
+
+
+@benchmark("crawl_ultra_fast")
+def bench_crawl_ultra_fast(size):
+    """download the ancestors with tree_ultra_fast.Tree"""
+    return crawl(tree_ultra_fast.Tree, size)
+
+
+@benchmark("parse")
+def bench_parse(size):
+    """parse the persons data as Indi.add_data does, without download"""
+    synthetic = SyntheticTree(size)
+    data = [synthetic.person(n) for n in range(size)]
+    tree = Tree()
+
+    def run():
+        indis = [Indi(person["id"], tree) for person in data]
+        for indi, person in zip(indis, data):
+            indi.parse_data(person)
+        return {"persons": len(indis)}
+
+    return run
+
+
+def record_batch(synthetic):
+    """record a persons batch of MAX_PERSONS persons, with the memories it
+    requires, in a cassette
+    :return: the cassette file and the fids of the batch
+    """
+    server = StandInServer(("127.0.0.1", 0), synthetic)
+    server.start()
+    file = tempfile.NamedTemporaryFile(suffix=".jsonl.gz", delete=False)
+    file.close()
+    fs = Session(
+        "bench",
+        "bench",
+        timeout=30,
+        base_url=server.url,
+        limiter=RateLimiter(10**6),
+        cassette=Cassette(file.name, "record"),
+    )
+    fids = [synthetic.fid(n) for n in range(MAX_PERSONS)]
+    Tree(fs, sizer=BatchSizer(MAX_PERSONS, MAX_PERSONS)).add_indis(fids)
+    fs.cassette.close()
+    server.shutdown()
+    server.server_close()
+    return file.name, fids
+
+
+def replay_batch(tree_class, size):
+    """add the persons of a recorded batch to a tree, size // MAX_PERSONS
+    times, replaying the responses without latency
+    """
+    path, fids = record_batch(SyntheticTree(max(size, MAX_PERSONS)))
+    fs = Session(
+        "bench",
+        "bench",
+        base_url="http://0",
+        limiter=RateLimiter(10**6),
+        cassette=Cassette(path, latency=0),
+    )
+    os.remove(path)
+    tree = tree_class(fs, sizer=BatchSizer(MAX_PERSONS, MAX_PERSONS))
+
+    def run():
+        requests = fs.counter
+        persons = 0
+        for _ in range(max(1, size // MAX_PERSONS)):
+            tree.indi = dict()
+            tree.add_indis(fids)
+            persons += len(tree.indi)
+        return {"persons": persons, "requests": fs.counter - requests}
+
+    return run
+
+
+@benchmark("batch_tree")
+def bench_batch_tree(size):
+    """parse a recorded batch of persons and download its memories
+    with tree.Tree
+    """
+    return replay_batch(Tree, size)
+
+
+@benchmark("batch_ultra_fast")
+def bench_batch_ultra_fast(size):
+    """parse a recorded batch of persons with tree_ultra_fast.Tree"""
+    return replay_batch(tree_ultra_fast.Tree, size)
+
+
+@benchmark("objects")
+def bench_objects(size):
+    """build a tree without download, and measure the memory it holds"""
+
+    def run():
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tree = build_tree(size)
+        held = tracemalloc.get_traced_memory()[0] - before
+        if not tracing:
+            tracemalloc.stop()
+        return {"persons": len(tree.indi), "bytes_per_person": round(held / size)}
+
+    return run
+
+
+class OfflineTree(Tree):
+    """Tree downloading the persons batches from a SyntheticTree in memory,
+    without the memories (they require other downloads)
+    """
+
+    def __init__(self, synthetic):
+        super().__init__()
+        self.synthetic = synthetic
+
+    async def get_url(self, url, fail_fast=False, headers=None):
+        data = self.synthetic.persons(url.partition("pids=")[2].split(","))
+        for person in data["persons"]:
+            person.pop("evidence", None)
+        return data
+
+
+@benchmark("persons")
+def bench_persons(size):
+    """merge the persons responses of a tree without download (data and
+    relationships), and measure the memory it holds
+    """
+    synthetic = SyntheticTree(size)
+    fids = [synthetic.fid(n) for n in range(size)]
+
+    def run():
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tree = OfflineTree(synthetic)
+        tree.add_indis(fids)
+        held = tracemalloc.get_traced_memory()[0] - before
+        if not tracing:
+            tracemalloc.stop()
+        return {"persons": len(tree.indi), "bytes_per_person": round(held / size)}
+
+    return run
+
+
+@benchmark("print")
+def bench_print(size):
+    """write the GEDCOM file of a tree"""
+    tree = build_tree(size)
+
+    def run():
+        file = io.StringIO()
+        tree.print(file)
+        return {"persons": size, "bytes": file.tell()}
+
+    return run
+
+
+@benchmark("gedcom")
+def bench_gedcom(size):
+    """parse a GEDCOM file"""
+    path = write_gedcom(build_tree(size))
+
+    def run():
+        with open(path, encoding="utf-8") as file:
+            ged = Gedcom(file, Tree())
+        os.remove(path)
+        return {"persons": len(ged.indi)}
+
+    return run
+
+
+@benchmark("merge")
+def bench_merge(size):
+    """merge a GEDCOM file with the GEDCOM file of half of its persons"""
+    paths = [write_gedcom(build_tree(size)), write_gedcom(build_tree(size // 2))]
+
+    def run():
+        files = [open(path, encoding="utf-8") for path in paths]
+        tree = merge(files)
+        for file in files:
+            file.close()
+            os.remove(file.name)
+        return {"persons": len(tree.indi)}
+
+    return run
+
+
+def measure(name, size, memory=True):
+    """run a benchmark, then run it again with tracemalloc for its peak memory"""
+    run = BENCHMARKS[name](size)
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    result.update(
+        benchmark=name,
+        size=size,
+        seconds=round(seconds, 4),
+        persons_per_second=round(result["persons"] / seconds, 1),
+    )
+    if memory:
+        run = BENCHMARKS[name](size)
+        tracemalloc.start()
+        run()
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result
+
+
+def compare(old_path, new_path):
+    """print the ratio of the durations of two result files,
+    and the memory held per person by each run
+    """
+    with open(old_path) as file:
+        old = {(r["benchmark"], r["size"]): r for r in json.load(file)["results"]}
+    with open(new_path) as file:
+        new = json.load(file)["results"]
+    header = ("benchmark", "size", "old (s)", "new (s)", "ratio", "old B/p", "new B/p")
+    print("%-18s %9s %10s %10s %8s %9s %9s" % header)
+    for result in new:
+        before = old.get((result["benchmark"], result["size"]))
+        if before:
+            print(
+                "%-18s %9s %10.3f %10.3f %7.2fx %9s %9s"
+                % (
+                    result["benchmark"],
+                    result["size"],
+                    before["seconds"],
+                    result["seconds"],
+                    before["seconds"] / result["seconds"],
+                    before.get("bytes_per_person", "-"),
+                    result.get("bytes_per_person", "-"),
+                )
+            )
+
 
 def main():
-    """Run performance tests"""
-    print("Performance Test for getmyancestors versions")
-    print("=" * 50)
-    
-    if not test_imports():
-        print("✗ Import tests failed")
+    parser = argparse.ArgumentParser(description="Benchmarks of getmyancestors")
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run [all]",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        metavar="<INT>",
+        nargs="+",
+        type=int,
+        default=[1000, 10000, 100000],
+        help="Numbers of persons of the synthetic trees [1000 10000 100000]",
+    )
+    parser.add_argument(
+        "--max-crawl",
+        metavar="<INT>",
+        type=int,
+        default=100000,
+        help="Largest tree downloaded by the crawl benchmarks [100000]",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        default=False,
+        help="Do not measure the peak memory (runs each benchmark once)",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="<FILE>", help="Write the results in <FILE>"
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="<FILE>",
+        nargs=2,
+        help="Compare two result files instead of running the benchmarks",
+    )
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
         return
-    
-    test_performance_comparison()
-    
-    print("\n" + "=" * 50)
-    print("To test the ultra-fast version:")
-    print("python3 getmyancestors/getmyancestors_fast.py -u username -p password -i PERSON_ID -a 4 -o ultra_fast.ged")
-    print()
-    print("To test the simplified version:")
-    print("python3 -m getmyancestors.getmyancestors -u username -p password -i PERSON_ID -a 4 -o simplified.ged")
+
+    results = list()
+    for size in args.sizes:
+        for name in args.benchmarks:
+            if name.startswith("crawl") and size > args.max_crawl:
+                continue
+            result = measure(name, size, not args.no_memory)
+            results.append(result)
+            print(
+                "%-18s %9s %9.3fs %10.1f persons/s %8s MB %6s requests %6s B/person"
+                % (
+                    name,
+                    size,
+                    result["seconds"],
+                    result["persons_per_second"],
+                    result.get("peak_mb", "-"),
+                    result.get("requests", "-"),
+                    result.get("bytes_per_person", "-"),
+                ),
+                file=sys.stderr,
+            )
+    report = {
+        "version": getmyancestors.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+"""
+Tests of the download of family trees from the local FamilySearch stand-in
+"""
+
+import io
+import os
+import collections
+import sys
+import pickle
+import sqlite3
+import functools
+
+import pytest
+
+# Add the current directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from getmyancestors.classes import tree_ultra_fast
+from getmyancestors.classes.asynchttp import ConnectionPool
+from getmyancestors.classes.batching import BatchSizer
+from getmyancestors.classes.cache import ResponseCache
+from getmyancestors.classes.cassette import Cassette
+from getmyancestors.classes.checkpoint import Checkpoint
+from getmyancestors.classes.graph import Graph
+from getmyancestors.classes.projection import ESSENTIAL, FULL, Projection
+from getmyancestors.classes.ratelimit import RateLimiter, RetryPolicy
+from getmyancestors.classes.session import AsyncSession, Session
+from getmyancestors.classes.store import SqliteStore, by_num, pinned
+from getmyancestors.classes.synthetic import SyntheticTree
+from getmyancestors.classes import tree as tree_module
+from getmyancestors.classes.tree import Fam, Indi, Note, Source, Tree
+from getmyancestors.fsserver import StandInServer
+from getmyancestors.mergemyancestors import merge
+from getmyancestors import getmyancestors, getmyancestors_fast
+
+TREE_CLASSES = [Tree, tree_ultra_fast.Tree]
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    return SyntheticTree(size=600, branching=3, collapse=0.3)
+
+
+@pytest.fixture(scope="module")
+def fs(synthetic):
+    srv = StandInServer(("127.0.0.1", 0), synthetic)
+    srv.start()
+    yield Session(
+        "user", "password", timeout=5, base_url=srv.url, limiter=RateLimiter(10**6)
+    )
+    srv.shutdown()
+    srv.server_close()
+
+
+def families(tree):
+    return {key: sorted(fam.chil_fid) for key, fam in tree.fam.items()}
+
+
+def gedcom(tree):
+    """return the GEDCOM records of a tree, numbered by FamilySearch id,
+    without the header and with the lines of the records in a fixed order
+    (the facts and sources of an individual are sets)
+    """
+    for i, fid in enumerate(sorted(tree.indi), 1):
+        tree.indi[fid].num = i
+    for i, key in enumerate(sorted(tree.fam, key=str), 1):
+        tree.fam[key].num = i
+    for i, source in enumerate(sorted(tree.sources.values(), key=lambda s: s.fid)):
+        source.num = i + 1
+    for i, note in enumerate(sorted(tree.notes, key=lambda n: n.text), 1):
+        note.num = i
+    tree.reset_num()
+    file = io.StringIO()
+    tree.print(file)
+    records = list()
+    for line in file.getvalue().splitlines():
+        if line.startswith("0 "):
+            records.append([line])
+        elif line.startswith("1 "):
+            records[-1].append(line)
+        else:
+            records[-1][-1] += "\n" + line
+    return sorted((r[0], sorted(r[1:])) for r in records if r[0] != "0 HEAD")
+
+
+def generational(tree, fids, ascend=0, descend=0):
+    """the per-generation loops of getmyancestors"""
+    tree.add_indis(fids)
+    for add, generations in ((tree.add_parents, ascend), (tree.add_children, descend)):
+        todo = set(tree.indi.keys())
+        done = set()
+        for _ in range(generations):
+            if not todo:
+                break
+            done |= todo
+            todo = add(todo) - done
+    return tree
+
+
+def pipelined(tree, fids, ascend=0, descend=0):
+    tree.add_indis(fids)
+    if ascend:
+        tree.add_ancestors(set(tree.indi.keys()), ascend)
+    if descend:
+        tree.add_descendants(set(tree.indi.keys()), descend)
+    return tree
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+@pytest.mark.parametrize("ascend,descend", [(5, 0), (12, 0), (0, 3), (3, 2)])
+def test_pipeline(fs, synthetic, tree_class, ascend, descend):
+    fids = [synthetic.fid(0), synthetic.fid(9)]
+    expected = generational(tree_class(fs), fids, ascend, descend)
+    tree = pipelined(tree_class(fs), fids, ascend, descend)
+    assert tree.indi.keys() == expected.indi.keys()
+    assert families(tree) == families(expected)
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+def test_concurrent_batches(fs, synthetic, tree_class):
+    fids = [synthetic.fid(n) for n in range(synthetic.size)]
+    expected = tree_class(fs, batches=1)
+    expected.add_indis(fids)
+    tree = tree_class(fs, batches=3)
+    get_url = tree.get_url
+    in_flight = [0, 0]
+
+    async def counting_get_url(url, **kwargs):
+        if not url.startswith("/platform/tree/persons?"):
+            return await get_url(url, **kwargs)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        try:
+            return await get_url(url, **kwargs)
+        finally:
+            in_flight[0] -= 1
+
+    tree.get_url = counting_get_url
+    requests = fs.metrics.endpoints["persons"].requests
+    tree.add_indis(fids + fids[:10])
+    assert fs.metrics.endpoints["persons"].requests - requests == 3
+    assert in_flight[1] == 3
+    assert tree.indi.keys() == expected.indi.keys()
+    for fid, indi in tree.indi.items():
+        assert set(indi.parents) == set(expected.indi[fid].parents)
+        assert set(indi.children) == set(expected.indi[fid].children)
+        assert set(indi.spouses) == set(expected.indi[fid].spouses)
+    assert tree.places == expected.places
+
+
+def test_batch_sizer():
+    sizer = BatchSizer(min_size=10, max_size=200, target_latency=1, max_records=1000)
+    assert [len(b) for b in sizer.split(list(range(410)))] == [136, 137, 137]
+    assert sizer.split([]) == []
+    sizer.success(200, 0.1, {"persons": [{}] * 200})
+    assert sizer.size == 200
+    # slower than the target
+    sizer.success(200, 4, {"persons": [{}] * 200})
+    assert sizer.size == 50
+    # grows again while fast and small
+    sizer.success(50, 0.1, None)
+    assert sizer.size == 55
+    # larger than the target
+    sizer.success(55, 0.1, {"relationships": [{}] * 2750})
+    assert sizer.size == 20
+    sizer.failure(20)
+    sizer.failure(10)
+    assert sizer.size == 10
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+def test_split_failed_batches(synthetic, tree_class):
+    srv = StandInServer(("127.0.0.1", 0), synthetic, max_batch=60)
+    srv.start()
+    try:
+        fs = Session(
+            "user", "password", timeout=5, base_url=srv.url, limiter=RateLimiter(10**6)
+        )
+        tree = tree_class(fs)
+        fids = [synthetic.fid(n) for n in range(synthetic.size)]
+        tree.add_indis(fids)
+        assert tree.indi.keys() == set(fids)
+        batches = fs.metrics.to_dict()["endpoints"]["persons"]["batches"]
+        # each failed batch is split: 200 -> 100 -> 50
+        assert batches["failed"] == {"100": 6, "200": 3}
+        assert set(batches["ok"]) == {"50"}
+        assert fs.stats["retries"] == 0
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_failed_batches(synthetic):
+    srv = StandInServer(("127.0.0.1", 0), synthetic)
+    srv.start()
+    try:
+        fs = Session(
+            "user",
+            "password",
+            timeout=5,
+            base_url=srv.url,
+            limiter=RateLimiter(10**6),
+            retry_policy=RetryPolicy(max_retries=1, cap=0.01),
+        )
+        srv.error_rate = 1
+        tree = Tree(fs)
+        fids = [synthetic.fid(n) for n in range(4)]
+        tree.add_indis(fids)
+        # split down to single persons, then given up and recorded
+        assert not tree.indi and tree.failed == set(fids)
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_repeat_from_cache(synthetic, monkeypatch, tmp_path):
+    srv = StandInServer(("127.0.0.1", 0), synthetic)
+    srv.start()
+    trees, counts = list(), list()
+    served = list()
+    persons = synthetic.persons
+    monkeypatch.setattr(
+        synthetic, "persons", lambda fids: served.extend(fids) or persons(fids)
+    )
+    try:
+        # other batches in the repeat run: other sizes and order of the fids
+        for size, fids in ((200, [0, 9]), (13, [9, 0])):
+            served.clear()
+            fs = Session(
+                "user",
+                "password",
+                timeout=5,
+                base_url=srv.url,
+                limiter=RateLimiter(10**6),
+                cache=ResponseCache(str(tmp_path)),
+            )
+            tree = Tree(fs, sizer=BatchSizer(max_size=size))
+            trees.append(generational(tree, [synthetic.fid(n) for n in fids], 12))
+            counts.append(len(served))
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    # all the persons of the repeat run are served by the cache
+    assert counts[0] > 0 and counts[1] == 0
+    assert gedcom(trees[0]) == gedcom(trees[1])
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+@pytest.mark.parametrize("ascend", [3, 12])
+def test_pedigree(fs, synthetic, tree_class, ascend, tmp_path):
+    fids = [synthetic.fid(0), synthetic.fid(9)]
+    expected = generational(tree_class(fs), fids, ascend)
+    cassette = tmp_path / "pedigree.jsonl.gz"
+    recording = Session(
+        "user",
+        "password",
+        timeout=5,
+        base_url=fs.base_url,
+        limiter=RateLimiter(10**6),
+        cassette=Cassette(str(cassette), "record"),
+    )
+    tree = tree_class(recording)
+    tree.add_indis(fids)
+    tree.add_pedigree(set(tree.indi), ascend)
+    recording.cassette.close()
+    assert recording.metrics.endpoints["ancestry"].requests >= 2
+    assert gedcom(tree) == gedcom(expected)
+
+    # the replayed run gives the same GEDCOM without the stand-in
+    replaying = Session(
+        "user", "password", cassette=Cassette(str(cassette)), base_url="http://0"
+    )
+    tree = tree_class(replaying)
+    tree.add_indis(fids)
+    tree.add_pedigree(set(tree.indi), ascend)
+    assert gedcom(tree) == gedcom(expected)
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+@pytest.mark.parametrize("descend", [1, 5])
+def test_descendancy(fs, synthetic, tree_class, descend):
+    fids = [synthetic.fid(300), synthetic.fid(77)]
+    expected = generational(tree_class(fs), fids, descend=descend)
+    tree = tree_class(fs)
+    tree.add_indis(fids)
+    tree.add_descendancy(set(tree.indi), descend)
+    assert fs.metrics.endpoints["descendancy"].requests >= 2
+    assert gedcom(tree) == gedcom(expected)
+
+
+def test_resume(fs, synthetic, tmp_path, monkeypatch):
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-a", "7", "-d", "1"]
+    argv += ["--base-url", fs.base_url, "--no-cache", "--no-save-token"]
+    outfile = str(tmp_path / "out.ged")
+    expected = str(tmp_path / "expected.ged")
+    monkeypatch.setattr(sys, "argv", argv + ["-o", expected])
+    getmyancestors.main()
+
+    # the persons downloaded by each run
+    served = list()
+    persons = synthetic.persons
+    monkeypatch.setattr(
+        synthetic, "persons", lambda fids: served[-1].update(fids) or persons(fids)
+    )
+    add_parents = Tree.add_parents
+
+    def interrupted(tree, fids):
+        if len(tree.indi) > 20:
+            raise KeyboardInterrupt
+        return add_parents(tree, fids)
+
+    served.append(set())
+    monkeypatch.setattr(Tree, "add_parents", interrupted)
+    monkeypatch.setattr(sys, "argv", argv + ["-o", outfile])
+    with pytest.raises(KeyboardInterrupt):
+        getmyancestors.main()
+    assert os.path.exists(outfile + ".checkpoint")
+
+    served.append(set())
+    monkeypatch.setattr(Tree, "add_parents", add_parents)
+    monkeypatch.setattr(sys, "argv", argv + ["-o", outfile, "--resume"])
+    getmyancestors.main()
+    assert not os.path.exists(outfile + ".checkpoint")
+    assert served[0] and served[1] and not served[0] & served[1]
+
+    trees = list()
+    for path in (outfile, expected):
+        with open(path, encoding="utf-8") as file:
+            trees.append(merge([file]))
+    assert len(trees[0].indi) > 100
+    assert gedcom(trees[0]) == gedcom(trees[1])
+
+
+def test_resume_pending(fs, synthetic, tmp_path, monkeypatch):
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-a", "6", "-m"]
+    argv += ["--base-url", fs.base_url, "--no-cache", "--no-save-token"]
+    argv += ["--pipeline", "--checkpoint-interval", "0"]
+    outfile = str(tmp_path / "out.ged")
+    expected = str(tmp_path / "expected.ged")
+    monkeypatch.setattr(sys, "argv", argv + ["-o", expected])
+    getmyancestors.main()
+
+    # interrupted while the memories of a batch are downloaded
+    memories = list()
+    get_url = Tree.get_url
+
+    async def interrupted(tree, url, fail_fast=False, headers=None):
+        if "/memories/" in url:
+            memories.append(url)
+            if len(memories) > 5:
+                raise KeyboardInterrupt
+        return await get_url(tree, url, fail_fast, headers)
+
+    saves = list()
+    save = Checkpoint.save
+
+    def saved(checkpoint, tree):
+        saves.append(checkpoint.phase)
+        save(checkpoint, tree)
+
+    monkeypatch.setattr(Tree, "get_url", interrupted)
+    monkeypatch.setattr(Checkpoint, "save", saved)
+    monkeypatch.setattr(sys, "argv", argv + ["-o", outfile])
+    with pytest.raises(KeyboardInterrupt):
+        getmyancestors.main()
+    # saved as the batches of the pipelined phase are downloaded
+    assert saves.count("ancestors") > 1
+    state = Checkpoint(outfile + ".checkpoint").read(Tree())
+    assert state["pending"] and state["pending"] <= state["indi"].keys()
+
+    monkeypatch.setattr(Tree, "get_url", get_url)
+    monkeypatch.setattr(sys, "argv", argv + ["-o", outfile, "--resume"])
+    getmyancestors.main()
+    trees = list()
+    for path in (outfile, expected):
+        with open(path, encoding="utf-8") as file:
+            trees.append(merge([file]))
+    assert gedcom(trees[0]) == gedcom(trees[1])
+
+
+def test_async_crawl(tmp_path, monkeypatch):
+    synthetic = SyntheticTree(size=150, branching=2)
+    srv = StandInServer(("127.0.0.1", 0), synthetic, redirect_rate=0.1)
+    srv.start()
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-a", "4", "-d", "1"]
+    argv += ["-m", "--get-notes", "--fields", "full,sources"]
+    argv += ["--base-url", srv.url, "--no-cache", "--no-save-token"]
+
+    # the calls of the asyncio HTTP engine
+    calls = collections.Counter()
+
+    def counted(name, method):
+        async def wrapper(*args, **kwargs):
+            res = await method(*args, **kwargs)
+            calls[name if name != "_request" else res.status_code] += 1
+            return res
+
+        return wrapper
+
+    for cls, name in (
+        (Fam, "add_marriage_async"),
+        (Indi, "get_notes_async"),
+        (AsyncSession, "get_url"),
+        (ConnectionPool, "_request"),
+    ):
+        monkeypatch.setattr(cls, name, counted(name, getattr(cls, name)))
+    texts = list()
+    for i, engine in enumerate(("0", "16")):
+        path = str(tmp_path / ("%s.ged" % i))
+        monkeypatch.setattr(sys, "argv", argv + ["--max-in-flight", engine, "-o", path])
+        getmyancestors.main()
+        with open(path, encoding="utf-8") as file:
+            texts.append(file.read())
+    srv.shutdown()
+    srv.server_close()
+
+    assert calls["add_marriage_async"] and calls["get_notes_async"]
+    # the persons, sources, memories, notes and marriages of the tree
+    assert calls["get_url"] > calls["add_marriage_async"] + calls["get_notes_async"]
+    # the merged persons are followed
+    assert calls[301] and calls[200]
+    trees = [merge([io.StringIO(text)]) for text in texts]
+    assert len(trees[0].indi) > 30 and trees[0].sources and trees[0].notes
+    assert gedcom(trees[0]) == gedcom(trees[1])
+
+
+def test_lazy_sets():
+    indi = Indi("AAAA-AAA")
+    assert not hasattr(indi, "__dict__")
+    assert not indi.famc_fid and not hasattr(indi, "_famc_fid")
+    pending = indi.famc_fid
+    indi.fams_fid |= {("AAAA-AAA", "C")}
+    pending.add(("B", "C"))
+    assert indi.famc_fid == {("B", "C")} and indi.famc_fid is pending
+    other = Indi("BBBB-BBB")
+    other.nicknames = indi.nicknames
+    other.nicknames.add("Bob")
+    assert not indi.nicknames and other.nicknames == {"Bob"}
+    indi.aka ^= {"Al"}
+    indi.married.symmetric_difference_update({"Ann"})
+    indi.birthnames -= {"Bo"}
+    indi.birthnames.intersection_update({"Bo"})
+    assert indi.aka == {"Al"} and indi.married == {"Ann"}
+    assert not indi.birthnames and not hasattr(indi, "_birthnames")
+    copy = pickle.loads(pickle.dumps(indi))
+    assert type(copy.famc_fid) is set and copy.famc_fid == indi.famc_fid
+    assert copy.fams_fid == indi.fams_fid and not hasattr(copy, "_facts")
+
+
+def test_graph():
+    graph = Graph()
+    graph.add_trio("F", "M", "C")
+    graph.add_trio("F", "M", "C")
+    graph.add_trio("F", None, "D")
+    graph.add_trio("GF", "GM", "F")
+    graph.add_couple("F", "M", "R1")
+    assert len(graph.trios) == 3 and len(graph.couples) == 1
+    assert list(graph.parents("C")) == [("F", "M")]
+    assert set(graph.children("F")) == {("F", "M", "C"), ("F", None, "D")}
+    assert list(graph.children("M")) == [("F", "M", "C")]
+    assert list(graph.spouses("M")) == [("F", "M", "R1")]
+    assert list(graph.parents("X")) == list(graph.parents(None)) == []
+    assert graph.parent_fids(["C", "D", "F", "X"]) == {"F", "M", "GF", "GM"}
+    restricted = graph.restricted({"D"})
+    assert len(restricted.trios) == 1 and not len(restricted.couples)
+    assert list(restricted.parents("D")) == [("F", None)]
+    copy = pickle.loads(pickle.dumps(graph))
+    assert list(copy.children("F")) == list(graph.children("F"))
+
+
+def test_refresh(tmp_path, monkeypatch):
+    # a tree of its own, edited between the runs
+    synthetic = SyntheticTree(size=600, branching=3, collapse=0.3)
+    srv = StandInServer(("127.0.0.1", 0), synthetic)
+    srv.start()
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-d", "1", "-m"]
+    argv += ["--base-url", srv.url, "--no-save-token"]
+    # the marriages (only) stay fresh in the cache from the first run
+    argv += ["--cache-dir", str(tmp_path / "cache"), "--cache-ttl", "persons=0"]
+    argv += ["descendancy=0", "couple-relationships=3600"]
+    snapshot = str(tmp_path / "tree.snapshot")
+    paths = [str(tmp_path / name) for name in ("old.ged", "new.ged", "expected.ged")]
+    monkeypatch.setattr(
+        sys, "argv", argv + ["-a", "4", "-o", paths[0], "--snapshot", snapshot]
+    )
+    # the parents of an unchanged individual are added after the first run
+    orphan = synthetic.fid(5)
+    persons = synthetic.persons
+
+    def orphaned(fids):
+        data = persons(fids)
+        data["childAndParentsRelationships"] = [
+            rel
+            for rel in data["childAndParentsRelationships"]
+            if rel["child"]["resourceId"] != orphan
+        ]
+        return data
+
+    monkeypatch.setattr(synthetic, "persons", orphaned)
+    getmyancestors.main()
+    monkeypatch.setattr(synthetic, "persons", persons)
+
+    revised = {synthetic.fid(n) for n in (3, 8, 20)}
+    for n in (3, 8, 20):
+        synthetic.revise(n)
+    synthetic.revise_couple(1)
+    served = set()
+    monkeypatch.setattr(
+        synthetic, "persons", lambda fids: served.update(fids) or persons(fids)
+    )
+    check_changes = Tree.check_changes
+    checks = list()
+
+    def checked(tree):
+        fids = set(tree.indi)
+        fams = [key for key, fam in tree.fam.items() if fam.fid]
+        changed = check_changes(tree)
+        # all the persons read in batches
+        checks.append((served == fids, changed))
+        checks.append(set(fams) - tree.unchanged_fam.keys())
+        served.clear()
+        return changed
+
+    monkeypatch.setattr(Tree, "check_changes", checked)
+    monkeypatch.setattr(
+        sys, "argv", argv + ["-a", "5", "-o", paths[1], "--refresh", snapshot]
+    )
+    getmyancestors.main()
+    assert checks[0] == (True, revised)
+    # the marriage changed, and not those answered fresh by the cache
+    assert checks[1] == {(synthetic.fid(1), synthetic.fid(2))}
+    refreshed = served.copy()
+    monkeypatch.setattr(sys, "argv", argv + ["-a", "5", "-o", paths[2]])
+    getmyancestors.main()
+    srv.shutdown()
+    srv.server_close()
+
+    trees = list()
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            trees.append(merge([file]))
+    old, new, expected = trees
+    # the next generation of ancestors, and not again the edited individuals
+    assert refreshed == expected.indi.keys() - old.indi.keys()
+    # the coordinates of a marriage place are known if an individual
+    # downloaded before the marriage has a fact at the same place: those of
+    # the reused marriages are the ones of the first download
+    records = [
+        [(r, [line.split("\n3 MAP")[0] for line in lines]) for r, lines in gedcom(t)]
+        for t in (new, expected, old)
+    ]
+    assert records[0] == records[1]
+    assert records[0] != records[2]
+
+
+def test_store(fs, synthetic, tmp_path, monkeypatch):
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-a", "6", "-d", "1"]
+    argv += ["-m", "--get-notes", "--get-sources", "--base-url", fs.base_url]
+    argv += ["--no-cache", "--no-save-token"]
+    paths = [str(tmp_path / name) for name in ("out.ged", "expected.ged")]
+    store = str(tmp_path / "tree.sqlite")
+    # a small cache to write and load the objects again during the download
+    monkeypatch.setattr(
+        getmyancestors, "SqliteStore", functools.partial(SqliteStore, capacity=20)
+    )
+    monkeypatch.setattr(sys, "argv", argv + ["-o", paths[0], "--store", store])
+    getmyancestors.main()
+    monkeypatch.setattr(sys, "argv", argv + ["-o", paths[1]])
+    getmyancestors.main()
+
+    connection = sqlite3.connect(store)
+    assert connection.execute("SELECT COUNT(*) FROM indi").fetchone()[0] > 100
+    connection.close()
+    trees = list()
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            trees.append(merge([file]))
+    assert gedcom(trees[0]) == gedcom(trees[1])
+
+
+def test_store_table(fs, synthetic):
+    tree = Tree(fs, store=SqliteStore(capacity=10))
+    fids = [synthetic.fid(n) for n in range(50)]
+    tree.add_indis(fids)
+    assert len(tree.indi) == 50 and set(tree.indi) == set(fids)
+    assert len(tree.indi.cache) <= 10 and not tree.indi.pins
+    # a pinned object stays in memory with its changes
+    with pinned(tree.indi, fids[0]) as indi:
+        indi.famc_fid.add(("father", None))
+        for fid in fids[1:]:
+            assert tree.indi[fid].fid == fid
+        assert tree.indi[fids[0]] is indi
+    for fid in fids[1:]:
+        tree.indi[fid]
+    assert fids[0] not in tree.indi.cache
+    assert tree.indi[fids[0]].famc_fid == {("father", None)}
+    # the sources and notes are written once, the individuals reference them
+    data = {"id": "S1", "titles": [{"value": "Wikipedia"}], "notes": [{"text": "N"}]}
+    source = tree.sources["S1"] = Source(data, tree)
+    with pinned(tree.indi, fids[0]) as indi:
+        indi.sources.add((source, None))
+        indi.notes.add(Note("a memory", tree))
+    for fid in fids[1:]:
+        tree.indi[fid]
+    tree.indi.flush()
+    sql = "SELECT data FROM indi WHERE key = ?"
+    (row,), = tree.store.execute(sql, (fids[0],))
+    assert b"Wikipedia" not in row and b"a memory" not in row
+    indi = tree.indi[fids[0]]
+    assert [x for x, _ in indi.sources] == [tree.sources["S1"]]
+    assert [note.text for note in indi.notes] == ["a memory"]
+    (note,) = tree.sources["S1"].notes
+    assert note.text == "N"
+    nums = [indi.num for indi in by_num(tree.indi)]
+    assert nums == sorted(indi.num for indi in tree.indi.values())
+    tree.store.close()
+
+
+def test_store_iteration():
+    # more rows than a chunk and more objects than the cache: the objects
+    # touched while iterating are written again without being met again
+    tree = Tree(store=SqliteStore(capacity=100))
+    fids = ["I%s" % i for i in range(2500)]
+    for fid in fids:
+        tree.indi[fid] = Indi(fid, tree)
+    met = list()
+    for fid in tree.indi:
+        met.append(fid)
+        tree.indi[fid].gender = "F"
+    assert met == fids
+    tree.reset_num()
+    assert all(tree.indi[fid].gender == "F" for fid in fids)
+    tree.store.close()
+
+
+def test_projection(fs, synthetic):
+    projection = Projection.parse("essential,facts=BIRT,marriage=none")
+    assert projection == ESSENTIAL.replace(
+        facts={"http://gedcomx.org/Birth"}, marriage=()
+    )
+    assert Projection.parse(repr(FULL)) == FULL
+    with pytest.raises(ValueError):
+        Projection.parse("essential,facts=BIRTH")
+
+    def requests():
+        endpoints = fs.metrics.to_dict()["endpoints"]
+        return {
+            name: endpoints.get(name, {}).get("requests", 0)
+            for name in ("memories", "couple-relationships")
+        }
+
+    fids = [synthetic.fid(n) for n in range(60)]
+    before = requests()
+    full = Tree(fs)
+    full.add_indis(fids)
+    full.add_spouses(set(fids))
+    assert all(requests()[name] > before[name] for name in before)
+    assert any(fam.facts for fam in full.fam.values())
+    assert full.notes
+
+    before = requests()
+    tree = Tree(fs, projection)
+    tree.add_indis(fids)
+    tree.add_spouses(set(fids))
+    # the memories and marriages are not downloaded
+    assert requests() == before
+    assert tree.indi.keys() == full.indi.keys()
+    assert families(tree) == families(full)
+    assert all(fam.fid and not fam.facts for fam in tree.fam.values())
+    for indi in tree.indi.values():
+        assert {fact.type for fact in indi.facts} == {"http://gedcomx.org/Birth"}
+    assert not tree.notes
+
+
+def test_fast_entry_point(tmp_path, monkeypatch):
+    synthetic = SyntheticTree(size=100, branching=2)
+    fact = synthetic.fact
+
+    def undated(n, kind, year, salt):
+        data = fact(n, kind, year, salt)
+        if kind == "Death" and n % 3 == 0:
+            del data["date"], data["place"]
+        return data
+
+    monkeypatch.setattr(synthetic, "fact", undated)
+    srv = StandInServer(("127.0.0.1", 0), synthetic)
+    srv.start()
+    argv = ["getmyancestors", "-u", "user", "-p", "password", "-a", "5"]
+    argv += ["--base-url", srv.url, "--no-cache", "--no-save-token"]
+    runs = (
+        (getmyancestors_fast.main, []),
+        (getmyancestors_fast.main, ["--get-notes"]),
+        (getmyancestors.main, ["--fields", "essential"]),
+    )
+    texts = list()
+    for i, (main, options) in enumerate(runs):
+        path = str(tmp_path / ("%s.ged" % i))
+        monkeypatch.setattr(sys, "argv", argv + options + ["-o", path])
+        main()
+        with open(path, encoding="utf-8") as file:
+            texts.append(file.read())
+    srv.shutdown()
+    srv.server_close()
+
+    assert "1 SOUR getmyancestors-ultra-fast\n" in texts[0]
+    assert "1 SOUR getmyancestors\n" in texts[2]
+    # a death without date nor place is asserted with Y, as GEDCOM requires
+    assert "1 DEAT Y\n" in texts[0]
+    assert "0 @N" not in texts[0] and "0 @N" in texts[1]
+    trees = [merge([io.StringIO(text)]) for text in texts]
+    assert gedcom(trees[0]) == gedcom(trees[2])